@@ -6,7 +6,7 @@ Main Flask Application
 from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from flask_mail import Mail, Message
+from flask_mail import Mail
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import random
@@ -14,6 +14,7 @@ import string
 import os
 from dotenv import load_dotenv
 from urllib.parse import quote_plus
+from metrics import TimedQueuePool, init_metrics
 # Load environment variables from .env file
 password = "6969Ma@18082004"
 encoded_password = quote_plus(password)
@@ -25,14 +26,46 @@ app.config['SQLALCHEMY_DATABASE_URI'] = f"postgresql://postgres:{encoded_passwor
 app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
     'pool_pre_ping': True,
     'pool_recycle': 300,
+    # QueuePool that also records checkout wait time for /metrics
+    'poolclass': TimedQueuePool,
 }
+# Lock affected product_locations rows (SELECT ... FOR UPDATE) before checking
+# availability, so concurrent workers cannot oversell the same stock.
+app.config['STOCK_ROW_LOCKING'] = os.environ.get('STOCK_ROW_LOCKING', 'true').lower() in ['true', '1', 't']
+# Alert users when a stock posting takes a product below their low-stock threshold
+app.config['LOW_STOCK_ALERTS'] = os.environ.get('LOW_STOCK_ALERTS', 'true').lower() in ['true', '1', 't']
+# Seconds a worker may serve cached dashboard KPIs; local changes invalidate immediately
+app.config['DASHBOARD_CACHE_TTL'] = int(os.environ.get('DASHBOARD_CACHE_TTL', 15))
+# Document numbers reserved per worker at a time; 1 keeps numbering gap-free
+app.config['SEQUENCE_BLOCK_SIZE'] = int(os.environ.get('SEQUENCE_BLOCK_SIZE', 1))
+# Seconds a worker may serve a cached unread-notification count; local changes invalidate immediately
+app.config['UNREAD_COUNT_CACHE_TTL'] = int(os.environ.get('UNREAD_COUNT_CACHE_TTL', 10))
+# Seconds before a notification event stream is closed and the browser reconnects
+app.config['NOTIFICATION_STREAM_SECONDS'] = int(os.environ.get('NOTIFICATION_STREAM_SECONDS', 300))
+# Open event streams allowed per worker; each holds a request thread, so keep
+# this well below the worker's thread count. Further browsers poll instead.
+app.config['NOTIFICATION_STREAMS_PER_WORKER'] = int(os.environ.get('NOTIFICATION_STREAMS_PER_WORKER', 4))
+# Opt-in per-request SQL statement counts and N+1 detection (see sql_profiler.py)
+app.config['SQL_PROFILING'] = os.environ.get('SQL_PROFILING', 'false').lower() in ['true', '1', 't']
+app.config['SQL_PROFILE_BUFFER_SIZE'] = int(os.environ.get('SQL_PROFILE_BUFFER_SIZE', 200))
+app.config['SQL_N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+# Bearer token required to scrape /metrics (unset: open)
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
 app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
 app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
 app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', 'true').lower() in ['true', '1', 't']
 app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', app.config['MAIL_USERNAME'])
+# Outbox retries: first retry after EMAIL_RETRY_BASE_SECONDS, doubling up to
+# EMAIL_RETRY_MAX_SECONDS; a message is marked failed after EMAIL_MAX_ATTEMPTS
+app.config['EMAIL_MAX_ATTEMPTS'] = int(os.environ.get('EMAIL_MAX_ATTEMPTS', 6))
+app.config['EMAIL_RETRY_BASE_SECONDS'] = int(os.environ.get('EMAIL_RETRY_BASE_SECONDS', 30))
+app.config['EMAIL_RETRY_MAX_SECONDS'] = int(os.environ.get('EMAIL_RETRY_MAX_SECONDS', 3600))
+# Days sent and failed messages are kept in the outbox
+app.config['EMAIL_RETENTION_DAYS'] = int(os.environ.get('EMAIL_RETENTION_DAYS', 7))
 db = SQLAlchemy(app)
+init_metrics(app, db)
 # Initialize Flask-Mail
 mail = Mail(app)
 
@@ -42,17 +75,26 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Please log in to access this page.'
 
-def send_email(subject, sender, recipients, text_body, html_body=None):
-    """Helper function to send emails"""
-    msg = Message(subject, sender=sender, recipients=recipients)
-    msg.body = text_body
-    if html_body:
-        msg.html = html_body
+def send_email(subject, sender, recipients, text_body, html_body=None, expires_at=None):
+    """
+    Queue an email for delivery by the background email worker
+
+    The request never talks to the SMTP server; `flask --app app email-worker`
+    sends queued messages (see email_outbox.py). The message is committed on
+    its own, independently of the request's session.
+
+    Args:
+        expires_at: Don't send the message after this time
+
+    Returns:
+        True if the message was queued
+    """
+    from email_outbox import enqueue_email
     try:
-        mail.send(msg)
+        enqueue_email(subject, sender, recipients, text_body, html_body, expires_at=expires_at)
         return True
     except Exception as e:
-        print(f"Error sending email: {e}")
+        print(f"Error queueing email: {e}")
         return False
 
 @login_manager.user_loader
@@ -83,6 +125,10 @@ def init_db():
 # `SKIP_IMPORT_ROUTE=1`.
 if os.environ.get('SKIP_IMPORT_ROUTE', '0') != '1':
     from routes import *
+    import commands
+    if app.config['SQL_PROFILING']:
+        from sql_profiler import init_sql_profiler
+        init_sql_profiler(app)
 
 if __name__ == '__main__':
     init_db()
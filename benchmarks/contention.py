@@ -0,0 +1,155 @@
+"""Contention benchmark: parallel delivery validations against one product/location.
+
+Seeds a product with a fixed amount of stock, creates more ready deliveries than
+that stock can cover, then validates them all in parallel through the Flask test
+client (each thread logs in with its own client, like separate browser sessions).
+Run it against a local PostgreSQL (the database configured in app.py):
+
+    python benchmarks/contention.py --threads 16 --deliveries 200 --stock 100
+    STOCK_ROW_LOCKING=false python benchmarks/contention.py
+
+It reports throughput and two correctness figures:
+  oversold_units  - units delivered beyond the seeded stock
+  lost_updates    - difference between expected and actual final quantity
+Both must be 0.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from app import app, db, init_db
+from models import Warehouse, Location, Product, ProductLocation, Delivery, DeliveryLine
+
+BENCH_SKU = 'BENCH-CONTENTION'
+BENCH_PREFIX = 'BENCH-DEL-'
+
+
+def seed(deliveries, stock, qty):
+    """Create (or reset) the benchmark product, location and ready deliveries"""
+    warehouse = Warehouse.query.filter_by(code='BENCH').first()
+    if not warehouse:
+        warehouse = Warehouse(name='Benchmark Warehouse', code='BENCH')
+        db.session.add(warehouse)
+        db.session.flush()
+        db.session.add(Location(name='Benchmark - Main', warehouse_id=warehouse.id, code='BENCH-MAIN'))
+        db.session.flush()
+    location = Location.query.filter_by(warehouse_id=warehouse.id).first()
+
+    product = Product.query.filter_by(sku=BENCH_SKU).first()
+    if not product:
+        product = Product(name='Contention Benchmark Item', sku=BENCH_SKU)
+        db.session.add(product)
+        db.session.flush()
+
+    # Drop deliveries from previous runs and reset the stock row
+    for old in Delivery.query.filter(Delivery.delivery_number.like(f'{BENCH_PREFIX}%')).all():
+        db.session.delete(old)
+    ProductLocation.query.filter_by(product_id=product.id, location_id=location.id).delete()
+    db.session.add(ProductLocation(product_id=product.id, location_id=location.id, quantity=stock))
+    product.on_hand_total = stock
+    product.refresh_stock_status()
+    db.session.flush()
+
+    ids = []
+    for i in range(deliveries):
+        delivery = Delivery(
+            delivery_number=f'{BENCH_PREFIX}{i:06d}',
+            date=datetime.utcnow(),
+            warehouse_id=warehouse.id,
+            location_id=location.id,
+            state='ready'
+        )
+        db.session.add(delivery)
+        db.session.flush()
+        db.session.add(DeliveryLine(delivery_id=delivery.id, product_id=product.id, quantity=qty))
+        ids.append(delivery.id)
+
+    db.session.commit()
+    return product.id, location.id, ids
+
+
+def run(delivery_ids, threads, email, password):
+    """Validate all deliveries from `threads` concurrent clients; returns latencies"""
+    queue = list(delivery_ids)
+    lock = threading.Lock()
+    latencies = []
+    errors = []
+
+    def worker():
+        client = app.test_client()
+        client.post('/login', data={'email': email, 'password': password})
+        while True:
+            with lock:
+                if not queue:
+                    return
+                delivery_id = queue.pop()
+            start = time.perf_counter()
+            try:
+                client.post(f'/deliveries/{delivery_id}/validate')
+            except Exception as e:  # deadlocks, serialization errors, ...
+                with lock:
+                    errors.append(repr(e))
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--deliveries', type=int, default=200)
+    parser.add_argument('--stock', type=float, default=100.0)
+    parser.add_argument('--qty', type=float, default=1.0)
+    parser.add_argument('--email', default='admin@stockmaster.com')
+    parser.add_argument('--password', default='admin123')
+    args = parser.parse_args()
+
+    init_db()
+    with app.app_context():
+        product_id, location_id, ids = seed(args.deliveries, args.stock, args.qty)
+
+    start = time.perf_counter()
+    latencies, errors = run(ids, args.threads, args.email, args.password)
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        done = Delivery.query.filter(Delivery.id.in_(ids), Delivery.state == 'done').count()
+        final = Product.query.get(product_id).get_stock_by_location(location_id)
+
+    delivered = done * args.qty
+    latencies.sort()
+    report = {
+        'row_locking': app.config['STOCK_ROW_LOCKING'],
+        'threads': args.threads,
+        'validations': len(ids),
+        'succeeded': done,
+        'errors': len(errors),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_per_s': round(len(ids) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2) if latencies else None,
+        'oversold_units': max(0.0, delivered - args.stock),
+        'lost_updates': round(final - (args.stock - delivered), 6),
+        'final_quantity': final,
+    }
+    print(json.dumps(report, indent=2))
+    if errors:
+        print('First error:', errors[0], file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
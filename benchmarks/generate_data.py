@@ -0,0 +1,352 @@
+"""Synthetic inventory data for the benchmark suite.
+
+Seeds the database configured in app.py (use a local, disposable PostgreSQL)
+with products, warehouses/locations, partners, a stock ledger whose running
+balances match product_locations, and notifications for the admin user:
+
+    python benchmarks/generate_data.py --products 10000 --ledger-rows 2000000
+    python benchmarks/generate_data.py --reset --seed 7
+
+The same arguments (and --seed) always produce the same rows. Everything is
+tagged with the BG- prefix (SKUs, warehouse/location codes, partner names,
+ledger references) so --reset can remove a previous run first. Products,
+ledger rows and product_locations are loaded with COPY.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from sqlalchemy import Float, Integer, column, delete, insert, select, text, update, values
+
+from app import app, db, init_db
+from models import (User, Category, Product, Warehouse, Location, ProductLocation, Partner, StockLedger,
+                    Notification, Receipt, ReceiptLine, Delivery, DeliveryLine, Transfer, TransferLine,
+                    Adjustment, PriceHistory, StockSnapshot)
+from stock import stock_status_case
+
+PREFIX = 'BG-'
+COPY_BATCH_SIZE = 100000
+# Ledger dates end here unless --anchor is given, so runs on different days match
+DEFAULT_ANCHOR = datetime(2025, 1, 1)
+
+ADJECTIVES = ['Steel', 'Copper', 'Plastic', 'Heavy', 'Compact', 'Industrial', 'Premium', 'Basic', 'Flexible',
+              'Galvanized', 'Stainless', 'Insulated', 'Reinforced', 'Portable', 'Cordless', 'Digital']
+NOUNS = ['Bolt', 'Nut', 'Washer', 'Bracket', 'Hinge', 'Cable', 'Pipe', 'Valve', 'Switch', 'Bearing', 'Gasket',
+         'Clamp', 'Drill Bit', 'Socket', 'Hose', 'Fuse', 'Relay', 'Sensor', 'Motor', 'Panel']
+SIZES = ['M4', 'M6', 'M8', 'M10', '10mm', '25mm', '50mm', '1/2in', '3/4in', 'Small', 'Medium', 'Large']
+UOMS = ['Unit', 'Box', 'Pack', 'Meter', 'Kg']
+
+# Operation mix of generated ledger rows (transfers are written as an out/in pair)
+OPERATION_WEIGHTS = [('receipt', 30), ('delivery', 45), ('transfer', 15), ('adjustment', 10)]
+
+
+def _copy(table, columns, rows):
+    """COPY an iterable of row tuples into `table` on the session's connection, in batches"""
+    cursor = db.session.connection().connection.cursor()
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    count = 0
+    try:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= COPY_BATCH_SIZE:
+                count += _copy_batch(cursor, sql, batch)
+                batch = []
+        if batch:
+            count += _copy_batch(cursor, sql, batch)
+    finally:
+        cursor.close()
+    return count
+
+
+def _copy_batch(cursor, sql, batch):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(batch)
+    buffer.seek(0)
+    cursor.copy_expert(sql, buffer)
+    return len(batch)
+
+
+def generated_product_ids():
+    return select(Product.id).where(Product.sku.like(f'{PREFIX}%')).scalar_subquery()
+
+
+def reset():
+    """Delete everything a previous run generated, including documents the suite created for it"""
+    products = generated_product_ids()
+    line_documents = [
+        (ReceiptLine, ReceiptLine.receipt_id, Receipt),
+        (DeliveryLine, DeliveryLine.delivery_id, Delivery),
+        (TransferLine, TransferLine.transfer_id, Transfer),
+    ]
+    for line_model, fk, document in line_documents:
+        document_ids = db.session.execute(
+            select(fk).where(line_model.product_id.in_(products)).distinct()
+        ).scalars().all()
+        if document_ids:
+            db.session.execute(delete(line_model).where(fk.in_(document_ids)))
+            db.session.execute(delete(document).where(document.id.in_(document_ids)))
+    for model in (Adjustment, StockLedger, ProductLocation, StockSnapshot, PriceHistory):
+        db.session.execute(delete(model).where(model.product_id.in_(products)))
+    db.session.execute(delete(Notification).where(Notification.title.like(f'{PREFIX}%')))
+    db.session.execute(delete(Product).where(Product.sku.like(f'{PREFIX}%')))
+    db.session.execute(delete(Category).where(Category.name.like(f'{PREFIX}%')))
+    db.session.execute(delete(Partner).where(Partner.name.like(f'{PREFIX}%')))
+    locations = select(Location.id).where(Location.code.like(f'{PREFIX}%')).scalar_subquery()
+    db.session.execute(delete(Location).where(Location.id.in_(locations)))
+    db.session.execute(delete(Warehouse).where(Warehouse.code.like(f'{PREFIX}%')))
+    db.session.commit()
+
+
+def generate_catalog(rng, products, categories, now):
+    """Categories and products; returns {product_id: min_stock}"""
+    db.session.execute(insert(Category), [
+        {'name': f'{PREFIX}Category {i:03d}', 'description': 'Benchmark category', 'created_at': now}
+        for i in range(categories)
+    ])
+    category_ids = db.session.execute(
+        select(Category.id).where(Category.name.like(f'{PREFIX}%')).order_by(Category.id)
+    ).scalars().all()
+
+    def rows():
+        for i in range(products):
+            cost = round(rng.uniform(5, 5000), 2)
+            yield (
+                f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {rng.choice(SIZES)} #{i}',
+                f'{PREFIX}{i:07d}',
+                rng.choice(category_ids),
+                rng.choice(UOMS),
+                rng.choice([0, 10, 20, 50, 100]),
+                500,
+                100,
+                cost,
+                round(cost * rng.uniform(1.1, 1.8), 2),
+                'INR',
+                0.0,
+                'out',
+                True,
+                now.isoformat(),
+            )
+
+    _copy('products', ['name', 'sku', 'category_id', 'uom', 'min_stock', 'max_stock', 'reorder_qty',
+                       'cost_price', 'sale_price', 'currency', 'on_hand_total', 'stock_status', 'active',
+                       'created_at'], rows())
+    return dict(db.session.execute(
+        select(Product.id, Product.min_stock).where(Product.sku.like(f'{PREFIX}%')).order_by(Product.id)
+    ).all())
+
+
+def generate_sites(warehouses, locations_per_warehouse, partners, now):
+    """Warehouses, locations and partners; returns (location ids, supplier ids, customer ids)"""
+    db.session.execute(insert(Warehouse), [
+        {'name': f'{PREFIX}Warehouse {w:02d}', 'code': f'{PREFIX}W{w:02d}', 'city': 'Benchmark',
+         'active': True, 'created_at': now}
+        for w in range(warehouses)
+    ])
+    warehouse_ids = db.session.execute(
+        select(Warehouse.id).where(Warehouse.code.like(f'{PREFIX}%')).order_by(Warehouse.id)
+    ).scalars().all()
+    db.session.execute(insert(Location), [
+        {'name': f'Bin {l:03d}', 'warehouse_id': warehouse_id, 'code': f'{PREFIX}W{w:02d}-L{l:03d}',
+         'active': True, 'created_at': now}
+        for w, warehouse_id in enumerate(warehouse_ids) for l in range(locations_per_warehouse)
+    ])
+    db.session.execute(insert(Partner), [
+        {'name': f'{PREFIX}Partner {p:05d}', 'type': 'supplier' if p % 2 == 0 else 'customer',
+         'email': f'partner{p}@example.com', 'active': True, 'created_at': now}
+        for p in range(partners)
+    ])
+    location_ids = db.session.execute(
+        select(Location.id).where(Location.code.like(f'{PREFIX}%')).order_by(Location.id)
+    ).scalars().all()
+    partner_rows = db.session.execute(
+        select(Partner.id, Partner.type).where(Partner.name.like(f'{PREFIX}%')).order_by(Partner.id)
+    ).all()
+    suppliers = [p.id for p in partner_rows if p.type == 'supplier']
+    customers = [p.id for p in partner_rows if p.type == 'customer']
+    return location_ids, suppliers, customers
+
+
+def generate_ledger(rng, product_ids, location_ids, suppliers, customers, user_id, ledger_rows,
+                    locations_per_product, days, anchor):
+    """
+    COPY `ledger_rows` ledger rows in date order with correct running balances
+
+    Returns:
+        {(product_id, location_id): final balance}
+    """
+    stocked = {
+        product_id: rng.sample(location_ids, min(locations_per_product, len(location_ids)))
+        for product_id in product_ids
+    }
+    balances = {}
+    operations = [name for name, _weight in OPERATION_WEIGHTS]
+    weights = [weight for _name, weight in OPERATION_WEIGHTS]
+    start = anchor - timedelta(days=days)
+    step = timedelta(days=days) / max(ledger_rows, 1)
+
+    def rows():
+        written = 0
+        sequence = 0
+        while written < ledger_rows:
+            sequence += 1
+            product_id = rng.choice(product_ids)
+            location_id = rng.choice(stocked[product_id])
+            key = (product_id, location_id)
+            balance = balances.get(key, 0.0)
+            operation = rng.choices(operations, weights)[0]
+            quantity = float(rng.randint(1, 50))
+            date = (start + step * written).isoformat()
+            reference = f'{PREFIX}{sequence:09d}'
+
+            if operation in ('delivery', 'transfer') and balance < quantity:
+                operation = 'receipt'
+            if operation == 'transfer' and written + 2 <= ledger_rows:
+                destination = rng.choice(location_ids)
+                if destination != location_id:
+                    balances[key] = balance - quantity
+                    yield (date, product_id, location_id, 'transfer_out', reference, 0.0, quantity,
+                           balances[key], '', 'Transfer out', user_id)
+                    other = (product_id, destination)
+                    balances[other] = balances.get(other, 0.0) + quantity
+                    yield (date, product_id, destination, 'transfer_in', reference, quantity, 0.0,
+                           balances[other], '', 'Transfer in', user_id)
+                    written += 2
+                    continue
+                operation = 'receipt'
+            elif operation == 'transfer':
+                operation = 'receipt'
+
+            if operation == 'receipt':
+                balances[key] = balance + quantity
+                row = (quantity, 0.0, rng.choice(suppliers) if suppliers else '')
+            elif operation == 'delivery':
+                balances[key] = balance - quantity
+                row = (0.0, quantity, rng.choice(customers) if customers else '')
+            else:
+                change = float(rng.randint(-min(int(balance), 5), 5))
+                balances[key] = balance + change
+                row = (max(change, 0.0), max(-change, 0.0), '')
+            yield (date, product_id, location_id, operation, reference, row[0], row[1], balances[key],
+                   row[2], 'Generated', user_id)
+            written += 1
+
+    _copy('stock_ledger', ['date', 'product_id', 'location_id', 'operation_type', 'reference', 'quantity_in',
+                           'quantity_out', 'balance', 'partner_id', 'notes', 'user_id'], rows())
+    return balances
+
+
+def store_balances(balances, warehouse_by_location, now):
+    """product_locations from the final ledger balances, then products.on_hand_total/stock_status"""
+    _copy('product_locations', ['product_id', 'location_id', 'quantity', 'warehouse_id', 'updated_at'], (
+        (product_id, location_id, quantity, warehouse_by_location[location_id], now.isoformat())
+        for (product_id, location_id), quantity in sorted(balances.items())
+    ))
+
+    totals = {}
+    for (product_id, _location_id), quantity in balances.items():
+        totals[product_id] = totals.get(product_id, 0.0) + quantity
+    products = Product.__table__
+    for start in range(0, len(totals), 10000):
+        chunk = sorted(totals.items())[start:start + 10000]
+        v = values(column('product_id', Integer), column('total', Float), name='v').data(chunk)
+        db.session.execute(
+            update(products).where(products.c.id == v.c.product_id)
+            .values(on_hand_total=v.c.total, stock_status=stock_status_case(v.c.total, products.c.min_stock))
+        )
+
+
+def generate_notifications(rng, user_id, count, product_ids):
+    """Mixed read/unread, unexpired notifications for the admin user"""
+    now = datetime.utcnow()
+    rows = []
+    for i in range(count):
+        created = now - timedelta(minutes=rng.randint(0, 29 * 24 * 60))
+        product_id = rng.choice(product_ids)
+        rows.append({
+            'user_id': user_id,
+            'title': f'{PREFIX}Low Stock Alert #{i}',
+            'message': f'Generated notification for product {product_id}',
+            'notification_type': rng.choice(['low_stock', 'operation_completed', 'alert']),
+            'is_read': rng.random() < 0.7,
+            'related_model': 'product',
+            'related_id': product_id,
+            'created_at': created,
+            'expires_at': created + timedelta(days=30),
+        })
+    for start in range(0, len(rows), 5000):
+        db.session.execute(insert(Notification), rows[start:start + 5000])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--categories', type=int, default=50)
+    parser.add_argument('--warehouses', type=int, default=5)
+    parser.add_argument('--locations', type=int, default=20, help='Locations per warehouse')
+    parser.add_argument('--locations-per-product', type=int, default=3)
+    parser.add_argument('--partners', type=int, default=500)
+    parser.add_argument('--ledger-rows', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=730, help='Ledger history length')
+    parser.add_argument('--anchor', type=datetime.fromisoformat, default=DEFAULT_ANCHOR,
+                        help='Date of the newest ledger row (YYYY-MM-DD)')
+    parser.add_argument('--notifications', type=int, default=2000, help='Notifications for the admin user')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true', help='Remove previously generated data first')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    init_db()
+    with app.app_context():
+        if args.reset:
+            reset()
+        elif db.session.execute(select(Product.id).where(Product.sku.like(f'{PREFIX}%')).limit(1)).first():
+            sys.exit('Generated data already present; run with --reset to replace it')
+
+        admin = User.query.filter_by(email='admin@stockmaster.com').first()
+        now = datetime.utcnow()
+
+        min_stock = generate_catalog(rng, args.products, args.categories, now)
+        location_ids, suppliers, customers = generate_sites(args.warehouses, args.locations, args.partners, now)
+        warehouse_by_location = dict(db.session.execute(
+            select(Location.id, Location.warehouse_id).where(Location.id.in_(location_ids))
+        ).all())
+        balances = generate_ledger(rng, list(min_stock), location_ids, suppliers, customers, admin.id,
+                                   args.ledger_rows, args.locations_per_product, args.days, args.anchor)
+        store_balances(balances, warehouse_by_location, now)
+        generate_notifications(rng, admin.id, args.notifications, list(min_stock))
+        db.session.commit()
+
+        from notification_counts import recompute_unread_counts
+        recompute_unread_counts([admin.id])
+
+        # Fresh statistics so the planner sees the new row counts
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            for table in ('products', 'product_locations', 'stock_ledger', 'notifications', 'locations', 'partners'):
+                conn.execute(text(f'ANALYZE {table}'))
+
+    print(json.dumps({
+        'seed': args.seed,
+        'products': len(min_stock),
+        'locations': len(location_ids),
+        'partners': len(suppliers) + len(customers),
+        'ledger_rows': args.ledger_rows,
+        'stock_rows': len(balances),
+        'notifications': args.notifications,
+        'elapsed_s': round(time.perf_counter() - started, 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
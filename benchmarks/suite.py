@@ -0,0 +1,335 @@
+"""Endpoint benchmark suite: latency percentiles and SQL query counts for the hot routes.
+
+Seed data first with benchmarks/generate_data.py, then run against the same
+local PostgreSQL:
+
+    python benchmarks/suite.py --iterations 50 -o before.json
+    python benchmarks/suite.py --iterations 50 -o after.json --baseline before.json
+
+Every scenario is requested through the Flask test client as the admin user,
+after --warmup untimed requests. Query counts come from the SQL profiler
+(sql_profiler.py). Validate scenarios post freshly created ready documents
+for the generated (BG-) products, one per request.
+
+With --baseline, a scenario regresses when its p50 or p95 latency grows by
+more than --tolerance (and by at least --min-delta-ms), or when it runs more
+queries than before. Regressions are listed in the JSON output and make the
+script exit with status 1.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from sqlalchemy import func, select
+
+from app import app, db, init_db
+from models import (User, Product, Location, ProductLocation, Partner, StockLedger, Notification,
+                    Receipt, ReceiptLine, Delivery, DeliveryLine, Transfer, TransferLine, Adjustment)
+from sequences import reserve_document_numbers
+from sql_profiler import init_sql_profiler, recent_profiles
+
+PREFIX = 'BG-'
+PERCENTILES = (50, 90, 95, 99)
+LINES_PER_DOCUMENT = 5
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-p * len(sorted_values) // 100))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _stocked_rows(count):
+    """
+    Best-stocked generated product rows at one location
+
+    Deliveries, transfers and adjustments draw on them; the location is the
+    one holding the single largest generated quantity.
+    """
+    top = (select(ProductLocation.location_id)
+           .join(Product, Product.id == ProductLocation.product_id)
+           .where(Product.sku.like(f'{PREFIX}%'))
+           .order_by(ProductLocation.quantity.desc())
+           .limit(1)
+           .scalar_subquery())
+    return db.session.execute(
+        select(ProductLocation.product_id, ProductLocation.location_id, ProductLocation.quantity,
+               Location.warehouse_id)
+        .join(Location, Location.id == ProductLocation.location_id)
+        .join(Product, Product.id == ProductLocation.product_id)
+        .where(Product.sku.like(f'{PREFIX}%'), ProductLocation.location_id == top)
+        .order_by(ProductLocation.quantity.desc())
+        .limit(count)
+    ).all()
+
+
+def prepare_documents(count, user_id):
+    """
+    Create `count` ready receipts, deliveries and transfers and draft adjustments
+
+    Every document uses the same generated location and quantity 1 per line,
+    so each validation succeeds as long as the stock generated there covers
+    `count` deliveries and transfers.
+
+    Returns:
+        Dict mapping scenario name to a list of document ids
+    """
+    rows = _stocked_rows(LINES_PER_DOCUMENT)
+    if not rows:
+        sys.exit('No generated stock found; run benchmarks/generate_data.py first')
+    anchor = rows[0]
+    partner_ids = dict(db.session.execute(
+        select(Partner.type, func.min(Partner.id)).where(Partner.name.like(f'{PREFIX}%')).group_by(Partner.type)
+    ).all())
+    destination_id = db.session.execute(
+        select(Location.id).where(Location.code.like(f'{PREFIX}%'), Location.id != anchor.location_id).limit(1)
+    ).scalar()
+    now = datetime.utcnow()
+    documents = {'receipt_validate': [], 'delivery_validate': [], 'transfer_validate': [], 'adjustment_validate': []}
+
+    for number in reserve_document_numbers('REC', Receipt, count):
+        receipt = Receipt(receipt_number=number, date=now, supplier_id=partner_ids.get('supplier'),
+                          warehouse_id=anchor.warehouse_id, location_id=anchor.location_id, state='ready',
+                          notes='Benchmark', user_id=user_id)
+        receipt.lines = [ReceiptLine(product_id=r.product_id, quantity=1.0, received_qty=0.0) for r in rows]
+        documents['receipt_validate'].append(receipt)
+
+    for number in reserve_document_numbers('DEL', Delivery, count):
+        delivery = Delivery(delivery_number=number, date=now, customer_id=partner_ids.get('customer'),
+                            warehouse_id=anchor.warehouse_id, location_id=anchor.location_id, state='ready',
+                            notes='Benchmark', user_id=user_id)
+        delivery.lines = [DeliveryLine(product_id=r.product_id, quantity=1.0) for r in rows]
+        documents['delivery_validate'].append(delivery)
+
+    if destination_id is not None:
+        for number in reserve_document_numbers('TRF', Transfer, count):
+            transfer = Transfer(transfer_number=number, date=now, source_location_id=anchor.location_id,
+                                destination_location_id=destination_id, state='ready', notes='Benchmark',
+                                user_id=user_id)
+            transfer.lines = [TransferLine(product_id=r.product_id, quantity=1.0) for r in rows]
+            documents['transfer_validate'].append(transfer)
+
+    for number in reserve_document_numbers('ADJ', Adjustment, count):
+        documents['adjustment_validate'].append(Adjustment(
+            adjustment_number=number, date=now, product_id=anchor.product_id, location_id=anchor.location_id,
+            recorded_qty=anchor.quantity, counted_qty=anchor.quantity + 1, difference=1.0, reason='Benchmark',
+            state='draft', user_id=user_id,
+        ))
+
+    for docs in documents.values():
+        db.session.add_all(docs)
+    db.session.commit()
+    return {name: [document.id for document in docs] for name, docs in documents.items()}
+
+
+def build_scenarios(documents):
+    """(name, method, path or path factory taking the iteration number) for every timed scenario"""
+    product = db.session.execute(
+        select(Product.id, Product.name, Product.sku).where(Product.sku.like(f'{PREFIX}%')).order_by(Product.id)
+    ).first()
+    if product is None:
+        sys.exit('No generated products found; run benchmarks/generate_data.py first')
+    word = product.name.split()[1].lower()
+    location_id = db.session.execute(
+        select(StockLedger.location_id).where(StockLedger.product_id == product.id).limit(1)
+    ).scalar()
+
+    scenarios = [
+        ('dashboard', 'GET', '/dashboard'),
+        ('products_list', 'GET', '/products'),
+        ('products_list_page_5', 'GET', '/products?page=5'),
+        ('products_sorted_by_stock', 'GET', '/products?sort=-stock'),
+        ('products_low_stock', 'GET', '/products?low_stock=1'),
+        ('products_search_page', 'GET', f'/products?search={word}'),
+        ('api_products', 'GET', '/api/products?per_page=100'),
+        ('product_typeahead', 'GET', f'/api/products/search?q={word}&limit=10'),
+        ('product_typeahead_sku', 'GET', f'/api/products/search?q={product.sku[:6]}&limit=10'),
+        ('ledger', 'GET', '/ledger'),
+        ('ledger_product', 'GET', f'/ledger?product_id={product.id}'),
+        ('api_ledger', 'GET', '/api/ledger'),
+        ('api_ledger_product_location', 'GET', f'/api/ledger?product_id={product.id}&location_id={location_id}'),
+        ('receipts_list', 'GET', '/receipts'),
+        ('deliveries_list', 'GET', '/deliveries'),
+        ('transfers_list', 'GET', '/transfers'),
+        ('notifications_page', 'GET', '/notifications'),
+        ('notifications_unread_count', 'GET', '/api/notifications/unread-count'),
+        ('notifications_recent', 'GET', '/api/notifications/recent'),
+    ]
+    routes = {
+        'receipt_validate': '/receipts/{}/validate',
+        'delivery_validate': '/deliveries/{}/validate',
+        'transfer_validate': '/transfers/{}/validate',
+        'adjustment_validate': '/adjustments/{}/validate',
+    }
+    for name, route in routes.items():
+        ids = documents[name]
+        if not ids:
+            continue
+        scenarios.append((name, 'POST', lambda i, ids=ids, route=route: route.format(ids[i])))
+    return scenarios
+
+
+def run_scenario(client, method, path, iterations, warmup):
+    """Time `iterations` requests after `warmup` untimed ones; returns the scenario's statistics"""
+    latencies = []
+    queries = []
+    statuses = {}
+    for i in range(warmup + iterations):
+        url = path(i) if callable(path) else path
+        start = time.perf_counter()
+        response = client.open(url, method=method)
+        elapsed = time.perf_counter() - start
+        response.close()
+        if i < warmup:
+            continue
+        latencies.append(elapsed * 1000)
+        profile = recent_profiles(limit=1)
+        queries.append(profile[0]['statements'] if profile else 0)
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    latencies.sort()
+    result = {
+        'requests': len(latencies),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'min_ms': round(latencies[0], 2),
+        'max_ms': round(latencies[-1], 2),
+        'queries_mean': round(sum(queries) / len(queries), 1),
+        'queries_max': max(queries),
+        'statuses': statuses,
+    }
+    for p in PERCENTILES:
+        result[f'p{p}_ms'] = round(percentile(latencies, p), 2)
+    return result
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Per-scenario changes against a previous run's results; returns (comparison, regressions)"""
+    comparison = {}
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        reasons = []
+        for key in ('p50_ms', 'p95_ms'):
+            delta = current[key] - before[key]
+            if delta > before[key] * tolerance and delta >= min_delta_ms:
+                reasons.append(f'{key} {before[key]} -> {current[key]}')
+        if current['queries_max'] > before['queries_max']:
+            reasons.append(f"queries_max {before['queries_max']} -> {current['queries_max']}")
+        comparison[name] = {
+            'p50_change': round(current['p50_ms'] / before['p50_ms'] - 1, 3) if before['p50_ms'] else None,
+            'p95_change': round(current['p95_ms'] / before['p95_ms'] - 1, 3) if before['p95_ms'] else None,
+            'queries_change': current['queries_max'] - before['queries_max'],
+            'regressed': bool(reasons),
+            'reasons': reasons,
+        }
+        if reasons:
+            regressions.append(name)
+    return comparison, regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def data_sizes():
+    counts = {}
+    for name, model in (('products', Product), ('stock_rows', ProductLocation), ('ledger_rows', StockLedger),
+                        ('notifications', Notification)):
+        counts[name] = db.session.execute(select(func.count()).select_from(model)).scalar()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50, help='Timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per scenario first')
+    parser.add_argument('--only', action='append', help='Run only this scenario (repeatable)')
+    parser.add_argument('--cold', action='store_true',
+                        help='Disable the dashboard KPI and unread-count caches')
+    parser.add_argument('--email', default='admin@stockmaster.com')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('-o', '--output', help='Write the JSON report here (default: stdout)')
+    parser.add_argument('--baseline', help='Previous JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative latency growth')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='Ignore latency growth below this')
+    args = parser.parse_args()
+
+    if args.cold:
+        app.config['DASHBOARD_CACHE_TTL'] = 0
+        app.config['UNREAD_COUNT_CACHE_TTL'] = 0
+    init_db()
+    init_sql_profiler(app)
+
+    with app.app_context():
+        user = User.query.filter_by(email=args.email).first()
+        if user is None:
+            sys.exit(f'No user {args.email}')
+        documents = prepare_documents(args.warmup + args.iterations, user.id)
+        scenarios = build_scenarios(documents)
+        sizes = data_sizes()
+
+    client = app.test_client()
+    client.post('/login', data={'email': args.email, 'password': args.password})
+
+    results = {}
+    for name, method, path in scenarios:
+        if args.only and name not in args.only:
+            continue
+        results[name] = run_scenario(client, method, path, args.iterations, args.warmup)
+        print(f"{name:32} p50 {results[name]['p50_ms']:8.2f} ms  p95 {results[name]['p95_ms']:8.2f} ms  "
+              f"queries {results[name]['queries_max']}", file=sys.stderr)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'cold_caches': args.cold,
+            'stock_row_locking': app.config['STOCK_ROW_LOCKING'],
+            'low_stock_alerts': app.config['LOW_STOCK_ALERTS'],
+            'data': sizes,
+        },
+        'results': results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['baseline'] = baseline.get('meta')
+        report['comparison'], regressions = compare(results, baseline.get('results', {}),
+                                                    args.tolerance, args.min_delta_ms)
+        report['regressions'] = regressions
+        for name in regressions:
+            print(f"REGRESSION {name}: {'; '.join(report['comparison'][name]['reasons'])}", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+"""
+StockMaster Bulk Document Import
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from sqlalchemy import insert, select
+
+from app import db
+from models import (Product, Location, Partner, Receipt, ReceiptLine, Delivery, DeliveryLine,
+                    Transfer, TransferLine)
+from kpi import invalidate_kpis
+from sequences import reserve_document_numbers
+
+# Lines are sent to COPY in batches of this many rows
+IMPORT_BATCH_SIZE = 5000
+# Only the first errors are returned; error_count has the total
+MAX_REPORTED_ERRORS = 1000
+
+IMPORT_FORMATS = ('csv', 'json')
+
+# One import row is one document line. Rows sharing a `reference` (e.g. the
+# supplier's ASN number) become one draft document; its header fields come
+# from the first valid row of the group, and later rows may leave them blank.
+IMPORT_KINDS = {
+    'receipts': {
+        'model': Receipt, 'line_model': ReceiptLine, 'prefix': 'REC', 'parent_fk': 'receipt_id',
+        'locations': ('location',), 'partner_field': 'supplier_id', 'partner_type': 'supplier',
+        'line_defaults': {'received_qty': 0.0},
+    },
+    'deliveries': {
+        'model': Delivery, 'line_model': DeliveryLine, 'prefix': 'DEL', 'parent_fk': 'delivery_id',
+        'locations': ('location',), 'partner_field': 'customer_id', 'partner_type': 'customer',
+        'line_defaults': {'picked_qty': 0.0, 'packed_qty': 0.0},
+    },
+    'transfers': {
+        'model': Transfer, 'line_model': TransferLine, 'prefix': 'TRF', 'parent_fk': 'transfer_id',
+        'locations': ('source_location', 'destination_location'), 'partner_field': None, 'partner_type': None,
+        'line_defaults': {},
+    },
+}
+
+
+class RowError(ValueError):
+    """A single import row is invalid; the row is skipped"""
+
+
+def parse_rows(stream, fmt):
+    """
+    Read import rows from a text stream
+
+    CSV needs a header line; JSON is a list of row objects (or {"rows": [...]}).
+
+    Returns:
+        List of dicts with stripped string values
+    """
+    if fmt == 'csv':
+        rows = list(csv.DictReader(stream))
+    elif fmt == 'json':
+        try:
+            data = json.load(stream)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Invalid JSON: {e}')
+        rows = data.get('rows') if isinstance(data, dict) else data
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError('JSON imports must be a list of row objects')
+    else:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+    return [{key.strip().lower(): str(value).strip() if value is not None else ''
+             for key, value in row.items() if key} for row in rows]
+
+
+def parse_request_rows(request):
+    """
+    Read import rows from an API request
+
+    The file is the multipart `file` upload, or else the request body. The
+    format comes from ?format=, else from a .json filename or a JSON content
+    type, else CSV.
+
+    Returns:
+        List of dicts, as parse_rows()
+    """
+    upload = request.files.get('file')
+    fmt = request.args.get('format')
+    if not fmt:
+        filename = upload.filename if upload else ''
+        fmt = 'json' if filename.lower().endswith('.json') or request.is_json else 'csv'
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig') if upload else io.StringIO(request.get_data(as_text=True))
+    try:
+        return parse_rows(stream, fmt)
+    except csv.Error as e:
+        raise ValueError(f'Invalid CSV: {e}')
+
+
+def _split_refs(values):
+    """Split id-or-name references into (ids, names)"""
+    ids = {int(v) for v in values if v.isdigit()}
+    names = {v for v in values if v and not v.isdigit()}
+    return ids, names
+
+
+def _lookup_products(rows):
+    """sku -> (id, active) for every SKU in the file, in one query"""
+    skus = list({row.get('sku', '') for row in rows} - {''})
+    if not skus:
+        return {}
+    result = db.session.execute(select(Product.sku, Product.id, Product.active).where(Product.sku.in_(skus)))
+    return {r.sku: (r.id, r.active) for r in result}
+
+
+def _lookup_locations(rows, fields):
+    """Location ids and codes used in the file -> list of (id, warehouse_id), in one query"""
+    ids, codes = _split_refs({row.get(field, '') for row in rows for field in fields})
+    if not ids and not codes:
+        return {}
+    result = db.session.execute(
+        select(Location.id, Location.code, Location.warehouse_id)
+        .where(Location.active == True, Location.id.in_(ids) | Location.code.in_(codes))
+    )
+    found = {}
+    for r in result:
+        if r.id in ids:
+            found.setdefault(str(r.id), []).append((r.id, r.warehouse_id))
+        if r.code in codes:
+            found.setdefault(r.code, []).append((r.id, r.warehouse_id))
+    return found
+
+
+def _lookup_partners(rows, partner_type):
+    """Partner ids and names used in the file -> list of ids, in one query"""
+    ids, names = _split_refs({row.get('partner', '') for row in rows})
+    if not ids and not names:
+        return {}
+    result = db.session.execute(
+        select(Partner.id, Partner.name)
+        .where(Partner.active == True, Partner.type == partner_type, Partner.id.in_(ids) | Partner.name.in_(names))
+    )
+    found = {}
+    for r in result:
+        if r.id in ids:
+            found.setdefault(str(r.id), []).append(r.id)
+        if r.name in names:
+            found.setdefault(r.name, []).append(r.id)
+    return found
+
+
+def _resolve_one(found, value, label):
+    matches = found.get(value)
+    if not matches:
+        raise RowError(f'Unknown {label}: {value}')
+    if len(matches) > 1:
+        raise RowError(f'Ambiguous {label}: {value} (use the id)')
+    return matches[0]
+
+
+def _parse_row(row, kind, products, locations, partners):
+    """Validate one row; returns (reference, header, product_id, quantity) or raises RowError"""
+    reference = row.get('reference', '')
+    if not reference:
+        raise RowError('Missing reference')
+
+    sku = row.get('sku', '')
+    if not sku:
+        raise RowError('Missing sku')
+    if sku not in products:
+        raise RowError(f'Unknown SKU: {sku}')
+    product_id, active = products[sku]
+    if not active:
+        raise RowError(f'Product {sku} is inactive')
+
+    try:
+        quantity = float(row.get('quantity', ''))
+    except ValueError:
+        raise RowError(f"Invalid quantity: {row.get('quantity', '')!r}")
+    if not quantity > 0:
+        raise RowError('Quantity must be positive')
+
+    try:
+        date = datetime.fromisoformat(row['date']) if row.get('date') else None
+    except ValueError:
+        raise RowError(f"Invalid date: {row['date']!r}")
+
+    header = {'date': date, 'notes': row.get('notes') or f'Imported ({reference})'}
+    if kind['partner_field']:
+        location_id, warehouse_id = _resolve_one(locations, row.get('location', ''), 'location')
+        header.update(location_id=location_id, warehouse_id=warehouse_id)
+        header[kind['partner_field']] = (
+            _resolve_one(partners, row['partner'], kind['partner_type']) if row.get('partner') else None
+        )
+    else:
+        source_id, _ = _resolve_one(locations, row.get('source_location', ''), 'source location')
+        destination_id, _ = _resolve_one(locations, row.get('destination_location', ''), 'destination location')
+        if source_id == destination_id:
+            raise RowError('Source and destination locations must differ')
+        header.update(source_location_id=source_id, destination_location_id=destination_id)
+
+    return reference, header, product_id, quantity
+
+
+def _copy_lines(line_model, rows, batch_size):
+    """
+    Load line rows with PostgreSQL COPY on the session's connection
+
+    Falls back to a multi-row INSERT when the driver has no copy_expert.
+    """
+    table = line_model.__table__
+    columns = list(rows[0])
+    cursor = db.session.connection().connection.cursor()
+    try:
+        if not hasattr(cursor, 'copy_expert'):
+            db.session.execute(insert(line_model), rows)
+            return
+        sql = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+        for start in range(0, len(rows), batch_size):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerows([row[c] for c in columns] for row in rows[start:start + batch_size])
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+
+
+def import_documents(kind_name, rows, user_id=None, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Create draft receipts, deliveries or transfers from import rows
+
+    SKUs, locations and partners are each resolved with one query for the
+    whole file, documents are inserted with one multi-row INSERT and their
+    lines are loaded with COPY, all in a single transaction. Invalid rows are
+    skipped and reported; they do not reject the rest of the file.
+
+    Args:
+        kind_name: 'receipts', 'deliveries' or 'transfers'
+        rows: Row dicts, e.g. from parse_rows()
+        user_id: Owner of the created documents
+
+    Returns:
+        Dict with created documents, line count and per-row errors
+        (row numbers are 1-based data rows, not counting a CSV header)
+    """
+    if kind_name not in IMPORT_KINDS:
+        raise ValueError(f'Unknown import type: {kind_name}')
+    kind = IMPORT_KINDS[kind_name]
+
+    products = _lookup_products(rows)
+    locations = _lookup_locations(rows, kind['locations'])
+    partners = _lookup_partners(rows, kind['partner_type']) if kind['partner_type'] else {}
+
+    documents = {}  # reference -> {'header': ..., 'lines': [(product_id, quantity)], 'locations': {...}}
+    errors = []
+    for row_number, row in enumerate(rows, 1):
+        try:
+            # Blank header fields on later rows inherit the document's values:
+            # locations from the group's first valid row, partner/date/notes
+            # by being left out of the comparison below
+            document = documents.get(row.get('reference', ''))
+            if document:
+                row = dict(row, **{field: value for field, value in document['locations'].items()
+                                   if not row.get(field)})
+            reference, header, product_id, quantity = _parse_row(row, kind, products, locations, partners)
+            document = documents.setdefault(reference, {
+                'header': header, 'lines': [],
+                'locations': {field: row.get(field, '') for field in kind['locations']},
+            })
+            if any(header[key] is not None and header[key] != document['header'][key]
+                   for key in header if key not in ('date', 'notes')):
+                raise RowError(f'Header fields differ from earlier rows of {reference}')
+            document['lines'].append((product_id, quantity))
+        except RowError as e:
+            errors.append({'row': row_number, 'error': str(e)})
+
+    created = []
+    line_count = 0
+    if documents:
+        model = kind['model']
+        number_column = next(c for c in model.__table__.c if c.name.endswith('_number'))
+        numbers = reserve_document_numbers(kind['prefix'], model, len(documents))
+        now = datetime.utcnow()
+
+        doc_rows = []
+        for number, (reference, document) in zip(numbers, documents.items()):
+            header = dict(document['header'], date=document['header']['date'] or now)
+            doc_rows.append(dict(header, **{number_column.name: number},
+                                 state='draft', user_id=user_id, created_at=now))
+        result = db.session.execute(
+            insert(model).returning(model.id, number_column, sort_by_parameter_order=True), doc_rows
+        )
+        ids = [r.id for r in result]
+
+        line_rows = []
+        for doc_id, number, (reference, document) in zip(ids, numbers, documents.items()):
+            for product_id, quantity in document['lines']:
+                line_rows.append(dict({kind['parent_fk']: doc_id, 'product_id': product_id, 'quantity': quantity},
+                                      **kind['line_defaults']))
+            created.append({'id': doc_id, 'number': number, 'reference': reference, 'lines': len(document['lines'])})
+        _copy_lines(kind['line_model'], line_rows, batch_size)
+        line_count = len(line_rows)
+
+        invalidate_kpis()
+    db.session.commit()
+
+    return {
+        'documents': created,
+        'lines': line_count,
+        'error_count': len(errors),
+        'errors': errors[:MAX_REPORTED_ERRORS],
+    }
@@ -0,0 +1,184 @@
+"""
+StockMaster Product Catalog Upsert
+"""
+
+from datetime import datetime
+from sqlalchemy import insert, literal_column, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app import db
+from models import Category, Product, PriceHistory, STOCK_STATUS_OUT
+from kpi import invalidate_kpis
+from stock import stock_status_case
+from stock_alerts import evaluate_low_stock_alerts
+from utils import validate_price
+
+# Products per INSERT ... ON CONFLICT statement (and per transaction)
+UPSERT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+# Catalog fields and the value a new product gets when a row omits them
+PRODUCT_DEFAULTS = {
+    'name': None,
+    'category_id': None,
+    'uom': 'Unit',
+    'min_stock': 0.0,
+    'max_stock': 0.0,
+    'reorder_qty': 0.0,
+    'cost_price': 0.0,
+    'sale_price': 0.0,
+    'currency': 'INR',
+    'active': True,
+}
+QUANTITY_FIELDS = ('min_stock', 'max_stock', 'reorder_qty')
+PRICE_FIELDS = ('cost_price', 'sale_price')
+
+
+def _parse_product_row(row, categories):
+    """Validate one catalog row; returns (sku, {field: value}) with only the fields present"""
+    sku = (row.get('sku') or '').strip()
+    if not sku:
+        raise ValueError('Missing sku')
+    if len(sku) > 50:
+        raise ValueError('SKU is longer than 50 characters')
+
+    values = {}
+    for field in ('name', 'uom', 'currency'):
+        if row.get(field):
+            values[field] = row[field]
+    for field in QUANTITY_FIELDS:
+        if row.get(field) not in (None, ''):
+            try:
+                values[field] = float(row[field])
+            except (TypeError, ValueError):
+                raise ValueError(f'Invalid {field}: {row[field]!r}')
+            if values[field] < 0:
+                raise ValueError(f'{field} cannot be negative')
+    for field in PRICE_FIELDS:
+        if row.get(field) not in (None, ''):
+            values[field] = validate_price(row[field])
+    if row.get('category'):
+        if row['category'] not in categories:
+            raise ValueError(f"Unknown category: {row['category']}")
+        values['category_id'] = categories[row['category']]
+    if row.get('active') not in (None, ''):
+        values['active'] = str(row['active']).lower() in ('1', 'true', 'yes', 'y')
+    return sku, values
+
+
+def _upsert_batch(batch, user_id, reason):
+    """Upsert one batch of (sku, values); returns (created, updated, unchanged) and commits"""
+    existing = {p.sku: p for p in db.session.execute(
+        select(Product.id, Product.sku, *(getattr(Product, f) for f in PRODUCT_DEFAULTS))
+        .where(Product.sku.in_([sku for sku, _values in batch]))
+        .order_by(Product.id).with_for_update()
+    )}
+
+    rows = []
+    price_changes = {}
+    unchanged = 0
+    for sku, values in batch:
+        current = existing.get(sku)
+        if current is None:
+            rows.append(dict(PRODUCT_DEFAULTS, **values, sku=sku,
+                             stock_status=STOCK_STATUS_OUT, created_at=datetime.utcnow()))
+            continue
+        merged = {field: values.get(field, getattr(current, field)) for field in PRODUCT_DEFAULTS}
+        if all(merged[field] == getattr(current, field) for field in PRODUCT_DEFAULTS):
+            unchanged += 1
+            continue
+        rows.append(dict(merged, sku=sku, stock_status=STOCK_STATUS_OUT, created_at=datetime.utcnow()))
+        if any(merged[field] != getattr(current, field) for field in PRICE_FIELDS):
+            price_changes[current.id] = (current.cost_price, merged['cost_price'],
+                                         current.sale_price, merged['sale_price'])
+
+    created = updated = 0
+    if rows:
+        stmt = pg_insert(Product).values(rows)
+        # New rows start with no stock ('out'); updated rows keep on_hand_total
+        # and get their status recomputed against the new min_stock.
+        update_set = {field: stmt.excluded[field] for field in PRODUCT_DEFAULTS}
+        update_set['stock_status'] = stock_status_case(Product.on_hand_total, stmt.excluded.min_stock)
+        stmt = stmt.on_conflict_do_update(index_elements=['sku'], set_=update_set).returning(
+            Product.id, Product.on_hand_total, Product.min_stock, literal_column('xmax = 0').label('inserted')
+        )
+        levels = []
+        for result in db.session.execute(stmt):
+            if result.inserted:
+                created += 1
+            else:
+                updated += 1
+                levels.append((result.id, result.on_hand_total, result.min_stock))
+        # A new min_stock can make an existing product low (or recover it)
+        # without any stock moving; new products have no stock to alert on yet.
+        evaluate_low_stock_alerts(levels)
+
+        if price_changes:
+            db.session.execute(insert(PriceHistory), [
+                {'product_id': product_id, 'old_cost': old_cost, 'new_cost': new_cost,
+                 'old_sale': old_sale, 'new_sale': new_sale, 'changed_by': user_id,
+                 'reason': reason, 'created_at': datetime.utcnow()}
+                for product_id, (old_cost, new_cost, old_sale, new_sale) in price_changes.items()
+            ])
+        invalidate_kpis()
+    db.session.commit()
+    return created, updated, unchanged
+
+
+def upsert_products(rows, user_id=None, reason='Catalog import', batch_size=UPSERT_BATCH_SIZE):
+    """
+    Create or update products keyed by SKU
+
+    Each batch is one INSERT ... ON CONFLICT (sku) DO UPDATE in its own
+    transaction. Rows whose values already match the database are not
+    written at all, and price changes are logged to PriceHistory with one
+    multi-row insert per batch. Categories are given by name and resolved
+    from one lookup of the categories table.
+
+    Args:
+        rows: Row dicts with sku and any of name, category, uom, min_stock,
+            max_stock, reorder_qty, cost_price, sale_price, currency, active
+        user_id: User recorded on PriceHistory rows
+
+    Returns:
+        Dict with created/updated/unchanged counts, per-row errors, and the
+        rows superseded by a later row for the same SKU (not errors)
+    """
+    categories = {name: category_id for category_id, name in db.session.execute(select(Category.id, Category.name))}
+
+    # Last row wins when a SKU appears more than once
+    parsed = {}
+    errors = []
+    superseded = []
+    for row_number, row in enumerate(rows, 1):
+        try:
+            sku, values = _parse_product_row(row, categories)
+        except ValueError as e:
+            errors.append({'row': row_number, 'error': str(e)})
+            continue
+        if sku in parsed:
+            superseded.append({'row': parsed[sku][0], 'sku': sku, 'superseded_by': row_number})
+        parsed[sku] = (row_number, values)
+
+    # New products need a name; look up which SKUs exist once for the whole file
+    known = set(db.session.execute(select(Product.sku).where(Product.sku.in_(list(parsed)))).scalars())
+    items = []
+    for sku, (row_number, values) in parsed.items():
+        if sku not in known and not values.get('name'):
+            errors.append({'row': row_number, 'error': f'New product {sku} needs a name'})
+        else:
+            items.append((sku, values))
+
+    summary = {'created': 0, 'updated': 0, 'unchanged': 0}
+    for start in range(0, len(items), batch_size):
+        created, updated, unchanged = _upsert_batch(items[start:start + batch_size], user_id, reason)
+        summary['created'] += created
+        summary['updated'] += updated
+        summary['unchanged'] += unchanged
+
+    errors.sort(key=lambda error: error['row'])
+    summary['error_count'] = len(errors)
+    summary['errors'] = errors[:MAX_REPORTED_ERRORS]
+    summary['superseded_count'] = len(superseded)
+    summary['superseded'] = superseded[:MAX_REPORTED_ERRORS]
+    return summary
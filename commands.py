@@ -0,0 +1,188 @@
+"""
+StockMaster CLI Commands
+
+Run with the Flask CLI, e.g.:
+
+    flask --app app export-ledger --start 2025-01-01 --end 2025-03-31 -o ledger.csv
+"""
+
+import sys
+from datetime import datetime, timedelta
+import click
+
+from app import app
+from stock import take_stock_snapshot
+from reconcile import find_stock_drift, write_drift_corrections
+from bulk_import import IMPORT_KINDS, IMPORT_FORMATS, parse_rows, import_documents
+from catalog import upsert_products
+from notification_counts import recompute_unread_counts
+from utils import purge_expired_notifications
+from email_outbox import EMAIL_BATCH_SIZE, run_worker, purge_outbox
+from ledger import iter_ledger_export, EXPORT_FORMATS, ensure_ledger_partitions, detach_ledger_partitions
+
+
+@app.cli.command('export-ledger')
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), help='First day to export (inclusive)')
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), help='Last day to export (inclusive)')
+@click.option('--format', 'fmt', type=click.Choice(sorted(EXPORT_FORMATS)), default='csv')
+@click.option('-o', '--output', type=click.Path(dir_okay=False, writable=True), help='Output file (default: stdout)')
+def export_ledger_command(start, end, fmt, output):
+    """Stream the stock ledger to a CSV/NDJSON file with constant memory."""
+    encoder, _mimetype = EXPORT_FORMATS[fmt]
+    end = end + timedelta(days=1) if end else None
+
+    out = open(output, 'w', newline='', encoding='utf-8') if output else sys.stdout
+    try:
+        for chunk in encoder(iter_ledger_export(start, end)):
+            out.write(chunk)
+    finally:
+        if output:
+            out.close()
+
+
+@app.cli.command('ledger-partitions')
+@click.option('--months-ahead', type=int, default=3, show_default=True)
+def ledger_partitions_command(months_ahead):
+    """Create upcoming monthly stock_ledger partitions (run monthly)."""
+    try:
+        names = ensure_ledger_partitions(months_ahead)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Partitions present: {', '.join(names)}")
+
+
+@app.cli.command('ledger-archive')
+@click.option('--before', type=click.DateTime(formats=['%Y-%m-%d']), required=True,
+              help='Detach months that end on or before this date')
+@click.option('--drop', is_flag=True, help='Drop detached partitions instead of keeping them as tables')
+def ledger_archive_command(before, drop):
+    """Detach (and optionally drop) old monthly stock_ledger partitions."""
+    try:
+        names = detach_ledger_partitions(before, drop=drop)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    action = 'Dropped' if drop else 'Detached'
+    click.echo(f"{action} {len(names)} partition(s): {', '.join(names) or '-'}")
+
+
+@app.cli.command('stock-snapshot')
+@click.option('--at', type=click.DateTime(formats=['%Y-%m-%d', '%Y-%m-%dT%H:%M']),
+              help='Snapshot instant (default: today 00:00 UTC, i.e. stock at the end of yesterday)')
+@click.option('--rebuild', is_flag=True, help='Recompute the snapshot if it already exists')
+def stock_snapshot_command(at, rebuild):
+    """Store a product x location stock snapshot (run nightly)."""
+    at = at or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    with app.app_context():
+        rows = take_stock_snapshot(at, rebuild=rebuild)
+    if rows is None:
+        click.echo(f"Snapshot for {at.isoformat()} already exists (use --rebuild to recompute)")
+    else:
+        click.echo(f"Stored {rows} rows for snapshot {at.isoformat()}")
+
+
+@app.cli.command('reconcile-stock')
+@click.option('--chunk-size', type=int, default=5000, show_default=True, help='Product ids per aggregate query')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+@click.option('--fix', is_flag=True, help='Write correcting ledger rows for the drift found')
+def reconcile_stock_command(chunk_size, workers, fix):
+    """Report product/locations whose stock differs from the ledger sum."""
+    try:
+        drift = find_stock_drift(chunk_size=chunk_size, workers=workers)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for product_id, location_id, stock_qty, ledger_qty in drift:
+        click.echo(f"product {product_id} location {location_id}: stock {stock_qty} ledger {ledger_qty} "
+                   f"drift {stock_qty - ledger_qty:+}")
+    click.echo(f"{len(drift)} product/location(s) with drift")
+
+    if fix and drift:
+        try:
+            written = write_drift_corrections(drift)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Wrote {written} correcting ledger row(s)")
+
+
+@app.cli.command('import-documents')
+@click.argument('kind', type=click.Choice(sorted(IMPORT_KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), help='File format (default: from extension)')
+@click.option('--user-id', type=int, help='Owner of the created documents')
+def import_documents_command(kind, path, fmt, user_id):
+    """Create draft receipts/deliveries/transfers from a CSV or JSON file."""
+    fmt = fmt or ('json' if path.lower().endswith('.json') else 'csv')
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            rows = parse_rows(f, fmt)
+        with app.app_context():
+            result = import_documents(kind, rows, user_id=user_id)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    for error in result['errors']:
+        click.echo(f"row {error['row']}: {error['error']}", err=True)
+    click.echo(f"Created {len(result['documents'])} {kind} with {result['lines']} lines; "
+               f"{result['error_count']} row(s) skipped")
+
+
+@app.cli.command('upsert-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), help='File format (default: from extension)')
+@click.option('--user-id', type=int, help='User recorded on price history rows')
+@click.option('--reason', default='Catalog import', show_default=True, help='Price history reason')
+def upsert_products_command(path, fmt, user_id, reason):
+    """Create or update products by SKU from a CSV or JSON catalog."""
+    fmt = fmt or ('json' if path.lower().endswith('.json') else 'csv')
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            rows = parse_rows(f, fmt)
+        with app.app_context():
+            summary = upsert_products(rows, user_id=user_id, reason=reason)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    for error in summary['errors']:
+        click.echo(f"row {error['row']}: {error['error']}", err=True)
+    click.echo(f"{summary['created']} created, {summary['updated']} updated, "
+               f"{summary['unchanged']} unchanged, {summary['error_count']} row(s) skipped, "
+               f"{summary['superseded_count']} superseded by a later row for the same SKU")
+
+
+@app.cli.command('notification-counts')
+def notification_counts_command():
+    """Correct unread notification counters, e.g. for expired notifications (run every few minutes)."""
+    with app.app_context():
+        changed = recompute_unread_counts()
+    click.echo(f"Corrected {changed} unread counter(s)")
+
+
+@app.cli.command('purge-notifications')
+@click.option('--batch-size', type=int, default=1000, show_default=True, help='Rows deleted per transaction')
+@click.option('--pause', type=float, default=0.1, show_default=True, help='Seconds to sleep between batches')
+@click.option('--max-batches', type=int, help='Stop after this many batches')
+def purge_notifications_command(batch_size, pause, max_batches):
+    """Delete expired notifications in small batches (run hourly or nightly)."""
+    with app.app_context():
+        deleted = purge_expired_notifications(batch_size=batch_size, pause=pause, max_batches=max_batches)
+    click.echo(f"Deleted {deleted} expired notification(s)")
+
+
+@app.cli.command('email-worker')
+@click.option('--batch-size', type=int, default=EMAIL_BATCH_SIZE, show_default=True,
+              help='Messages claimed and sent per SMTP connection')
+@click.option('--interval', type=float, default=1.0, show_default=True, help='Seconds between polls when idle')
+@click.option('--once', is_flag=True, help='Send what is due, then exit')
+def email_worker_command(batch_size, interval, once):
+    """Send queued email from the outbox (run as a long-lived worker process)."""
+    with app.app_context():
+        sent, failed = run_worker(batch_size=batch_size, idle_interval=interval, once=once)
+    click.echo(f"Sent {sent} email(s), {failed} failed attempt(s)")
+
+
+@app.cli.command('purge-email-outbox')
+@click.option('--days', type=int, help='Keep sent/failed messages this many days (default: EMAIL_RETENTION_DAYS)')
+def purge_email_outbox_command(days):
+    """Delete old sent/failed email and expired one-time-code messages (the worker also does this hourly)."""
+    with app.app_context():
+        deleted = purge_outbox(retention_days=days)
+    click.echo(f"Deleted {deleted} outbox message(s)")
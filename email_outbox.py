@@ -0,0 +1,262 @@
+"""
+StockMaster Email Outbox
+"""
+
+import logging
+import smtplib
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from flask_mail import Message, BadHeaderError
+from sqlalchemy import delete, insert, or_, select, update
+
+from app import db, mail
+from models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+# Messages claimed (and sent over one SMTP connection) per batch
+EMAIL_BATCH_SIZE = 50
+# A claimed message becomes claimable again after this long, so messages held
+# by a worker that died are retried rather than lost
+CLAIM_LEASE = timedelta(minutes=5)
+# How often the worker deletes old sent/failed messages
+PURGE_INTERVAL = 3600
+
+
+def enqueue_email(subject, sender, recipients, text_body, html_body=None, expires_at=None):
+    """
+    Queue an email for the background worker
+
+    The row is written and committed on its own connection, so the caller's
+    session is neither committed nor rolled back here.
+
+    Args:
+        subject: Subject line
+        sender: From address (None for MAIL_DEFAULT_SENDER)
+        recipients: List of addresses
+        expires_at: Give up on the message if it is not sent by then (e.g.
+            when the one-time code it carries expires)
+
+    Returns:
+        The outbox row id
+    """
+    recipients = [address for address in recipients or [] if address]
+    if not recipients:
+        raise ValueError('Email has no recipients')
+    if '\n' in subject or '\r' in subject:
+        raise ValueError('Email subject cannot contain line breaks')
+
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        return conn.execute(
+            insert(EmailOutbox).values(subject=subject, sender=sender, recipients=recipients,
+                                       text_body=text_body, html_body=html_body, status='pending', attempts=0,
+                                       next_attempt_at=now, expires_at=expires_at, created_at=now)
+            .returning(EmailOutbox.id)
+        ).scalar()
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt: EMAIL_RETRY_BASE_SECONDS doubled per failed attempt, capped"""
+    base = current_app.config.get('EMAIL_RETRY_BASE_SECONDS', 30)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), current_app.config.get('EMAIL_RETRY_MAX_SECONDS', 3600)))
+
+
+def claim_batch(limit=EMAIL_BATCH_SIZE):
+    """
+    Claim up to `limit` due messages and commit
+
+    FOR UPDATE SKIP LOCKED lets several workers claim concurrently without
+    waiting on or double-sending each other's rows. Claiming counts as an
+    attempt and pushes next_attempt_at out by CLAIM_LEASE. Due messages past
+    their expires_at are marked failed instead of being sent.
+
+    Returns:
+        List of claimed rows (id, subject, sender, recipients, text_body, html_body, attempts)
+    """
+    now = datetime.utcnow()
+    db.session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now, EmailOutbox.expires_at <= now)
+        .values(status='failed', last_error='Expired before it could be sent')
+    )
+    due = (
+        select(EmailOutbox.id)
+        .where(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now,
+               or_(EmailOutbox.expires_at == None, EmailOutbox.expires_at > now))
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    rows = db.session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(due.scalar_subquery()))
+        .values(attempts=EmailOutbox.attempts + 1, next_attempt_at=now + CLAIM_LEASE)
+        .returning(EmailOutbox.id, EmailOutbox.subject, EmailOutbox.sender, EmailOutbox.recipients,
+                   EmailOutbox.text_body, EmailOutbox.html_body, EmailOutbox.attempts)
+    ).all()
+    db.session.commit()
+    return sorted(rows, key=lambda row: row.id)
+
+
+def _message(row):
+    message = Message(row.subject, sender=row.sender or current_app.config.get('MAIL_DEFAULT_SENDER'),
+                      recipients=list(row.recipients))
+    message.body = row.text_body
+    if row.html_body:
+        message.html = row.html_body
+    return message
+
+
+def deliver(rows):
+    """
+    Send claimed messages, reusing one SMTP connection for the batch
+
+    A message the server rejects fails on its own. If the connection drops,
+    the message being sent fails and the rest go over a new connection; if
+    a connection cannot be made (or drops before anything was sent), every
+    remaining message fails with that error.
+
+    Returns:
+        Dict mapping row id to None (sent) or an error string
+    """
+    results = {}
+    pending = list(rows)
+    while pending:
+        sent_on_connection = 0
+        try:
+            with mail.connect() as connection:
+                while pending:
+                    row = pending[0]
+                    try:
+                        connection.send(_message(row))
+                    except smtplib.SMTPServerDisconnected:
+                        raise
+                    except (smtplib.SMTPException, BadHeaderError) as e:
+                        results[row.id] = f'{type(e).__name__}: {e}'
+                    else:
+                        results[row.id] = None
+                        sent_on_connection += 1
+                    pending.pop(0)
+        except Exception as e:
+            if not pending:
+                # Only QUIT failed; everything was handed to the server
+                break
+            error = f'{type(e).__name__}: {e}'
+            if not sent_on_connection:
+                for row in pending:
+                    results[row.id] = error
+                break
+            results[pending.pop(0).id] = error
+    return results
+
+
+def record_results(rows, results):
+    """Mark sent messages, schedule retries with backoff, give up after EMAIL_MAX_ATTEMPTS; commits"""
+    max_attempts = current_app.config.get('EMAIL_MAX_ATTEMPTS', 6)
+    now = datetime.utcnow()
+    changes = []
+    for row in rows:
+        error = results.get(row.id, 'Not attempted')
+        if error is None:
+            changes.append({'id': row.id, 'status': 'sent', 'sent_at': now, 'last_error': None})
+        elif row.attempts >= max_attempts:
+            changes.append({'id': row.id, 'status': 'failed', 'last_error': error})
+            logger.error('Giving up on email %s after %s attempts: %s', row.id, row.attempts, error)
+        else:
+            changes.append({'id': row.id, 'next_attempt_at': now + retry_delay(row.attempts), 'last_error': error})
+            logger.warning('Email %s failed (attempt %s), will retry: %s', row.id, row.attempts, error)
+
+    # Rows with different keys are grouped into separate executemany batches
+    if changes:
+        db.session.execute(update(EmailOutbox), changes)
+    db.session.commit()
+
+
+def send_pending(batch_size=EMAIL_BATCH_SIZE):
+    """
+    Claim and send one batch of due messages
+
+    Returns:
+        (sent, failed) counts for the batch; (0, 0) when nothing was due
+    """
+    rows = claim_batch(batch_size)
+    if not rows:
+        return 0, 0
+    results = deliver(rows)
+    record_results(rows, results)
+    failed = sum(1 for error in results.values() if error is not None)
+    return len(rows) - failed, failed
+
+
+def purge_outbox(retention_days=None, batch_size=1000):
+    """
+    Delete sent and failed messages older than EMAIL_RETENTION_DAYS
+
+    Messages with an expires_at (e.g. password-reset codes) are deleted as
+    soon as they are sent or failed and have expired, so one-time codes do
+    not stay in the table. Deletes in batches of `batch_size`, committing
+    each.
+
+    Returns:
+        Number of messages deleted
+    """
+    if retention_days is None:
+        retention_days = current_app.config.get('EMAIL_RETENTION_DAYS', 7)
+    now = datetime.utcnow()
+    cutoff = now - timedelta(days=retention_days)
+    deleted = 0
+    while True:
+        done = (
+            select(EmailOutbox.id)
+            .where(EmailOutbox.status != 'pending',
+                   or_(EmailOutbox.created_at < cutoff, EmailOutbox.expires_at <= now))
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        count = db.session.execute(
+            delete(EmailOutbox).where(EmailOutbox.id.in_(done.scalar_subquery()))
+        ).rowcount
+        db.session.commit()
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def run_worker(batch_size=EMAIL_BATCH_SIZE, idle_interval=1.0, once=False):
+    """
+    Send queued email until interrupted
+
+    Full batches are followed immediately by the next; otherwise the worker
+    sleeps `idle_interval` seconds between polls of the (partial-indexed)
+    pending queue. Old sent/failed messages are purged every PURGE_INTERVAL
+    seconds (see purge_outbox()).
+
+    Args:
+        once: Stop when no message is due instead of polling
+
+    Returns:
+        (sent, failed) totals
+    """
+    totals = [0, 0]
+    next_purge = time.monotonic()
+    while True:
+        try:
+            if time.monotonic() >= next_purge:
+                purge_outbox()
+                next_purge = time.monotonic() + PURGE_INTERVAL
+            sent, failed = send_pending(batch_size)
+        except Exception:
+            db.session.rollback()
+            logger.exception('Email worker batch failed')
+            sent = failed = 0
+            if once:
+                raise
+        totals[0] += sent
+        totals[1] += failed
+        if sent + failed < batch_size:
+            if once:
+                return tuple(totals)
+            db.session.remove()
+            time.sleep(idle_interval)
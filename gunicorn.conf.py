@@ -0,0 +1,29 @@
+"""
+Gunicorn server hooks (loaded automatically from the working directory)
+
+Settings such as workers and threads are passed on the command line in the
+Procfile; this file only keeps the Prometheus multiprocess directory
+consistent (see metrics.py).
+"""
+
+import glob
+import os
+
+
+def on_starting(server):
+    """Remove samples left over from a previous run"""
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    """Drop an exited worker's live gauges from the aggregate"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        try:
+            from prometheus_client import multiprocess
+        except ImportError:
+            return
+        multiprocess.mark_process_dead(worker.pid)
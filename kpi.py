@@ -0,0 +1,111 @@
+"""
+StockMaster Dashboard KPI Service
+"""
+
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event, func, select
+
+from app import db
+from models import Product, Receipt, Delivery, Transfer
+
+PENDING_RECEIPT_STATES = ('draft', 'waiting', 'ready')
+PENDING_DELIVERY_STATES = ('draft', 'picking', 'packing', 'ready')
+SCHEDULED_TRANSFER_STATES = ('draft', 'waiting', 'ready')
+
+# Models whose inserts/updates/deletes can change a dashboard number
+_KPI_MODELS = (Product, Receipt, Delivery, Transfer)
+
+_lock = threading.Lock()
+_version = 0
+_cache = {'version': None, 'expires_at': 0.0, 'data': None}
+
+
+def bump_kpi_version():
+    """Invalidate the cached dashboard data in this process"""
+    global _version
+    with _lock:
+        _version += 1
+
+
+def invalidate_kpis():
+    """Invalidate cached dashboard data once the current transaction commits"""
+    db.session.info['kpis_dirty'] = True
+
+
+@event.listens_for(db.session, 'before_flush')
+def _flag_kpi_changes(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, _KPI_MODELS):
+            session.info['kpis_dirty'] = True
+            return
+
+
+@event.listens_for(db.session, 'after_commit')
+def _bump_on_commit(session):
+    if session.info.pop('kpis_dirty', False):
+        bump_kpi_version()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _clear_on_rollback(session):
+    session.info.pop('kpis_dirty', None)
+
+
+def _count(model, *criteria):
+    return select(func.count()).select_from(model).where(*criteria).scalar_subquery()
+
+
+def compute_kpis():
+    """Compute all dashboard KPI counts in a single SQL round trip"""
+    row = db.session.execute(select(
+        _count(Product, Product.active == True).label('total_products'),
+        _count(Product, Product.active == True, Product.low_stock).label('low_stock_items'),
+        _count(Product, Product.active == True, Product.out_of_stock).label('out_of_stock_items'),
+        _count(Receipt, Receipt.state.in_(PENDING_RECEIPT_STATES)).label('pending_receipts'),
+        _count(Delivery, Delivery.state.in_(PENDING_DELIVERY_STATES)).label('pending_deliveries'),
+        _count(Transfer, Transfer.state.in_(SCHEDULED_TRANSFER_STATES)).label('scheduled_transfers'),
+    )).one()
+    return dict(row._mapping)
+
+
+def compute_dashboard_data():
+    """KPIs plus the recent-activity lists, as plain dicts safe to cache across requests"""
+    recent_receipts = Receipt.query.order_by(Receipt.created_at.desc()).limit(5).all()
+    recent_deliveries = Delivery.query.order_by(Delivery.created_at.desc()).limit(5).all()
+    low_stock_products = Product.query.filter(Product.active == True, Product.low_stock).limit(10).all()
+
+    return {
+        'kpis': compute_kpis(),
+        'recent_receipts': [{'id': r.id, 'receipt_number': r.receipt_number, 'state': r.state}
+                            for r in recent_receipts],
+        'recent_deliveries': [{'id': d.id, 'delivery_number': d.delivery_number, 'state': d.state}
+                              for d in recent_deliveries],
+        'low_stock_products': [{'id': p.id, 'name': p.name, 'total_stock': p.total_stock, 'min_stock': p.min_stock}
+                               for p in low_stock_products],
+    }
+
+
+def get_dashboard_data():
+    """
+    Dashboard data served from an in-process cache
+
+    The cache entry is dropped when the KPI version changes (stock postings
+    and document/product changes committed by this worker) and otherwise
+    lives for DASHBOARD_CACHE_TTL seconds, which bounds how long changes made
+    by other gunicorn workers take to show up.
+    """
+    ttl = current_app.config.get('DASHBOARD_CACHE_TTL', 15)
+    now = time.monotonic()
+    with _lock:
+        version = _version
+        if _cache['data'] is not None and _cache['version'] == version and now < _cache['expires_at']:
+            return _cache['data']
+
+    data = compute_dashboard_data()
+    with _lock:
+        # Only store if nothing was committed while we were computing
+        if _version == version:
+            _cache.update(version=version, expires_at=now + ttl, data=data)
+    return data
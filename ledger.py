@@ -0,0 +1,291 @@
+"""
+StockMaster Stock Ledger Queries
+"""
+
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.orm import joinedload
+
+from app import db
+from models import StockLedger, Product, Location, Partner
+
+MAX_PAGE_SIZE = 500
+EXPORT_BATCH_SIZE = 5000
+
+EXPORT_COLUMNS = [
+    'id', 'date', 'reference', 'operation_type', 'product_id', 'sku', 'product_name',
+    'location_id', 'location_name', 'quantity_in', 'quantity_out', 'balance',
+    'partner_id', 'partner_name', 'user_id', 'notes',
+]
+
+
+def encode_cursor(entry):
+    """Opaque cursor pointing just after `entry` in (date, id) descending order"""
+    raw = f"{entry.date.isoformat()}|{entry.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (date, id) from a cursor, or raise ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date_str, entry_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(date_str), int(entry_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def ledger_query(product_id=None, location_id=None, operation_type=None):
+    """Filtered ledger query; every filter is backed by a (..., date, id) index"""
+    query = StockLedger.query
+    if product_id:
+        query = query.filter(StockLedger.product_id == product_id)
+    if location_id:
+        query = query.filter(StockLedger.location_id == location_id)
+    if operation_type:
+        query = query.filter(StockLedger.operation_type == operation_type)
+    return query
+
+
+def ledger_page(cursor=None, limit=100, product_id=None, location_id=None, operation_type=None):
+    """
+    Fetch one page of ledger entries, newest first, using keyset pagination
+
+    Instead of OFFSET the page starts strictly after the (date, id) encoded in
+    `cursor`, so every page is a bounded index range scan and page N costs the
+    same as page 1.
+
+    Args:
+        cursor: Cursor returned by the previous page, or None for the first page
+        limit: Page size (capped at MAX_PAGE_SIZE)
+        product_id, location_id, operation_type: Optional filters
+
+    Returns:
+        (entries, next_cursor) where next_cursor is None on the last page
+    """
+    limit = max(1, min(limit or 100, MAX_PAGE_SIZE))
+    query = ledger_query(product_id, location_id, operation_type).options(
+        joinedload(StockLedger.product),
+        joinedload(StockLedger.location),
+        joinedload(StockLedger.partner),
+    )
+
+    if cursor:
+        after_date, after_id = decode_cursor(cursor)
+        # The plain date bound lets PostgreSQL prune monthly partitions; the
+        # row comparison alone does not.
+        query = query.filter(StockLedger.date <= after_date,
+                             tuple_(StockLedger.date, StockLedger.id) < tuple_(after_date, after_id))
+
+    entries = query.order_by(StockLedger.date.desc(), StockLedger.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(entries[limit - 1]) if len(entries) > limit else None
+    return entries[:limit], next_cursor
+
+
+def ledger_entry_to_dict(entry):
+    """JSON representation of a ledger entry"""
+    return {
+        'id': entry.id,
+        'date': entry.date.isoformat(),
+        'reference': entry.reference,
+        'operation_type': entry.operation_type,
+        'product_id': entry.product_id,
+        'product_name': entry.product.name if entry.product else None,
+        'location_id': entry.location_id,
+        'location_name': entry.location.name if entry.location else None,
+        'quantity_in': entry.quantity_in,
+        'quantity_out': entry.quantity_out,
+        'balance': entry.balance,
+        'partner_id': entry.partner_id,
+        'partner_name': entry.partner.name if entry.partner else None,
+    }
+
+
+def iter_ledger_export(start=None, end=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield ledger rows (with product/location/partner names) oldest first
+
+    Rows are read through a server-side cursor on a dedicated connection and
+    fetched `batch_size` at a time, so memory stays constant however many rows
+    are exported. No ORM objects are built.
+
+    Args:
+        start: Optional inclusive start datetime
+        end: Optional exclusive end datetime
+    """
+    stmt = select(
+        StockLedger.id, StockLedger.date, StockLedger.reference, StockLedger.operation_type,
+        StockLedger.product_id, Product.sku, Product.name.label('product_name'),
+        StockLedger.location_id, Location.name.label('location_name'),
+        StockLedger.quantity_in, StockLedger.quantity_out, StockLedger.balance,
+        StockLedger.partner_id, Partner.name.label('partner_name'),
+        StockLedger.user_id, StockLedger.notes,
+    ).join(Product, Product.id == StockLedger.product_id
+    ).join(Location, Location.id == StockLedger.location_id
+    ).outerjoin(Partner, Partner.id == StockLedger.partner_id)
+
+    if start:
+        stmt = stmt.where(StockLedger.date >= start)
+    if end:
+        stmt = stmt.where(StockLedger.date < end)
+    stmt = stmt.order_by(StockLedger.date, StockLedger.id)
+
+    with db.engine.connect() as conn:
+        result = conn.execution_options(yield_per=batch_size).execute(stmt)
+        for row in result:
+            yield row
+
+
+def iter_csv(rows, flush_every=1000):
+    """Encode export rows as CSV text chunks (header first)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for i, row in enumerate(rows, 1):
+        writer.writerow([row.date.isoformat() if name == 'date' else getattr(row, name) for name in EXPORT_COLUMNS])
+        if i % flush_every == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows, flush_every=1000):
+    """Encode export rows as newline-delimited JSON text chunks"""
+    chunk = []
+    for row in rows:
+        data = dict(row._mapping)
+        data['date'] = row.date.isoformat()
+        chunk.append(json.dumps(data))
+        if len(chunk) >= flush_every:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+}
+
+
+# ========== Monthly Partitions ==========
+# Only used once stock_ledger has been converted with
+# migrations/migrate_partition_ledger.py; see that script for the layout.
+
+def _month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def _next_month(value):
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def partition_name(month, parent='stock_ledger'):
+    """Name of the partition holding `month`, e.g. stock_ledger_p202501"""
+    return f"{parent}_p{month.year:04d}{month.month:02d}"
+
+
+def is_ledger_partitioned(conn):
+    """True if stock_ledger is a partitioned table"""
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = 'stock_ledger' AND c.relnamespace = 'public'::regnamespace"
+    )).scalar())
+
+
+def attached_ledger_months(conn):
+    """First day of each month with a partition attached to stock_ledger, oldest first"""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'stock_ledger' AND c.relname ~ '^stock_ledger_p[0-9]{6}$' ORDER BY c.relname"
+    )).scalars()
+    return [datetime(int(name[-6:-2]), int(name[-2:]), 1) for name in names]
+
+
+def create_month_partitions(conn, first_month, last_month, parent='stock_ledger'):
+    """Create any missing monthly partitions of `parent` from first_month to last_month inclusive"""
+    created = []
+    month = _month_start(first_month)
+    while month <= _month_start(last_month):
+        name = partition_name(month, parent)
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {parent} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')"
+        ))
+        created.append(name)
+        month = _next_month(month)
+    return created
+
+
+def _retire_default_partition(conn):
+    """
+    Move rows out of stock_ledger_default into monthly partitions and drop it
+
+    Earlier versions of the partitioning migration created this default
+    partition. While it exists, every new monthly partition has to scan it,
+    and creating one fails if rows for that month are already in it.
+    """
+    if not conn.execute(text("SELECT to_regclass('public.stock_ledger_default')")).scalar():
+        return
+    conn.execute(text("ALTER TABLE stock_ledger DETACH PARTITION stock_ledger_default"))
+    months = conn.execute(text("SELECT DISTINCT date_trunc('month', date) FROM stock_ledger_default")).scalars()
+    for month in months:
+        create_month_partitions(conn, month, month)
+    conn.execute(text("INSERT INTO stock_ledger SELECT * FROM stock_ledger_default"))
+    conn.execute(text("DROP TABLE stock_ledger_default"))
+
+
+def ensure_ledger_partitions(months_ahead=3):
+    """
+    Make sure partitions exist from the current month up to `months_ahead` months ahead
+
+    Also retires a leftover default partition (see _retire_default_partition).
+    """
+    with db.engine.begin() as conn:
+        if not is_ledger_partitioned(conn):
+            raise ValueError('stock_ledger is not partitioned')
+        conn.execute(text("SET LOCAL lock_timeout = '10s'"))
+        _retire_default_partition(conn)
+        last = _month_start(datetime.utcnow())
+        for _ in range(months_ahead):
+            last = _next_month(last)
+        return create_month_partitions(conn, datetime.utcnow(), last)
+
+
+def detach_ledger_partitions(before, drop=False, lock_timeout='5s'):
+    """
+    Detach monthly partitions that end on or before `before`
+
+    Detaching only needs a brief lock on stock_ledger; lock_timeout makes it
+    give up instead of queueing behind long-running queries (and blocking
+    inserts behind it). Detached partitions stay as plain tables
+    (stock_ledger_pYYYYMM) for archiving unless `drop` is set.
+
+    Returns:
+        List of detached partition names
+    """
+    cutoff = _month_start(before)
+    with db.engine.connect() as conn:
+        if not is_ledger_partitioned(conn):
+            raise ValueError('stock_ledger is not partitioned')
+        months = attached_ledger_months(conn)
+
+    detached = []
+    for month in months:
+        if _next_month(month) > cutoff:
+            continue
+        name = partition_name(month)
+        with db.engine.begin() as conn:
+            conn.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+            conn.execute(text(f"ALTER TABLE stock_ledger DETACH PARTITION {name}"))
+            if drop:
+                conn.execute(text(f"DROP TABLE {name}"))
+        detached.append(name)
+    return detached
@@ -0,0 +1,148 @@
+"""
+StockMaster Prometheus Metrics
+
+Requires the optional `prometheus_client` package; without it every
+function here is a no-op and /metrics answers 503.
+
+With several gunicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty,
+writable directory: each worker then writes its samples to memory-mapped
+files there and /metrics aggregates all of them, whichever worker serves
+the scrape (gunicorn.conf.py clears the directory on start and cleans up
+after exited workers).
+"""
+
+import os
+import time
+from flask import g, request
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError:
+    prometheus_client = None
+
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+if prometheus_client:
+    REQUEST_LATENCY = Histogram(
+        'stockmaster_http_request_duration_seconds', 'Request latency by endpoint',
+        ['method', 'endpoint'],
+        buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    )
+    REQUESTS = Counter(
+        'stockmaster_http_requests_total', 'Requests by endpoint and status', ['method', 'endpoint', 'status'],
+    )
+    POOL_CHECKOUT_WAIT = Histogram(
+        'stockmaster_db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled DB connection',
+        buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+    )
+    # Gauges are summed over live workers in multiprocess mode
+    POOL_SIZE = Gauge('stockmaster_db_pool_size', 'Configured pool size (excluding overflow)',
+                      multiprocess_mode='livesum')
+    POOL_CHECKED_OUT = Gauge('stockmaster_db_pool_checked_out', 'DB connections currently checked out',
+                             multiprocess_mode='livesum')
+    POOL_TIMEOUTS = Counter('stockmaster_db_pool_timeouts_total', 'Pool checkouts that timed out')
+    STOCK_POSTINGS = Counter('stockmaster_stock_postings_total', 'Committed stock postings', ['operation_type'])
+    LEDGER_ROWS = Counter('stockmaster_ledger_rows_total', 'Committed stock ledger rows', ['operation_type'])
+    NOTIFICATIONS = Counter('stockmaster_notifications_created_total', 'Committed notifications',
+                            ['notification_type'])
+
+    _COUNTERS = {
+        'stock_postings': STOCK_POSTINGS,
+        'ledger_rows': LEDGER_ROWS,
+        'notifications': NOTIFICATIONS,
+    }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            if prometheus_client:
+                POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            if prometheus_client:
+                POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+
+def count_on_commit(session, name, amount=1, **labels):
+    """
+    Add `amount` to counter `name` when `session` commits (dropped on rollback)
+
+    Args:
+        name: 'stock_postings', 'ledger_rows' or 'notifications'
+        labels: Label values for the counter
+    """
+    if prometheus_client and amount:
+        pending = session.info.setdefault('pending_metrics', {})
+        key = (name, tuple(sorted(labels.items())))
+        pending[key] = pending.get(key, 0) + amount
+
+
+def _flush_pending(session):
+    for (name, labels), amount in session.info.pop('pending_metrics', {}).items():
+        _COUNTERS[name].labels(**dict(labels)).inc(amount)
+
+
+def _drop_pending(session):
+    session.info.pop('pending_metrics', None)
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def _record_request(response):
+    start = g.pop('metrics_start', None)
+    if start is not None and request.endpoint not in (None, 'static', 'metrics'):
+        endpoint = request.endpoint
+        REQUEST_LATENCY.labels(request.method, endpoint).observe(time.perf_counter() - start)
+        REQUESTS.labels(request.method, endpoint, str(response.status_code)).inc()
+    return response
+
+
+def _watch_pool(engine):
+    pool = engine.pool
+    if hasattr(pool, 'size'):
+        POOL_SIZE.set(pool.size())
+    event.listen(pool, 'checkout', lambda *args: POOL_CHECKED_OUT.inc())
+    event.listen(pool, 'checkin', lambda *args: POOL_CHECKED_OUT.dec())
+    # Detached connections (e.g. the notification LISTEN connection) never check in
+    event.listen(pool, 'detach', lambda *args: POOL_CHECKED_OUT.dec())
+
+
+def init_metrics(app, db):
+    """Register request timing, pool and commit hooks (no-op without prometheus_client)"""
+    if not prometheus_client:
+        return
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    event.listen(db.session, 'after_commit', _flush_pending)
+    event.listen(db.session, 'after_rollback', _drop_pending)
+    with app.app_context():
+        _watch_pool(db.engine)
+
+
+def render_metrics():
+    """
+    Current metrics in the Prometheus text format
+
+    Returns:
+        (body, content_type), or None when prometheus_client is not installed
+    """
+    if not prometheus_client:
+        return None
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
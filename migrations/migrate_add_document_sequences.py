@@ -0,0 +1,53 @@
+"""Migration script: create the `document_sequences` counter table.
+
+Run this once (while your virtualenv is active and DATABASE_URL is configured):
+
+    python migrations/migrate_add_document_sequences.py
+
+It creates `document_sequences` and seeds one row per document prefix from the
+highest number already in use, so new documents continue the existing series.
+"""
+import sys
+import os
+
+# Ensure project root is on sys.path so we can import app and models
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+# Prevent importing routes when importing app for migrations
+os.environ.setdefault('SKIP_IMPORT_ROUTE', '1')
+
+from app import db, app
+import models
+
+PREFIXES = [
+    ('REC', models.Receipt),
+    ('DEL', models.Delivery),
+    ('TRF', models.Transfer),
+    ('ADJ', models.Adjustment),
+]
+
+
+def main():
+    from sequences import _reserve
+
+    with app.app_context():
+        engine = db.engine
+        try:
+            models.DocumentSequence.__table__.create(bind=engine, checkfirst=True)
+            print("document_sequences table created or already exists")
+        except Exception as e:
+            print(f"Failed to create document_sequences table: {e}")
+            return
+
+        # Reserving zero numbers seeds a missing prefix row without consuming one
+        for prefix, model_class in PREFIXES:
+            with engine.begin() as conn:
+                last_value = _reserve(conn, prefix, model_class, 0)
+            print(f"{prefix}: last number {last_value}")
+
+    print("Migration completed.")
+
+
+if __name__ == '__main__':
+    main()
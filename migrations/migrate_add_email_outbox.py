@@ -0,0 +1,46 @@
+"""Migration script: create the `email_outbox` table.
+
+Run this once (while your virtualenv is active and DATABASE_URL is configured):
+
+    python migrations/migrate_add_email_outbox.py
+
+It creates the table, or adds the `expires_at` column to an existing one.
+Queued email is then sent by `flask --app app email-worker` (the `worker`
+line in the Procfile).
+"""
+import sys
+import os
+
+# Ensure project root is on sys.path so we can import app and models
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+# Prevent importing routes when importing app for migrations
+os.environ.setdefault('SKIP_IMPORT_ROUTE', '1')
+
+from app import db, app
+import models
+from migrations.migrate_add_pricing import column_exists, add_column
+
+
+def main():
+    with app.app_context():
+        engine = db.engine
+
+    try:
+        models.EmailOutbox.__table__.create(bind=engine, checkfirst=True)
+        print("email_outbox table created or already exists")
+    except Exception as e:
+        print(f"Failed to create email_outbox table: {e}")
+        return
+
+    if not column_exists(engine, 'email_outbox', 'expires_at'):
+        add_column(engine, 'email_outbox', "ALTER TABLE email_outbox ADD COLUMN expires_at TIMESTAMP WITHOUT TIME ZONE")
+    else:
+        print("Column email_outbox.expires_at already exists")
+
+    print("Migration completed.")
+
+
+if __name__ == '__main__':
+    main()
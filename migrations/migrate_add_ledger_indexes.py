@@ -0,0 +1,71 @@
+"""Migration script: composite (..., date, id) indexes on `stock_ledger`.
+
+Run this once (while your virtualenv is active and DATABASE_URL is configured):
+
+    python migrations/migrate_add_ledger_indexes.py
+
+It creates the composite indexes used by keyset pagination of the ledger and
+drops the single-column indexes they make redundant. Both steps use
+CONCURRENTLY so inserts into the ledger are not blocked while they run.
+A partitioned stock_ledger (migrate_partition_ledger.py) is skipped: it
+already has the composite indexes, and PostgreSQL does not allow
+CONCURRENTLY on a partitioned table.
+"""
+import sys
+import os
+from sqlalchemy import text
+
+# Ensure project root is on sys.path so we can import app and models
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+# Prevent importing routes when importing app for migrations
+os.environ.setdefault('SKIP_IMPORT_ROUTE', '1')
+
+from app import db, app
+from ledger import is_ledger_partitioned
+
+NEW_INDEXES = [
+    ('ix_stock_ledger_date_id', 'date, id'),
+    ('ix_stock_ledger_product_date_id', 'product_id, date, id'),
+    ('ix_stock_ledger_product_location_date_id', 'product_id, location_id, date, id'),
+    ('ix_stock_ledger_location_date_id', 'location_id, date, id'),
+    ('ix_stock_ledger_operation_date_id', 'operation_type, date, id'),
+]
+
+OLD_INDEXES = [
+    'ix_stock_ledger_date',
+    'ix_stock_ledger_product_id',
+    'ix_stock_ledger_location_id',
+    'ix_stock_ledger_operation_type',
+]
+
+
+def main():
+    with app.app_context():
+        engine = db.engine
+
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if is_ledger_partitioned(conn):
+            print("stock_ledger is partitioned; its indexes are created with the partitions")
+            print("Migration completed.")
+            return
+        for name, columns in NEW_INDEXES:
+            try:
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON stock_ledger ({columns})"))
+                print(f"Index {name} created or already exists")
+            except Exception as e:
+                print(f"Failed to create index {name}: {e}")
+        for name in OLD_INDEXES:
+            try:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                print(f"Index {name} dropped")
+            except Exception as e:
+                print(f"Failed to drop index {name}: {e}")
+
+    print("Migration completed.")
+
+
+if __name__ == '__main__':
+    main()
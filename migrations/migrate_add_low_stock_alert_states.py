@@ -0,0 +1,65 @@
+"""Migration script: create the `low_stock_alert_states` table.
+
+Run this once (while your virtualenv is active and DATABASE_URL is configured):
+
+    python migrations/migrate_add_low_stock_alert_states.py
+
+It creates `low_stock_alert_states` and seeds it with every product that is
+already at or below its min_stock, as if it had been alerted on at its
+current level. Products that were low before the upgrade therefore do not
+all alert on their next stock movement; they alert if they drop further past
+a user's threshold, or after they recover and fall again. Once the table
+exists the app keeps it current, so later runs (e.g. on every deploy) skip the
+seeding; re-seeding then would silence alerts that are still owed.
+"""
+import sys
+import os
+from datetime import datetime
+from sqlalchemy import inspect
+
+# Ensure project root is on sys.path so we can import app and models
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+# Prevent importing routes when importing app for migrations
+os.environ.setdefault('SKIP_IMPORT_ROUTE', '1')
+
+from app import db, app
+import models
+
+
+def main():
+    from sqlalchemy import func, literal, select
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+    with app.app_context():
+        engine = db.engine
+        if inspect(engine).has_table('low_stock_alert_states'):
+            print("low_stock_alert_states table already exists")
+        else:
+            try:
+                models.LowStockAlertState.__table__.create(bind=engine)
+                print("low_stock_alert_states table created")
+            except Exception as e:
+                print(f"Failed to create low_stock_alert_states table: {e}")
+                return
+
+            Product = models.Product
+            low = select(
+                Product.id,
+                func.greatest(Product.on_hand_total, 0) / Product.min_stock,
+                literal(datetime.utcnow()),
+            ).where(Product.min_stock > 0, Product.on_hand_total <= Product.min_stock)
+            result = db.session.execute(
+                pg_insert(models.LowStockAlertState)
+                .from_select(['product_id', 'low_water_ratio', 'updated_at'], low)
+                .on_conflict_do_nothing(index_elements=['product_id'])
+            )
+            db.session.commit()
+            print(f"Seeded alert state for {result.rowcount} low-stock products")
+
+    print("Migration completed.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Migration script: create the `notification_counters` table.
+
+Run this once (while your virtualenv is active and DATABASE_URL is configured):
+
+    python migrations/migrate_add_notification_counters.py
+
+It creates `notification_counters` and fills it with every user's current
+unread, unexpired notification count. Once the table exists the app keeps
+the counters current, so later runs (e.g. on every deploy) skip the backfill. Afterwards schedule
+`flask --app app notification-counts` every few minutes so notifications
+that expire drop off the counters.
+"""
+import sys
+import os
+from sqlalchemy import inspect
+
+# Ensure project root is on sys.path so we can import app and models
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+# Prevent importing routes when importing app for migrations
+os.environ.setdefault('SKIP_IMPORT_ROUTE', '1')
+
+from app import db, app
+import models
+
+
+def main():
+    from notification_counts import recompute_unread_counts
+
+    with app.app_context():
+        engine = db.engine
+        if inspect(engine).has_table('notification_counters'):
+            print("notification_counters table already exists")
+        else:
+            try:
+                models.NotificationCounter.__table__.create(bind=engine)
+                print("notification_counters table created")
+            except Exception as e:
+                print(f"Failed to create notification_counters table: {e}")
+                return
+
+            changed = recompute_unread_counts()
+            print(f"Backfilled {changed} unread counters")
+
+    print("Migration completed.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Migration script: indexes for per-user notification lists and the expiry purge.
+
+Run this once (while your virtualenv is active and DATABASE_URL is configured):
+
+    python migrations/migrate_add_notification_indexes.py
+
+It creates (user_id, created_at DESC) indexes on notifications, one of them
+partial on unread rows, and a partial expires_at index for the purge. Indexes
+are built CONCURRENTLY. Afterwards schedule
+`flask --app app purge-notifications` (e.g. hourly) so expired rows do not
+accumulate; the first run on a large table may take a while.
+"""
+import sys
+import os
+from sqlalchemy import text
+
+# Ensure project root is on sys.path so we can import app and models
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+# Prevent importing routes when importing app for migrations
+os.environ.setdefault('SKIP_IMPORT_ROUTE', '1')
+
+from app import db, app
+
+INDEXES = [
+    ('ix_notifications_user_created_at', 'notifications', 'user_id, created_at DESC', None),
+    ('ix_notifications_user_unread_created_at', 'notifications', 'user_id, created_at DESC', 'is_read = false'),
+    ('ix_notifications_expires_at', 'notifications', 'expires_at', 'expires_at IS NOT NULL'),
+]
+
+
+def main():
+    with app.app_context():
+        engine = db.engine
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for name, table, columns, where in INDEXES:
+            predicate = f" WHERE {where}" if where else ''
+            try:
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns}){predicate}"))
+                print(f"Index {name} created or already exists")
+            except Exception as e:
+                print(f"Failed to create index {name}: {e}")
+
+    print("Migration completed.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Migration script: indexes for the receipt/delivery/transfer list pages.
+
+Run this once (while your virtualenv is active and DATABASE_URL is configured):
+
+    python migrations/migrate_add_operation_list_indexes.py
+
+It creates (state, created_at) and (created_at) indexes on receipts,
+deliveries and transfers for the paginated, state-filtered lists, and
+indexes the line tables' document foreign keys used by the line count and
+quantity subqueries. Indexes are built CONCURRENTLY.
+"""
+import sys
+import os
+from sqlalchemy import text
+
+# Ensure project root is on sys.path so we can import app and models
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+# Prevent importing routes when importing app for migrations
+os.environ.setdefault('SKIP_IMPORT_ROUTE', '1')
+
+from app import db, app
+
+INDEXES = [
+    ('ix_receipts_state_created_at', 'receipts', 'state, created_at'),
+    ('ix_receipts_created_at', 'receipts', 'created_at'),
+    ('ix_deliveries_state_created_at', 'deliveries', 'state, created_at'),
+    ('ix_deliveries_created_at', 'deliveries', 'created_at'),
+    ('ix_transfers_state_created_at', 'transfers', 'state, created_at'),
+    ('ix_transfers_created_at', 'transfers', 'created_at'),
+    ('ix_receipt_lines_receipt_id', 'receipt_lines', 'receipt_id'),
+    ('ix_delivery_lines_delivery_id', 'delivery_lines', 'delivery_id'),
+    ('ix_transfer_lines_transfer_id', 'transfer_lines', 'transfer_id'),
+]
+
+
+def main():
+    with app.app_context():
+        engine = db.engine
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for name, table, columns in INDEXES:
+            try:
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"))
+                print(f"Index {name} created or already exists")
+            except Exception as e:
+                print(f"Failed to create index {name}: {e}")
+
+    print("Migration completed.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Migration script: indexes for sorting the product list.
+
+Run this once (while your virtualenv is active and DATABASE_URL is configured):
+
+    python migrations/migrate_add_product_list_indexes.py
+
+It creates the products.name and products.sale_price indexes used by the
+paginated product list when sorting by name or price (sorting by stock uses
+the existing on_hand_total index). Indexes are built CONCURRENTLY.
+"""
+import sys
+import os
+from sqlalchemy import text
+
+# Ensure project root is on sys.path so we can import app and models
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+# Prevent importing routes when importing app for migrations
+os.environ.setdefault('SKIP_IMPORT_ROUTE', '1')
+
+from app import db, app
+
+INDEXES = [
+    ('ix_products_name', 'name'),
+    ('ix_products_sale_price', 'sale_price'),
+]
+
+
+def main():
+    with app.app_context():
+        engine = db.engine
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for name, columns in INDEXES:
+            try:
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON products ({columns})"))
+                print(f"Index {name} created or already exists")
+            except Exception as e:
+                print(f"Failed to create index {name}: {e}")
+
+    print("Migration completed.")
+
+
+if __name__ == '__main__':
+    main()
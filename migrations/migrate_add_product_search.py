@@ -0,0 +1,56 @@
+"""Migration script: indexes for product search.
+
+Run this once (while your virtualenv is active and DATABASE_URL is configured):
+
+    python migrations/migrate_add_product_search.py
+
+It enables the pg_trgm extension (the database user needs permission to do
+so, or a superuser can run `CREATE EXTENSION pg_trgm` beforehand) and creates
+trigram GIN indexes on products.name and products.sku plus lower(sku) and
+lower(name) indexes for exact and prefix matches. Indexes are built CONCURRENTLY so
+the catalog stays writable.
+"""
+import sys
+import os
+from sqlalchemy import text
+
+# Ensure project root is on sys.path so we can import app and models
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+# Prevent importing routes when importing app for migrations
+os.environ.setdefault('SKIP_IMPORT_ROUTE', '1')
+
+from app import db, app
+
+INDEXES = [
+    ('ix_products_name_trgm', 'USING gin (name gin_trgm_ops)'),
+    ('ix_products_sku_trgm', 'USING gin (sku gin_trgm_ops)'),
+    ('ix_products_sku_lower', '(lower(sku) text_pattern_ops)'),
+    ('ix_products_name_lower', '(lower(name) text_pattern_ops)'),
+]
+
+
+def main():
+    with app.app_context():
+        engine = db.engine
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        try:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            print("Extension pg_trgm enabled")
+        except Exception as e:
+            print(f"Failed to enable pg_trgm: {e}")
+        for name, definition in INDEXES:
+            try:
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON products {definition}"))
+                print(f"Index {name} created or already exists")
+            except Exception as e:
+                print(f"Failed to create index {name}: {e}")
+
+    print("Migration completed.")
+
+
+if __name__ == '__main__':
+    main()
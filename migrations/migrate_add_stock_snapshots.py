@@ -0,0 +1,37 @@
+"""Migration script: create the `stock_snapshots` table.
+
+Run this once (while your virtualenv is active and DATABASE_URL is configured):
+
+    python migrations/migrate_add_stock_snapshots.py
+
+Snapshots are then taken with `flask --app app stock-snapshot` (e.g. nightly).
+"""
+import sys
+import os
+
+# Ensure project root is on sys.path so we can import app and models
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+# Prevent importing routes when importing app for migrations
+os.environ.setdefault('SKIP_IMPORT_ROUTE', '1')
+
+from app import db, app
+import models
+
+
+def main():
+    with app.app_context():
+        engine = db.engine
+
+    try:
+        models.StockSnapshot.__table__.create(bind=engine, checkfirst=True)
+        print("stock_snapshots table created or already exists")
+    except Exception as e:
+        print(f"Failed to create stock_snapshots table: {e}")
+
+    print("Migration completed.")
+
+
+if __name__ == '__main__':
+    main()
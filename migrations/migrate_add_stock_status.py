@@ -0,0 +1,76 @@
+"""Migration script: add `products.stock_status` and its partial index.
+
+Run this once, after migrate_add_stock_totals.py:
+
+    python migrations/migrate_add_stock_status.py
+
+It adds `stock_status` ('ok', 'low' or 'out') to `products` if it doesn't exist,
+backfills it from `on_hand_total`/`min_stock` in batches of products, and creates
+the partial index used by the low-stock and out-of-stock lists. Later runs skip
+the backfill (the posting engine keeps the column current); pass --backfill to
+recompute it anyway.
+"""
+import sys
+import os
+from sqlalchemy import text
+
+# Ensure project root is on sys.path so we can import app and models
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+# Prevent importing routes when importing app for migrations
+os.environ.setdefault('SKIP_IMPORT_ROUTE', '1')
+
+from app import db, app
+from migrations.migrate_add_pricing import column_exists, add_column
+
+BATCH_SIZE = 5000
+
+
+def backfill_status(engine):
+    """Recompute stock_status for every product, one id range at a time"""
+    with engine.connect() as conn:
+        max_id = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM products")).scalar()
+    for start in range(0, max_id + 1, BATCH_SIZE):
+        with engine.begin() as conn:
+            conn.execute(text("""
+                UPDATE products
+                SET stock_status = CASE
+                    WHEN on_hand_total <= 0 THEN 'out'
+                    WHEN min_stock > 0 AND on_hand_total <= min_stock THEN 'low'
+                    ELSE 'ok'
+                END
+                WHERE id >= :start AND id < :stop
+            """), {'start': start, 'stop': start + BATCH_SIZE})
+    print(f"Backfilled stock_status for products up to id {max_id}")
+
+
+def main(backfill=False):
+    """
+    Args:
+        backfill: Recompute the status even if the column already existed
+    """
+    with app.app_context():
+        engine = db.engine
+
+    if not column_exists(engine, 'products', 'stock_status'):
+        add_column(engine, 'products', "ALTER TABLE products ADD COLUMN stock_status VARCHAR(8) NOT NULL DEFAULT 'out'")
+        backfill = True
+    else:
+        print("Column products.stock_status already exists")
+
+    if backfill:
+        backfill_status(engine)
+    else:
+        print("Skipping backfill (pass --backfill to recompute the status)")
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_products_stock_alert ON products (stock_status) "
+            "WHERE stock_status IN ('low', 'out')"
+        ))
+    print("Migration completed.")
+
+
+if __name__ == '__main__':
+    main(backfill='--backfill' in sys.argv[1:])
@@ -0,0 +1,81 @@
+"""Migration script: add the materialized `products.on_hand_total` column.
+
+Run this once (while your virtualenv is active and DATABASE_URL is configured):
+
+    python migrations/migrate_add_stock_totals.py
+
+It adds `on_hand_total` to `products` if it doesn't exist, indexes it, and
+backfills it from `product_locations` in batches of products. Once the column
+exists the posting engine keeps it current, so later runs (e.g. the release
+step on every deploy) skip the backfill. To recompute the totals anyway:
+
+    python migrations/migrate_add_stock_totals.py --backfill
+"""
+import sys
+import os
+from sqlalchemy import text
+
+# Ensure project root is on sys.path so we can import app and models
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+# Prevent importing routes when importing app for migrations
+os.environ.setdefault('SKIP_IMPORT_ROUTE', '1')
+
+from app import db, app
+from migrations.migrate_add_pricing import column_exists, add_column
+
+BATCH_SIZE = 5000
+
+
+def backfill_totals(engine):
+    """
+    Recompute on_hand_total from product_locations, one id range at a time
+
+    Each batch locks its product rows in id order first, like the posting
+    engine (stock._update_on_hand_totals), so a posting running during the
+    backfill either commits before the batch reads its sums or adds its
+    delta after the batch has written them.
+    """
+    with engine.connect() as conn:
+        max_id = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM products")).scalar()
+    for start in range(0, max_id + 1, BATCH_SIZE):
+        with engine.begin() as conn:
+            conn.execute(text(
+                "SELECT id FROM products WHERE id >= :start AND id < :stop ORDER BY id FOR UPDATE"
+            ), {'start': start, 'stop': start + BATCH_SIZE})
+            conn.execute(text("""
+                UPDATE products p
+                SET on_hand_total = COALESCE(
+                    (SELECT SUM(pl.quantity) FROM product_locations pl WHERE pl.product_id = p.id), 0)
+                WHERE p.id >= :start AND p.id < :stop
+            """), {'start': start, 'stop': start + BATCH_SIZE})
+    print(f"Backfilled on_hand_total for products up to id {max_id}")
+
+
+def main(backfill=False):
+    """
+    Args:
+        backfill: Recompute the totals even if the column already existed
+    """
+    with app.app_context():
+        engine = db.engine
+
+    if not column_exists(engine, 'products', 'on_hand_total'):
+        add_column(engine, 'products', "ALTER TABLE products ADD COLUMN on_hand_total double precision NOT NULL DEFAULT 0")
+        backfill = True
+    else:
+        print("Column products.on_hand_total already exists")
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_products_on_hand_total ON products (on_hand_total)"))
+
+    if backfill:
+        backfill_totals(engine)
+    else:
+        print("Skipping backfill (pass --backfill to recompute the totals)")
+    print("Migration completed.")
+
+
+if __name__ == '__main__':
+    main(backfill='--backfill' in sys.argv[1:])
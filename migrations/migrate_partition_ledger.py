@@ -0,0 +1,151 @@
+"""Optional migration: convert `stock_ledger` to a monthly range-partitioned table.
+
+This is NOT part of migrations/upgrade.py; run it deliberately, e.g. during a
+quiet period:
+
+    python migrations/migrate_partition_ledger.py [--batch-size 50000] [--months-ahead 3]
+
+Steps:
+  1. Create `stock_ledger_partitioned` (same columns, PRIMARY KEY (id, date),
+     same foreign keys and indexes) PARTITION BY RANGE (date), with one
+     partition per month from the oldest entry to `--months-ahead` months
+     ahead. There is no default partition: it would make every new month's
+     partition scan it, and it rules out DETACH PARTITION CONCURRENTLY. A
+     ledger row dated outside the existing partitions (e.g. a document
+     backdated into an archived month) is rejected.
+  2. Copy existing rows in id batches, one short transaction per batch, while
+     the application keeps writing to the old table.
+  3. In one short transaction: lock the old table against writes, copy the
+     rows written since step 2, and swap the table, index and sequence names.
+
+The old table is kept as `stock_ledger_unpartitioned`; drop it once verified.
+Afterwards schedule `flask --app app ledger-partitions` monthly so upcoming
+partitions exist, and use `flask --app app ledger-archive --before YYYY-MM-DD`
+to detach old months.
+"""
+import sys
+import os
+import argparse
+from datetime import datetime
+from sqlalchemy import text
+
+# Ensure project root is on sys.path so we can import app and models
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+# Prevent importing routes when importing app for migrations
+os.environ.setdefault('SKIP_IMPORT_ROUTE', '1')
+
+from app import db, app
+import models
+from ledger import is_ledger_partitioned, create_month_partitions, _month_start, _next_month
+
+NEW_TABLE = 'stock_ledger_partitioned'
+OLD_TABLE = 'stock_ledger_unpartitioned'
+
+
+def create_partitioned_table(conn, months_ahead):
+    """Step 1: partitioned copy of the table definition, with partitions and indexes"""
+    conn.execute(text(f"""
+        CREATE TABLE {NEW_TABLE} (
+            LIKE stock_ledger INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+            PRIMARY KEY (id, date),
+            FOREIGN KEY (product_id) REFERENCES products (id),
+            FOREIGN KEY (location_id) REFERENCES locations (id),
+            FOREIGN KEY (partner_id) REFERENCES partners (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        ) PARTITION BY RANGE (date)
+    """))
+
+    oldest = conn.execute(text("SELECT MIN(date) FROM stock_ledger")).scalar() or datetime.utcnow()
+    last = _month_start(datetime.utcnow())
+    for _ in range(months_ahead):
+        last = _next_month(last)
+    names = create_month_partitions(conn, oldest, last, parent=NEW_TABLE)
+    print(f"Created {len(names)} monthly partitions ({names[0]} .. {names[-1]})")
+
+    # Indexes on the parent cascade to every partition. They get a temporary
+    # suffix and take the model's names at swap time.
+    for index in models.StockLedger.__table__.indexes:
+        columns = ', '.join(c.name for c in index.columns)
+        conn.execute(text(f"CREATE INDEX {index.name}_p ON {NEW_TABLE} ({columns})"))
+
+
+def copy_rows(engine, batch_size):
+    """Step 2: copy rows in id batches; returns the highest id copied"""
+    with engine.connect() as conn:
+        max_id = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM stock_ledger")).scalar()
+
+    copied = 0
+    for lo in range(0, max_id, batch_size):
+        with engine.begin() as conn:
+            result = conn.execute(text(
+                f"INSERT INTO {NEW_TABLE} SELECT * FROM stock_ledger WHERE id > :lo AND id <= :hi"
+            ), {'lo': lo, 'hi': lo + batch_size})
+            copied += result.rowcount
+        print(f"  copied ids up to {min(lo + batch_size, max_id)} ({copied} rows)")
+    return max_id
+
+
+def swap_tables(engine, copied_up_to):
+    """Step 3: catch up on new rows and swap names under a short write lock"""
+    with engine.begin() as conn:
+        conn.execute(text("SET LOCAL lock_timeout = '10s'"))
+        conn.execute(text("LOCK TABLE stock_ledger IN EXCLUSIVE MODE"))
+        result = conn.execute(text(
+            f"INSERT INTO {NEW_TABLE} SELECT * FROM stock_ledger WHERE id > :lo"
+        ), {'lo': copied_up_to})
+        print(f"  caught up {result.rowcount} rows written during the copy")
+
+        old_indexes = [row.indexname for row in conn.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = 'stock_ledger'"
+        ))]
+        conn.execute(text(f"ALTER TABLE stock_ledger RENAME TO {OLD_TABLE}"))
+        for name in old_indexes:
+            conn.execute(text(f"ALTER INDEX {name} RENAME TO {name}_unpartitioned"))
+
+        conn.execute(text(f"ALTER TABLE {NEW_TABLE} RENAME TO stock_ledger"))
+        for index in models.StockLedger.__table__.indexes:
+            conn.execute(text(f"ALTER INDEX {index.name}_p RENAME TO {index.name}"))
+        # Keep the id sequence alive when the old table is dropped
+        conn.execute(text("ALTER SEQUENCE stock_ledger_id_seq OWNED BY stock_ledger.id"))
+
+        partitions = [row.relname for row in conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = 'stock_ledger' "
+            f"AND c.relname LIKE '{NEW_TABLE}_p%'"
+        ))]
+        for name in partitions:
+            conn.execute(text(f"ALTER TABLE {name} RENAME TO {name.replace(NEW_TABLE, 'stock_ledger', 1)}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert stock_ledger to monthly partitions')
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--months-ahead', type=int, default=3)
+    args = parser.parse_args()
+
+    with app.app_context():
+        engine = db.engine
+
+    with engine.connect() as conn:
+        if is_ledger_partitioned(conn):
+            print("stock_ledger is already partitioned")
+            return
+
+    print("Creating partitioned table...")
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {NEW_TABLE} CASCADE"))
+        create_partitioned_table(conn, args.months_ahead)
+
+    print("Copying rows...")
+    copied_up_to = copy_rows(engine, args.batch_size)
+
+    print("Swapping tables...")
+    swap_tables(engine, copied_up_to)
+
+    print(f"Migration completed. The old table is kept as {OLD_TABLE}; drop it once verified.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Run every schema migration in order.
+
+    python migrations/upgrade.py
+
+Each migration is idempotent, so this is safe to run on every deploy (see the
+`release` line in the Procfile). Add new migrations to MIGRATIONS in order.
+"""
+import sys
+import os
+import importlib
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+os.environ.setdefault('SKIP_IMPORT_ROUTE', '1')
+
+MIGRATIONS = [
+    'migrations.migrate_add_pricing',
+    'migrations.migrate_add_stock_totals',
+    'migrations.migrate_add_stock_status',
+    'migrations.migrate_add_document_sequences',
+    'migrations.migrate_add_ledger_indexes',
+    'migrations.migrate_add_stock_snapshots',
+    'migrations.migrate_add_product_search',
+    'migrations.migrate_add_product_list_indexes',
+    'migrations.migrate_add_operation_list_indexes',
+    'migrations.migrate_add_notification_counters',
+    'migrations.migrate_add_email_outbox',
+    'migrations.migrate_add_notification_indexes',
+    'migrations.migrate_add_low_stock_alert_states',
+]
+
+
+def main():
+    for name in MIGRATIONS:
+        print(f"== {name}")
+        importlib.import_module(name).main()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,9 @@ StockMaster Database Models
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import DDL, and_, event, func, select
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import column_property
 from datetime import datetime
 
 # Import db from app to avoid circular import
@@ -66,12 +69,29 @@ class Category(db.Model):
         return f'<Category {self.name}>'
 
 
+# Stock statuses stored on products.stock_status. 'low' and 'out' are the
+# alert statuses covered by the partial index ix_products_stock_alert.
+STOCK_STATUS_OK = 'ok'
+STOCK_STATUS_LOW = 'low'
+STOCK_STATUS_OUT = 'out'
+STOCK_ALERT_STATUSES = (STOCK_STATUS_LOW, STOCK_STATUS_OUT)
+
+
+def stock_status_for(total, min_stock):
+    """Stock status for a total/min_stock pair (see stock.stock_status_case for the SQL version)"""
+    if (total or 0) <= 0:
+        return STOCK_STATUS_OUT
+    if (min_stock or 0) > 0 and total <= min_stock:
+        return STOCK_STATUS_LOW
+    return STOCK_STATUS_OK
+
+
 class Product(db.Model):
     """Product model"""
     __tablename__ = 'products'
     
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(200), nullable=False)
+    name = db.Column(db.String(200), nullable=False, index=True)
     sku = db.Column(db.String(50), unique=True, nullable=False, index=True)
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'))
     uom = db.Column(db.String(20), default='Unit')  # Unit of Measure
@@ -80,8 +100,12 @@ class Product(db.Model):
     reorder_qty = db.Column(db.Float, default=0.0)
     # Pricing
     cost_price = db.Column(db.Float, default=0.0)
-    sale_price = db.Column(db.Float, default=0.0)
+    sale_price = db.Column(db.Float, default=0.0, index=True)
     currency = db.Column(db.String(8), default='INR')
+    # Sum of product_locations.quantity, maintained by the stock posting engine
+    on_hand_total = db.Column(db.Float, default=0.0, server_default='0', nullable=False, index=True)
+    # ok / low / out, recomputed for the products touched by each stock posting
+    stock_status = db.Column(db.String(8), default=STOCK_STATUS_OUT, server_default=STOCK_STATUS_OUT, nullable=False)
     active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -93,15 +117,51 @@ class Product(db.Model):
     adjustments = db.relationship('Adjustment', backref='product', lazy=True)
     ledger_entries = db.relationship('StockLedger', backref='product', lazy=True)
     
-    @property
+    __table_args__ = (
+        db.Index('ix_products_stock_alert', 'stock_status',
+                 postgresql_where=db.text("stock_status IN ('low', 'out')")),
+        # Product search (see search.py): trigram indexes for substring
+        # matches, lower(sku)/lower(name) for exact and prefix matches
+        db.Index('ix_products_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_products_sku_trgm', 'sku', postgresql_using='gin',
+                 postgresql_ops={'sku': 'gin_trgm_ops'}),
+        db.Index('ix_products_sku_lower', func.lower(sku).label('sku_lower'),
+                 postgresql_ops={'sku_lower': 'text_pattern_ops'}),
+        db.Index('ix_products_name_lower', func.lower(name).label('name_lower'),
+                 postgresql_ops={'name_lower': 'text_pattern_ops'}),
+    )
+    
+    @hybrid_property
     def total_stock(self):
-        """Calculate total stock across all locations"""
-        return sum(loc.quantity for loc in self.locations)
+        """Total stock across all locations"""
+        return self.on_hand_total or 0.0
     
-    @property
+    @total_stock.expression
+    def total_stock(cls):
+        return cls.on_hand_total
+    
+    @hybrid_property
     def low_stock(self):
         """Check if product is low on stock"""
-        return self.min_stock > 0 and self.total_stock <= self.min_stock
+        return (self.min_stock or 0) > 0 and self.total_stock <= self.min_stock
+    
+    @low_stock.expression
+    def low_stock(cls):
+        return and_(cls.stock_status.in_(STOCK_ALERT_STATUSES), cls.min_stock > 0)
+    
+    @hybrid_property
+    def out_of_stock(self):
+        """Check if product has no stock at all"""
+        return self.total_stock <= 0
+    
+    @out_of_stock.expression
+    def out_of_stock(cls):
+        return cls.stock_status == STOCK_STATUS_OUT
+    
+    def refresh_stock_status(self):
+        """Recompute stock_status after min_stock or on_hand_total changed in Python"""
+        self.stock_status = stock_status_for(self.on_hand_total, self.min_stock)
     
     def get_stock_by_location(self, location_id):
         """Get stock quantity for a specific location"""
@@ -113,32 +173,18 @@ class Product(db.Model):
     
     def update_stock_location(self, location_id, quantity):
         """Update stock for a specific location"""
-        location = ProductLocation.query.filter_by(
-            product_id=self.id,
-            location_id=location_id
-        ).first()
-        
-        if location:
-            new_qty = location.quantity + quantity
-            if new_qty < 0:
-                raise ValueError(f'Insufficient stock. Available: {location.quantity}, Required: {abs(quantity)}')
-            location.quantity = new_qty
-        else:
-            if quantity < 0:
-                raise ValueError(f'Insufficient stock. Available: 0, Required: {abs(quantity)}')
-            location = ProductLocation(
-                product_id=self.id,
-                location_id=location_id,
-                quantity=quantity
-            )
-            db.session.add(location)
-        
+        from stock import apply_stock_deltas
+        apply_stock_deltas({(self.id, location_id): quantity})
         db.session.commit()
     
     def __repr__(self):
         return f'<Product {self.name}>'
 
 
+# The trigram indexes need pg_trgm; create it along with the table
+event.listen(Product.__table__, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+
+
 class Location(db.Model):
     """Location model (within warehouses)"""
     __tablename__ = 'locations'
@@ -191,6 +237,12 @@ class Receipt(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        # List pages: newest first, optionally filtered by state
+        db.Index('ix_receipts_state_created_at', 'state', 'created_at'),
+        db.Index('ix_receipts_created_at', 'created_at'),
+    )
+    
     # Relationships
     supplier = db.relationship('Partner', foreign_keys=[supplier_id])
     warehouse = db.relationship('Warehouse')
@@ -215,7 +267,7 @@ class ReceiptLine(db.Model):
     __tablename__ = 'receipt_lines'
     
     id = db.Column(db.Integer, primary_key=True)
-    receipt_id = db.Column(db.Integer, db.ForeignKey('receipts.id'), nullable=False)
+    receipt_id = db.Column(db.Integer, db.ForeignKey('receipts.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Float, nullable=False)
     received_qty = db.Column(db.Float, default=0.0)
@@ -239,6 +291,12 @@ class Delivery(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        # List pages: newest first, optionally filtered by state
+        db.Index('ix_deliveries_state_created_at', 'state', 'created_at'),
+        db.Index('ix_deliveries_created_at', 'created_at'),
+    )
+    
     # Relationships
     customer = db.relationship('Partner', foreign_keys=[customer_id])
     warehouse = db.relationship('Warehouse')
@@ -263,7 +321,7 @@ class DeliveryLine(db.Model):
     __tablename__ = 'delivery_lines'
     
     id = db.Column(db.Integer, primary_key=True)
-    delivery_id = db.Column(db.Integer, db.ForeignKey('deliveries.id'), nullable=False)
+    delivery_id = db.Column(db.Integer, db.ForeignKey('deliveries.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Float, nullable=False)
     picked_qty = db.Column(db.Float, default=0.0)
@@ -287,6 +345,12 @@ class Transfer(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        # List pages: newest first, optionally filtered by state
+        db.Index('ix_transfers_state_created_at', 'state', 'created_at'),
+        db.Index('ix_transfers_created_at', 'created_at'),
+    )
+    
     # Relationships
     source_location = db.relationship('Location', foreign_keys=[source_location_id])
     destination_location = db.relationship('Location', foreign_keys=[destination_location_id])
@@ -310,7 +374,7 @@ class TransferLine(db.Model):
     __tablename__ = 'transfer_lines'
     
     id = db.Column(db.Integer, primary_key=True)
-    transfer_id = db.Column(db.Integer, db.ForeignKey('transfers.id'), nullable=False)
+    transfer_id = db.Column(db.Integer, db.ForeignKey('transfers.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Float, nullable=False)
     
@@ -318,6 +382,24 @@ class TransferLine(db.Model):
         return f'<TransferLine {self.id}>'
 
 
+# Line count and quantity per document, computed in SQL. Deferred: list
+# pages load them with undefer() in the same query instead of loading every
+# line collection; total_products/total_quantity still work from `lines`.
+for _document, _line, _fk in ((Receipt, ReceiptLine, ReceiptLine.receipt_id),
+                              (Delivery, DeliveryLine, DeliveryLine.delivery_id),
+                              (Transfer, TransferLine, TransferLine.transfer_id)):
+    _document.line_count = column_property(
+        select(func.count(_line.id)).where(_fk == _document.id).correlate_except(_line).scalar_subquery(),
+        deferred=True,
+    )
+    _document.line_quantity = column_property(
+        select(func.coalesce(func.sum(_line.quantity), 0.0)).where(_fk == _document.id)
+        .correlate_except(_line).scalar_subquery(),
+        deferred=True,
+    )
+del _document, _line, _fk
+
+
 class Adjustment(db.Model):
     """Stock Adjustment model"""
     __tablename__ = 'adjustments'
@@ -368,15 +450,46 @@ class Partner(db.Model):
         return f'<Partner {self.name}>'
 
 
+class StockSnapshot(db.Model):
+    """Quantity per product and location from ledger rows dated before snapshot_date"""
+    __tablename__ = 'stock_snapshots'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    snapshot_date = db.Column(db.DateTime, nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), nullable=False)
+    quantity = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('snapshot_date', 'product_id', 'location_id', name='unique_stock_snapshot'),
+        db.Index('ix_stock_snapshots_product_location_date', 'product_id', 'location_id', 'snapshot_date'),
+    )
+    
+    def __repr__(self):
+        return f'<StockSnapshot {self.snapshot_date} {self.product_id}-{self.location_id}: {self.quantity}>'
+
+
+class DocumentSequence(db.Model):
+    """Last number handed out per document prefix (REC, DEL, TRF, ADJ)"""
+    __tablename__ = 'document_sequences'
+    
+    prefix = db.Column(db.String(10), primary_key=True)
+    last_value = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<DocumentSequence {self.prefix}: {self.last_value}>'
+
+
 class StockLedger(db.Model):
     """Stock Ledger (Audit Trail)"""
     __tablename__ = 'stock_ledger'
     
     id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
-    location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), nullable=False, index=True)
-    operation_type = db.Column(db.String(20), nullable=False, index=True)  # receipt, delivery, transfer_in, transfer_out, adjustment
+    date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    location_id = db.Column(db.Integer, db.ForeignKey('locations.id'), nullable=False)
+    operation_type = db.Column(db.String(20), nullable=False)  # receipt, delivery, transfer_in, transfer_out, adjustment
     reference = db.Column(db.String(50), nullable=False, index=True)
     quantity_in = db.Column(db.Float, default=0.0)
     quantity_out = db.Column(db.Float, default=0.0)
@@ -390,6 +503,16 @@ class StockLedger(db.Model):
     partner = db.relationship('Partner')
     user = db.relationship('User')
     
+    # Composite indexes matching the keyset pagination order (date DESC, id DESC)
+    # for each ledger filter; they also replace the old single-column indexes.
+    __table_args__ = (
+        db.Index('ix_stock_ledger_date_id', 'date', 'id'),
+        db.Index('ix_stock_ledger_product_date_id', 'product_id', 'date', 'id'),
+        db.Index('ix_stock_ledger_product_location_date_id', 'product_id', 'location_id', 'date', 'id'),
+        db.Index('ix_stock_ledger_location_date_id', 'location_id', 'date', 'id'),
+        db.Index('ix_stock_ledger_operation_date_id', 'operation_type', 'date', 'id'),
+    )
+    
     def __repr__(self):
         return f'<StockLedger {self.reference}>'
 
@@ -403,7 +526,9 @@ class Notification(db.Model):
     title = db.Column(db.String(200), nullable=False)
     message = db.Column(db.Text, nullable=False)
     notification_type = db.Column(db.String(50), nullable=False)  # low_stock, operation_completed, alert, system
-    is_read = db.Column(db.Boolean, default=False, index=True)
+    # active_history: the unread counter listener needs the previous value
+    # even when the attribute was expired by a commit
+    is_read = column_property(db.Column(db.Boolean, default=False, index=True), active_history=True)
     related_model = db.Column(db.String(50))  # e.g., 'product', 'receipt', 'delivery'
     related_id = db.Column(db.Integer)  # ID of related object
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
@@ -413,6 +538,18 @@ class Notification(db.Model):
     # Relationships
     user = db.relationship('User', backref='notifications')
     
+    # Newest-first lists per user (/notifications, the navbar dropdown). A
+    # partial index cannot test expires_at against now(); instead expired rows
+    # are deleted by purge_expired_notifications(), so these indexes only hold
+    # live rows plus whatever expired since the last purge.
+    __table_args__ = (
+        db.Index('ix_notifications_user_created_at', 'user_id', created_at.desc()),
+        db.Index('ix_notifications_user_unread_created_at', 'user_id', created_at.desc(),
+                 postgresql_where=db.text('is_read = false')),
+        db.Index('ix_notifications_expires_at', 'expires_at',
+                 postgresql_where=db.text('expires_at IS NOT NULL')),
+    )
+    
     def __repr__(self):
         return f'<Notification {self.id}: {self.title}>'
     
@@ -430,6 +567,37 @@ class Notification(db.Model):
         return False
 
 
+class NotificationCounter(db.Model):
+    """Per-user unread notification count, maintained by notification_counts.py"""
+    __tablename__ = 'notification_counters'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    unread_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<NotificationCounter {self.user_id}: {self.unread_count}>'
+
+
+class LowStockAlertState(db.Model):
+    """
+    Low-stock alert memory for one product, maintained by stock_alerts.py
+
+    A row exists while the product's stock is at or below min_stock (from
+    the first posting that took it there until one takes it back above).
+    """
+    __tablename__ = 'low_stock_alert_states'
+    
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    # Lowest on_hand_total / min_stock seen since the product last recovered;
+    # users whose threshold is above it have already been alerted
+    low_water_ratio = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<LowStockAlertState {self.product_id}: {self.low_water_ratio}>'
+
+
 class NotificationPreference(db.Model):
     """User notification preferences"""
     __tablename__ = 'notification_preferences'
@@ -471,3 +639,29 @@ class PriceHistory(db.Model):
     def __repr__(self):
         return f'<PriceHistory {self.product_id} @ {self.created_at}>'
 
+
+class EmailOutbox(db.Model):
+    """Queued outgoing email, delivered by the email worker (see email_outbox.py)"""
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        # The worker's claim query only looks at messages still to be sent
+        db.Index('ix_email_outbox_pending', 'next_attempt_at', 'id',
+                 postgresql_where=db.text("status = 'pending'")),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(255))  # None: MAIL_DEFAULT_SENDER at send time
+    recipients = db.Column(db.JSON, nullable=False)
+    text_body = db.Column(db.Text, nullable=False)
+    html_body = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime)  # None: retry until EMAIL_MAX_ATTEMPTS
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<EmailOutbox {self.id}: {self.status}>'
@@ -0,0 +1,254 @@
+"""
+StockMaster Unread Notification Counters
+"""
+
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import Integer, column, event, func, inspect, select, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app import db
+from models import User, Notification, NotificationCounter
+
+# notification_counters.unread_count is the number of unread notifications
+# that had not expired when the counter was last corrected. It is changed in
+# the same transaction as the notifications themselves: ORM inserts, read
+# flags and deletes through the after_flush listener below, bulk statements
+# through adjust_unread_counts()/clear_unread_count().
+
+# PostgreSQL NOTIFY channel carrying comma-separated ids of users whose
+# notifications changed; delivered on commit (see notification_stream.py)
+NOTIFY_CHANNEL = 'notification_events'
+
+_lock = threading.Lock()
+# user_id -> (count, expires_at monotonic)
+_cache = {}
+
+
+def _is_live(notification, now):
+    return notification.expires_at is None or notification.expires_at > now
+
+
+def _invalidate_on_commit(session, user_ids):
+    session.info.setdefault('unread_users', set()).update(user_ids)
+
+
+def notify_users(connection, user_ids):
+    """Queue a NOTIFY for `user_ids`; PostgreSQL only delivers it if the transaction commits"""
+    ids = [str(user_id) for user_id in sorted(set(user_ids))]
+    # NOTIFY payloads are limited to 8000 bytes
+    for start in range(0, len(ids), 500):
+        connection.execute(select(func.pg_notify(NOTIFY_CHANNEL, ','.join(ids[start:start + 500]))))
+
+
+def forget_cached_counts(user_ids):
+    """Drop this worker's cached counts for `user_ids`"""
+    with _lock:
+        for user_id in user_ids:
+            _cache.pop(user_id, None)
+
+
+def _apply_deltas(connection, deltas):
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    counters = NotificationCounter.__table__
+
+    def apply(user_ids):
+        v = values(column('user_id', Integer), column('delta', Integer), name='v').data(
+            [(user_id, deltas[user_id]) for user_id in sorted(user_ids)]
+        )
+        return set(connection.execute(
+            update(counters)
+            .where(counters.c.user_id == v.c.user_id)
+            .values(unread_count=func.greatest(counters.c.unread_count + v.c.delta, 0),
+                    updated_at=datetime.utcnow())
+            .returning(counters.c.user_id)
+        ).scalars())
+
+    # Users without a counter row get one counted from the committed
+    # notifications (which exclude this transaction's changes), then the
+    # delta is applied to it like to any other row
+    missing = set(deltas) - apply(deltas)
+    if missing:
+        for user_id in sorted(missing):
+            _create_counter(user_id)
+        apply(missing)
+    notify_users(connection, deltas)
+
+
+def adjust_unread_counts(deltas):
+    """
+    Apply per-user unread count changes in the current transaction
+
+    For bulk statements the flush listener cannot see (multi-row inserts,
+    query updates/deletes).
+
+    Args:
+        deltas: Dict mapping user_id to a signed change in unread notifications
+    """
+    _apply_deltas(db.session, deltas)
+    _invalidate_on_commit(db.session, deltas)
+
+
+def clear_unread_count(user_id):
+    """
+    Set a user's counter to 0 in the current transaction
+
+    Call this before marking all of the user's notifications read: the row
+    lock it takes makes notifications created concurrently either land
+    before (and get marked read) or wait and count afterwards.
+    """
+    db.session.execute(
+        pg_insert(NotificationCounter).values(user_id=user_id, unread_count=0, updated_at=datetime.utcnow())
+        .on_conflict_do_update(index_elements=['user_id'],
+                               set_={'unread_count': 0, 'updated_at': datetime.utcnow()})
+    )
+    notify_users(db.session, [user_id])
+    _invalidate_on_commit(db.session, [user_id])
+
+
+@event.listens_for(db.session, 'after_flush')
+def _count_flushed_notifications(session, flush_context):
+    now = datetime.utcnow()
+    deltas = {}
+    for obj in session.new:
+        if isinstance(obj, Notification) and not obj.is_read and _is_live(obj, now):
+            deltas[obj.user_id] = deltas.get(obj.user_id, 0) + 1
+    for obj in session.deleted:
+        if isinstance(obj, Notification) and not obj.is_read and _is_live(obj, now):
+            deltas[obj.user_id] = deltas.get(obj.user_id, 0) - 1
+    for obj in session.dirty:
+        if not isinstance(obj, Notification) or not _is_live(obj, now):
+            continue
+        history = inspect(obj).attrs.is_read.history
+        if not history.added:
+            continue
+        was_read = bool(history.deleted[0]) if history.deleted else False
+        if bool(history.added[0]) != was_read:
+            deltas[obj.user_id] = deltas.get(obj.user_id, 0) + (-1 if history.added[0] else 1)
+
+    if any(deltas.values()):
+        _apply_deltas(session.connection(), deltas)
+        _invalidate_on_commit(session, deltas)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _drop_cached_counts(session):
+    user_ids = session.info.pop('unread_users', None)
+    if user_ids:
+        forget_cached_counts(user_ids)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_pending_counts(session):
+    session.info.pop('unread_users', None)
+
+
+def _unread_clause(now):
+    return (Notification.is_read == False) & ((Notification.expires_at == None) | (Notification.expires_at > now))
+
+
+def _count_unread(user_ids=None):
+    """Authoritative unread, unexpired counts per user (users without any are omitted)"""
+    stmt = select(Notification.user_id, func.count()).where(
+        _unread_clause(datetime.utcnow())
+    ).group_by(Notification.user_id)
+    if user_ids is not None:
+        stmt = stmt.where(Notification.user_id.in_(user_ids))
+    return dict(db.session.execute(stmt).all())
+
+
+def _create_counter(user_id):
+    """
+    Create a user's counter row from a COUNT and return its value
+
+    Runs and commits in its own transaction, so the count covers committed
+    notifications only and the caller's pending work is left alone. Every
+    notification change applies its delta to an existing row, calling this
+    first when there is none. A change that commits after this COUNT was
+    taken therefore still adds its delta to the row. If another transaction
+    creates the row first, the insert here waits for it, does nothing, and
+    the committed row is read back.
+    """
+    counters = NotificationCounter.__table__
+    with db.engine.begin() as conn:
+        count = conn.execute(
+            select(func.count()).select_from(Notification)
+            .where(Notification.user_id == user_id, _unread_clause(datetime.utcnow()))
+        ).scalar()
+        conn.execute(
+            pg_insert(counters).values(user_id=user_id, unread_count=count, updated_at=datetime.utcnow())
+            .on_conflict_do_nothing(index_elements=['user_id'])
+        )
+        return conn.execute(select(counters.c.unread_count).where(counters.c.user_id == user_id)).scalar()
+
+
+def get_unread_count(user_id):
+    """
+    Unread notification count for the navbar badge
+
+    Served from an in-process cache for UNREAD_COUNT_CACHE_TTL seconds;
+    changes committed by this worker drop the user's entry immediately.
+    Otherwise a primary-key lookup of the user's counter row, which is
+    created from a COUNT the first time.
+    """
+    ttl = current_app.config.get('UNREAD_COUNT_CACHE_TTL', 10)
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get(user_id)
+        if cached and now < cached[1]:
+            return cached[0]
+
+    count = db.session.execute(
+        select(NotificationCounter.unread_count).where(NotificationCounter.user_id == user_id)
+    ).scalar()
+    if count is None:
+        count = _create_counter(user_id)
+
+    with _lock:
+        _cache[user_id] = (count, now + ttl)
+    return count
+
+
+def recompute_unread_counts(user_ids=None):
+    """
+    Correct counters from the notifications table and commit
+
+    Run periodically: counters are not decremented when notifications
+    expire, so this is what takes expired unread notifications off the
+    badge. Counter rows are locked first so that concurrent changes wait
+    rather than being overwritten.
+
+    Args:
+        user_ids: Only correct these users' counters (default: every user)
+
+    Returns:
+        Number of counters that changed
+    """
+    locked = select(NotificationCounter.user_id).order_by(NotificationCounter.user_id).with_for_update()
+    current = select(NotificationCounter.user_id, NotificationCounter.unread_count)
+    if user_ids is not None:
+        user_ids = sorted(set(user_ids))
+        locked = locked.where(NotificationCounter.user_id.in_(user_ids))
+        current = current.where(NotificationCounter.user_id.in_(user_ids))
+    db.session.execute(locked).all()
+    counts = _count_unread(user_ids)
+    current = dict(db.session.execute(current).all())
+    if user_ids is None:
+        user_ids = db.session.execute(select(User.id)).scalars().all()
+
+    rows = [{'user_id': user_id, 'unread_count': counts.get(user_id, 0), 'updated_at': datetime.utcnow()}
+            for user_id in user_ids if current.get(user_id) != counts.get(user_id, 0)]
+    if rows:
+        stmt = pg_insert(NotificationCounter).values(rows)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['user_id'],
+            set_={'unread_count': stmt.excluded.unread_count, 'updated_at': stmt.excluded.updated_at},
+        ))
+        _invalidate_on_commit(db.session, [row['user_id'] for row in rows])
+        notify_users(db.session, [row['user_id'] for row in rows])
+    db.session.commit()
+    return len(rows)
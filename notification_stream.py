@@ -0,0 +1,158 @@
+"""
+StockMaster Notification Stream (Server-Sent Events)
+"""
+
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+from flask import current_app
+
+from app import app, db
+from notification_counts import NOTIFY_CHANNEL, forget_cached_counts
+
+logger = logging.getLogger(__name__)
+
+# Comment line sent when nothing happened, so proxies keep the connection open
+KEEPALIVE = ': keepalive\n\n'
+
+_lock = threading.Lock()
+# user_id -> set of queue.Queue, one per open stream in this worker
+_subscribers = {}
+_listener_pid = None
+# Streams currently open in this worker (each one holds a request thread)
+_open_streams = 0
+
+
+def _publish(user_ids):
+    """Wake every open stream of `user_ids` in this worker"""
+    forget_cached_counts(user_ids)
+    with _lock:
+        queues = [q for user_id in user_ids for q in _subscribers.get(user_id, ())]
+    for q in queues:
+        q.put_nowait(True)
+
+
+def _listen_forever():
+    """
+    Background thread: LISTEN on NOTIFY_CHANNEL and fan events out in-process
+
+    Uses its own connection, detached from the pool. Reconnects with a short
+    backoff if the connection drops.
+    """
+    while True:
+        try:
+            with app.app_context():
+                raw = db.engine.raw_connection()
+            raw.detach()
+            conn = raw.dbapi_connection
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {NOTIFY_CHANNEL}')
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                user_ids = set()
+                while conn.notifies:
+                    payload = conn.notifies.pop(0).payload
+                    user_ids.update(int(user_id) for user_id in payload.split(',') if user_id)
+                if user_ids:
+                    _publish(user_ids)
+        except Exception:
+            logger.exception('Notification listener failed; reconnecting')
+            time.sleep(5)
+
+
+def _ensure_listener():
+    """Start the LISTEN thread once per worker process"""
+    global _listener_pid
+    with _lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+        # A forked worker inherits the parent's subscriber table but not its thread
+        _subscribers.clear()
+    threading.Thread(target=_listen_forever, name='notification-listener', daemon=True).start()
+
+
+def acquire_stream_slot():
+    """
+    Reserve one of this worker's NOTIFICATION_STREAMS_PER_WORKER stream slots
+
+    Every open stream holds a request thread for up to
+    NOTIFICATION_STREAM_SECONDS, so without a cap enough open tabs would take
+    all of a worker's threads and ordinary pages would queue behind them.
+
+    Returns:
+        True if a slot was reserved (release it with release_stream_slot()),
+        False if the worker is full and the client should poll instead
+    """
+    global _open_streams
+    limit = current_app.config.get('NOTIFICATION_STREAMS_PER_WORKER', 4)
+    with _lock:
+        if _open_streams >= limit:
+            return False
+        _open_streams += 1
+        return True
+
+
+def release_stream_slot():
+    global _open_streams
+    with _lock:
+        _open_streams = max(_open_streams - 1, 0)
+
+
+def _event(payload):
+    return f'event: notifications\ndata: {json.dumps(payload)}\n\n'
+
+
+def notification_events(user_id, build_payload):
+    """
+    Generator of SSE messages for one user's open stream
+
+    Sends the current state at once, then again whenever the user's
+    notifications change (PostgreSQL NOTIFY, delivered on commit by any
+    worker), with keepalive comments in between. The stream ends after
+    NOTIFICATION_STREAM_SECONDS; the browser reconnects after `retry`.
+    The database session is released after each message, so an idle
+    stream holds no connection.
+
+    Args:
+        user_id: Current user's id
+        build_payload: Callable returning the JSON-serialisable state
+    """
+    _ensure_listener()
+    lifetime = current_app.config.get('NOTIFICATION_STREAM_SECONDS', 300)
+    keepalive = current_app.config.get('NOTIFICATION_STREAM_KEEPALIVE', 20)
+
+    q = queue.Queue()
+    with _lock:
+        _subscribers.setdefault(user_id, set()).add(q)
+    try:
+        yield 'retry: 3000\n\n'
+        yield _event(build_payload())
+        db.session.remove()
+
+        deadline = time.monotonic() + lifetime
+        while time.monotonic() < deadline:
+            try:
+                q.get(timeout=min(keepalive, max(deadline - time.monotonic(), 0.1)))
+            except queue.Empty:
+                yield KEEPALIVE
+                continue
+            # Collapse a burst of changes into one message
+            while not q.empty():
+                q.get_nowait()
+            yield _event(build_payload())
+            db.session.remove()
+    finally:
+        with _lock:
+            subscribers = _subscribers.get(user_id)
+            if subscribers:
+                subscribers.discard(q)
+                if not subscribers:
+                    del _subscribers[user_id]
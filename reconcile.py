@@ -0,0 +1,182 @@
+"""
+StockMaster Ledger vs Stock Reconciliation
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from sqlalchemy import func, insert, select, tuple_, union_all
+
+from app import app, db
+from models import Product, ProductLocation, StockLedger, StockSnapshot
+from stock import lock_stock_rows
+from ledger import is_ledger_partitioned, attached_ledger_months
+
+# Differences below this are float noise, not drift
+TOLERANCE = 1e-6
+
+
+def reconciliation_base():
+    """
+    Snapshot date the ledger is summed from, or None for the whole ledger
+
+    Once stock_ledger is partitioned, old months may have been detached or
+    dropped by `ledger-archive`, so the attached ledger alone no longer adds
+    up to the stock. Reconciliation then starts from the oldest stock
+    snapshot taken on or after the first attached month and adds the ledger
+    rows dated from it.
+
+    Raises:
+        ValueError: The ledger is partitioned and no such snapshot exists
+    """
+    if not is_ledger_partitioned(db.session.connection()):
+        return None
+    months = attached_ledger_months(db.session.connection())
+    if not months:
+        raise ValueError('stock_ledger is partitioned but has no monthly partitions attached')
+    base = db.session.execute(
+        select(func.min(StockSnapshot.snapshot_date)).where(StockSnapshot.snapshot_date >= months[0])
+    ).scalar()
+    if base is None:
+        raise ValueError(
+            'stock_ledger is partitioned and may have archived months, so the ledger sum is not the stock. '
+            f'Take a stock snapshot (flask --app app stock-snapshot) on or after {months[0].date()} and run again.'
+        )
+    return base
+
+
+def _ledger_totals(base, condition):
+    """SELECT product_id, location_id, quantity: ledger sum (from the `base` snapshot on, if given)"""
+    parts = [select(
+        StockLedger.product_id, StockLedger.location_id,
+        (StockLedger.quantity_in - StockLedger.quantity_out).label('quantity')
+    ).where(condition(StockLedger))]
+    if base is not None:
+        parts[0] = parts[0].where(StockLedger.date >= base)
+        parts.append(select(
+            StockSnapshot.product_id, StockSnapshot.location_id, StockSnapshot.quantity
+        ).where(StockSnapshot.snapshot_date == base, condition(StockSnapshot)))
+    movements = union_all(*parts).subquery()
+    return select(
+        movements.c.product_id, movements.c.location_id, func.sum(movements.c.quantity).label('quantity')
+    ).group_by(movements.c.product_id, movements.c.location_id)
+
+
+def _drift_select(lo, hi, base=None):
+    """One aggregate query: stock vs ledger sum for every product/location with product_id in [lo, hi)"""
+    ledger = _ledger_totals(base, lambda model: (model.product_id >= lo) & (model.product_id < hi)).subquery()
+    stock = select(
+        ProductLocation.product_id, ProductLocation.location_id, ProductLocation.quantity
+    ).where(ProductLocation.product_id >= lo, ProductLocation.product_id < hi).subquery()
+
+    stock_qty = func.coalesce(stock.c.quantity, 0.0)
+    ledger_qty = func.coalesce(ledger.c.quantity, 0.0)
+    return select(
+        func.coalesce(stock.c.product_id, ledger.c.product_id).label('product_id'),
+        func.coalesce(stock.c.location_id, ledger.c.location_id).label('location_id'),
+        stock_qty.label('stock_qty'),
+        ledger_qty.label('ledger_qty'),
+    ).select_from(
+        stock.outerjoin(ledger, (stock.c.product_id == ledger.c.product_id) &
+                        (stock.c.location_id == ledger.c.location_id), full=True)
+    ).where(func.abs(stock_qty - ledger_qty) > TOLERANCE)
+
+
+def _init_worker():
+    # Forked workers must not reuse the parent's pooled connections
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def _check_chunk(bounds):
+    """Process pool task: drift rows for one product id range"""
+    lo, hi, base = bounds
+    with app.app_context():
+        rows = db.session.execute(_drift_select(lo, hi, base)).all()
+        db.session.remove()
+    return [(r.product_id, r.location_id, r.stock_qty, r.ledger_qty) for r in rows]
+
+
+def find_stock_drift(chunk_size=5000, workers=None):
+    """
+    Compare product_locations.quantity with the ledger sum for every product/location
+
+    The product id space is split into chunks of `chunk_size` ids, and each
+    chunk is checked with a single aggregate query in a process pool of
+    `workers` processes (default: CPU count). For a partitioned ledger the
+    sum starts from a stock snapshot (see reconciliation_base()).
+
+    Returns:
+        List of (product_id, location_id, stock_qty, ledger_qty) with drift
+
+    Raises:
+        ValueError: The ledger is partitioned and has no usable snapshot
+    """
+    with app.app_context():
+        try:
+            base = reconciliation_base()
+            lo, hi = db.session.execute(select(func.min(Product.id), func.max(Product.id))).one()
+        finally:
+            db.session.remove()
+    if lo is None:
+        return []
+
+    chunks = [(start, start + chunk_size, base) for start in range(lo, hi + 1, chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results = map(_check_chunk, chunks)
+        drift = [row for rows in results for row in rows]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            drift = [row for rows in pool.map(_check_chunk, chunks) for row in rows]
+    return sorted(drift)
+
+
+def write_drift_corrections(drift, user_id=None):
+    """
+    Write correcting ledger rows so the ledger sum matches product_locations
+
+    Stock itself is not changed: the drift comes from ledger rows lost after
+    the stock was already updated. Each affected row is locked and re-checked
+    first so concurrent postings are not double counted.
+
+    Raises:
+        ValueError: The ledger is partitioned and has no usable snapshot
+
+    Returns:
+        Number of correction rows written
+    """
+    keys = [(product_id, location_id) for product_id, location_id, _stock, _ledger in drift]
+    if not keys:
+        return 0
+
+    now = datetime.utcnow()
+    reference = f"RECON-{now.strftime('%Y%m%d%H%M')}"
+    with app.app_context():
+        base = reconciliation_base()
+        locked = lock_stock_rows(keys)
+        ledger = {(r.product_id, r.location_id): r.quantity for r in db.session.execute(
+            _ledger_totals(base, lambda model: tuple_(model.product_id, model.location_id).in_(keys))
+        )}
+        rows = []
+        for product_id, location_id in keys:
+            stock_qty = locked.get((product_id, location_id), 0.0)
+            difference = stock_qty - (ledger.get((product_id, location_id)) or 0.0)
+            if abs(difference) <= TOLERANCE:
+                continue
+            rows.append({
+                'date': now,
+                'product_id': product_id,
+                'location_id': location_id,
+                'operation_type': 'adjustment',
+                'reference': reference,
+                'quantity_in': difference if difference > 0 else 0.0,
+                'quantity_out': -difference if difference < 0 else 0.0,
+                'balance': stock_qty,
+                'notes': 'Reconciliation: ledger drift correction',
+                'user_id': user_id,
+            })
+        if rows:
+            db.session.execute(insert(StockLedger), rows)
+        db.session.commit()
+    return len(rows)
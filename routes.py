@@ -2,22 +2,49 @@
 StockMaster Routes
 """
 
-from flask import render_template, request, redirect, url_for, flash, jsonify, session
+from flask import render_template, request, redirect, url_for, flash, jsonify, session, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import joinedload, undefer
 from datetime import datetime, timedelta
 import random
 import string
 from app import app, db, send_email
-from models import (User, Warehouse, Category, Product, Location, ProductLocation,
+from models import (User, Warehouse, Category, Product, Location,
                    Receipt, ReceiptLine, Delivery, DeliveryLine, Transfer, TransferLine,
-                   Adjustment, Partner, StockLedger, Notification, NotificationPreference)
-from utils import inventory_manager_required, warehouse_staff_or_manager, create_notification, get_user_unread_notifications_count, get_user_notifications, notify_operation_completed
+                   Adjustment, Partner, Notification, NotificationPreference)
+from utils import inventory_manager_required, warehouse_staff_or_manager, create_notification, get_user_unread_notifications_count, get_user_notifications, notify_operation_completed, fetch_page
+from stock import post_stock_moves, stock_as_of
+from stock_alerts import evaluate_low_stock_alerts
+from kpi import get_dashboard_data
+from sequences import next_document_number
+from ledger import ledger_page, ledger_entry_to_dict, iter_ledger_export, EXPORT_FORMATS
+from bulk_import import IMPORT_KINDS, parse_request_rows, import_documents
+from catalog import upsert_products
+from search import search_products, product_list_query, product_page, PRODUCT_SORTS
+from notification_counts import clear_unread_count
+from notification_stream import notification_events, acquire_stream_slot, release_stream_slot
+import sql_profiler
+from metrics import render_metrics
 
 def generate_sequence(prefix, model_class):
     """Generate unique sequence number"""
-    count = model_class.query.count()
-    return f"{prefix}-{str(count + 1).zfill(5)}"
+    return next_document_number(prefix, model_class)
+
+OPERATIONS_PER_PAGE = 50
+
+def operation_list_page(model, state, page, *options):
+    """
+    One page of receipts/deliveries/transfers, newest first
+
+    `options` are the loader options for what the list template shows
+    (joinedload of related rows, undefer of the line_count/line_quantity
+    aggregates), so it is all fetched in the same query.
+    """
+    query = model.query.options(*options)
+    if state:
+        query = query.filter(model.state == state)
+    return fetch_page(query.order_by(model.created_at.desc(), model.id.desc()), page, OPERATIONS_PER_PAGE)
 
 # ========== Authentication Routes ==========
 
@@ -102,7 +129,7 @@ def forgot_password():
             # Send OTP via email
             subject = "StockMaster - Password Reset OTP"
             body = f"Your OTP for password reset is: {otp}\n\nThis OTP will expire in 10 minutes."
-            if send_email(subject, app.config['MAIL_DEFAULT_SENDER'], [email], body):
+            if send_email(subject, app.config['MAIL_DEFAULT_SENDER'], [email], body, expires_at=user.otp_expiry):
                 flash('OTP sent to your email. Please check your inbox.', 'info')
             else:
                 flash('Failed to send OTP email. Please try again later.', 'error')
@@ -158,9 +185,9 @@ def test_email():
             '''
         )
         if success:
-            return jsonify({'status': 'success', 'message': 'Test email sent successfully!'}), 200
+            return jsonify({'status': 'success', 'message': 'Test email queued; the email worker will send it shortly.'}), 202
         else:
-            return jsonify({'status': 'error', 'message': 'Failed to send test email. Check server logs.'}), 500
+            return jsonify({'status': 'error', 'message': 'Failed to queue test email. Check server logs.'}), 500
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
@@ -169,49 +196,78 @@ def test_email():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    """Dashboard with KPIs"""
-    kpis = {
-        'total_products': Product.query.filter_by(active=True).count(),
-        'low_stock_items': sum(1 for p in Product.query.filter_by(active=True).all() if p.low_stock),
-        'out_of_stock_items': sum(1 for p in Product.query.filter_by(active=True).all() if p.total_stock <= 0),
-        'pending_receipts': Receipt.query.filter(Receipt.state.in_(['draft', 'waiting', 'ready'])).count(),
-        'pending_deliveries': Delivery.query.filter(Delivery.state.in_(['draft', 'picking', 'packing', 'ready'])).count(),
-        'scheduled_transfers': Transfer.query.filter(Transfer.state.in_(['draft', 'waiting', 'ready'])).count(),
-    }
-    
-    # Recent activities
-    recent_receipts = Receipt.query.order_by(Receipt.created_at.desc()).limit(5).all()
-    recent_deliveries = Delivery.query.order_by(Delivery.created_at.desc()).limit(5).all()
-    low_stock_products = [p for p in Product.query.filter_by(active=True).all() if p.low_stock][:10]
-    
-    return render_template('dashboard.html', kpis=kpis, recent_receipts=recent_receipts, 
-                         recent_deliveries=recent_deliveries, low_stock_products=low_stock_products)
+    """Dashboard with KPIs (cached per worker, see kpi.get_dashboard_data)"""
+    data = get_dashboard_data()
+    return render_template('dashboard.html', kpis=data['kpis'], recent_receipts=data['recent_receipts'], 
+                         recent_deliveries=data['recent_deliveries'], low_stock_products=data['low_stock_products'])
 
 # ========== Products ==========
 
 @app.route('/products')
 @login_required
 def products():
-    """List products"""
+    """List products (paginated, ?sort=name|stock|price, prefix '-' for descending)"""
     search = request.args.get('search', '')
     category_id = request.args.get('category_id', type=int)
     low_stock = request.args.get('low_stock') == '1'
+    sort = request.args.get('sort', '')
+    page = request.args.get('page', 1, type=int)
     
-    query = Product.query.filter_by(active=True)
-    
-    if search:
-        query = query.filter(Product.name.contains(search) | Product.sku.contains(search))
-    if category_id:
-        query = query.filter_by(category_id=category_id)
-    if low_stock:
-        products_list = query.all()
-        products_list = [p for p in products_list if p.low_stock]
-    else:
-        products_list = query.all()
+    query = product_list_query(search, category_id, low_stock, sort)
+    products_list, has_next = product_page(query, page, 50)
     
     categories = Category.query.all()
     return render_template('products/list.html', products=products_list, categories=categories, 
-                         search=search, category_id=category_id, low_stock=low_stock)
+                         search=search, category_id=category_id, low_stock=low_stock,
+                         sort=sort, page=max(page, 1), has_next=has_next, sorts=PRODUCT_SORTS)
+
+@app.route('/api/products')
+@login_required
+def api_products():
+    """Get a page of products with stock figures (same filters and sorts as /products)"""
+    sort = request.args.get('sort', '')
+    if sort and sort not in PRODUCT_SORTS:
+        return jsonify({'error': f'Unsupported sort: {sort}'}), 400
+    
+    page = max(request.args.get('page', 1, type=int), 1)
+    query = product_list_query(
+        request.args.get('search', ''),
+        request.args.get('category_id', type=int),
+        request.args.get('low_stock') == '1',
+        sort,
+    )
+    products_list, has_next = product_page(query, page, request.args.get('per_page', 50, type=int))
+    
+    return jsonify({
+        'products': [{
+            'id': p.id,
+            'sku': p.sku,
+            'name': p.name,
+            'category_id': p.category_id,
+            'uom': p.uom,
+            'sale_price': p.sale_price,
+            'cost_price': p.cost_price,
+            'total_stock': p.total_stock,
+            'min_stock': p.min_stock,
+            'stock_status': p.stock_status,
+        } for p in products_list],
+        'page': page,
+        'has_next': has_next,
+    })
+
+@app.route('/api/products/search')
+@login_required
+def api_product_search():
+    """Typeahead: ranked products matching ?q= (exact/prefix SKU first), at most ?limit= results"""
+    results = search_products(request.args.get('q', ''), request.args.get('limit', 10, type=int))
+    return jsonify([{
+        'id': p.id,
+        'sku': p.sku,
+        'name': p.name,
+        'uom': p.uom,
+        'sale_price': p.sale_price,
+        'total_stock': p.total_stock,
+    } for p in results])
 
 @app.route('/products/create', methods=['GET', 'POST'])
 @login_required
@@ -231,6 +287,7 @@ def product_create():
             sale_price=float(request.form.get('sale_price', 0) or 0),
             currency=request.form.get('currency', 'USD'),
         )
+        product.refresh_stock_status()
         db.session.add(product)
         db.session.commit()
         flash('Product created successfully', 'success')
@@ -252,9 +309,9 @@ def product_detail(id):
 @warehouse_staff_or_manager
 def product_edit(id):
     """Edit product"""
-    product = Product.query.get_or_404(id)
-    
     if request.method == 'POST':
+        # Lock the row so the alert check sees the current on_hand_total
+        product = Product.query.filter_by(id=id).with_for_update().first_or_404()
         product.name = request.form.get('name')
         product.sku = request.form.get('sku')
         product.category_id = request.form.get('category_id', type=int) or None
@@ -272,10 +329,13 @@ def product_edit(id):
         except ValueError:
             product.sale_price = product.sale_price or 0
         product.currency = request.form.get('currency', product.currency or 'USD')
+        product.refresh_stock_status()
+        evaluate_low_stock_alerts([(product.id, product.on_hand_total, product.min_stock)])
         db.session.commit()
         flash('Product updated successfully', 'success')
         return redirect(url_for('product_detail', id=id))
     
+    product = Product.query.get_or_404(id)
     categories = Category.query.all()
     return render_template('products/form.html', product=product, categories=categories)
 
@@ -324,6 +384,20 @@ def product_price_history(id):
         history = PriceHistory.query.filter_by(product_id=id).order_by(PriceHistory.created_at.desc()).all()
     return render_template('products/price_history.html', product=product, history=history)
 
+
+@app.route('/api/products/upsert', methods=['POST'])
+@login_required
+@inventory_manager_required
+def api_products_upsert():
+    """Create or update products by SKU from an uploaded CSV or JSON catalog (?format=csv|json)"""
+    try:
+        rows = parse_request_rows(request)
+        summary = upsert_products(rows, user_id=current_user.id, reason=request.args.get('reason') or 'Catalog import')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(summary)
+
 # ========== Receipts ==========
 
 @app.route('/receipts')
@@ -331,13 +405,11 @@ def product_price_history(id):
 def receipts():
     """List receipts"""
     state = request.args.get('state', '')
-    query = Receipt.query
+    page = max(request.args.get('page', 1, type=int), 1)
     
-    if state:
-        query = query.filter_by(state=state)
-    
-    receipts_list = query.order_by(Receipt.created_at.desc()).all()
-    return render_template('receipts/list.html', receipts=receipts_list, state=state)
+    receipts_list, has_next = operation_list_page(Receipt, state, page, joinedload(Receipt.supplier),
+                                                 joinedload(Receipt.warehouse))
+    return render_template('receipts/list.html', receipts=receipts_list, state=state, page=page, has_next=has_next)
 
 @app.route('/receipts/create', methods=['GET', 'POST'])
 @login_required
@@ -394,30 +466,18 @@ def receipt_detail(id):
 @warehouse_staff_or_manager
 def receipt_validate(id):
     """Validate receipt"""
-    receipt = Receipt.query.get_or_404(id)
+    # Locked until commit: a concurrent validation waits, then sees the new state
+    receipt = Receipt.query.filter_by(id=id).with_for_update().first_or_404()
     
     if receipt.state != 'ready':
         flash('Receipt must be in Ready state', 'error')
         return redirect(url_for('receipt_detail', id=id))
     
     try:
-        for line in receipt.lines:
-            line.product.update_stock_location(receipt.location_id, line.quantity)
-            
-            # Log in ledger
-            ledger = StockLedger(
-                date=receipt.date,
-                product_id=line.product_id,
-                location_id=receipt.location_id,
-                operation_type='receipt',
-                reference=receipt.receipt_number,
-                quantity_in=line.quantity,
-                quantity_out=0.0,
-                balance=line.product.get_stock_by_location(receipt.location_id),
-                partner_id=receipt.supplier_id,
-                user_id=current_user.id
-            )
-            db.session.add(ledger)
+        # Update stock and log in ledger for all lines at once
+        moves = [(line.product_id, receipt.location_id, line.quantity, 'receipt') for line in receipt.lines]
+        post_stock_moves(moves, receipt.receipt_number, receipt.date, current_user.id,
+                         partner_id=receipt.supplier_id)
         
         receipt.state = 'done'
         db.session.commit()
@@ -445,13 +505,11 @@ def receipt_change_state(id, state):
 def deliveries():
     """List deliveries"""
     state = request.args.get('state', '')
-    query = Delivery.query
-    
-    if state:
-        query = query.filter_by(state=state)
+    page = max(request.args.get('page', 1, type=int), 1)
     
-    deliveries_list = query.order_by(Delivery.created_at.desc()).all()
-    return render_template('deliveries/list.html', deliveries=deliveries_list, state=state)
+    deliveries_list, has_next = operation_list_page(Delivery, state, page, joinedload(Delivery.customer),
+                                                     joinedload(Delivery.warehouse))
+    return render_template('deliveries/list.html', deliveries=deliveries_list, state=state, page=page, has_next=has_next)
 
 @app.route('/deliveries/create', methods=['GET', 'POST'])
 @login_required
@@ -508,36 +566,18 @@ def delivery_detail(id):
 @warehouse_staff_or_manager
 def delivery_validate(id):
     """Validate delivery"""
-    delivery = Delivery.query.get_or_404(id)
+    # Locked until commit: a concurrent validation waits, then sees the new state
+    delivery = Delivery.query.filter_by(id=id).with_for_update().first_or_404()
     
     if delivery.state != 'ready':
         flash('Delivery must be in Ready state', 'error')
         return redirect(url_for('delivery_detail', id=id))
     
     try:
-        for line in delivery.lines:
-            # Check stock availability
-            available = line.product.get_stock_by_location(delivery.location_id)
-            if available < line.quantity:
-                raise ValueError(f'Insufficient stock for {line.product.name}. Available: {available}, Required: {line.quantity}')
-            
-            # Decrease stock
-            line.product.update_stock_location(delivery.location_id, -line.quantity)
-            
-            # Log in ledger
-            ledger = StockLedger(
-                date=delivery.date,
-                product_id=line.product_id,
-                location_id=delivery.location_id,
-                operation_type='delivery',
-                reference=delivery.delivery_number,
-                quantity_in=0.0,
-                quantity_out=line.quantity,
-                balance=line.product.get_stock_by_location(delivery.location_id),
-                partner_id=delivery.customer_id,
-                user_id=current_user.id
-            )
-            db.session.add(ledger)
+        # Decrease stock and log in ledger; fails as a whole if any line is short
+        moves = [(line.product_id, delivery.location_id, -line.quantity, 'delivery') for line in delivery.lines]
+        post_stock_moves(moves, delivery.delivery_number, delivery.date, current_user.id,
+                         partner_id=delivery.customer_id)
         
         delivery.state = 'done'
         db.session.commit()
@@ -565,13 +605,13 @@ def delivery_change_state(id, state):
 def transfers():
     """List transfers"""
     state = request.args.get('state', '')
-    query = Transfer.query
-    
-    if state:
-        query = query.filter_by(state=state)
+    page = max(request.args.get('page', 1, type=int), 1)
     
-    transfers_list = query.order_by(Transfer.created_at.desc()).all()
-    return render_template('transfers/list.html', transfers=transfers_list, state=state)
+    transfers_list, has_next = operation_list_page(
+        Transfer, state, page, joinedload(Transfer.source_location), joinedload(Transfer.destination_location),
+        undefer(Transfer.line_count), undefer(Transfer.line_quantity),
+    )
+    return render_template('transfers/list.html', transfers=transfers_list, state=state, page=page, has_next=has_next)
 
 @app.route('/transfers/create', methods=['GET', 'POST'])
 @login_required
@@ -625,50 +665,20 @@ def transfer_detail(id):
 @warehouse_staff_or_manager
 def transfer_validate(id):
     """Validate transfer"""
-    transfer = Transfer.query.get_or_404(id)
+    # Locked until commit: a concurrent validation waits, then sees the new state
+    transfer = Transfer.query.filter_by(id=id).with_for_update().first_or_404()
     
     if transfer.state != 'ready':
         flash('Transfer must be in Ready state', 'error')
         return redirect(url_for('transfer_detail', id=id))
     
     try:
+        # Move stock (source - out, destination - in) and log both sides in ledger
+        moves = []
         for line in transfer.lines:
-            # Check stock availability
-            available = line.product.get_stock_by_location(transfer.source_location_id)
-            if available < line.quantity:
-                raise ValueError(f'Insufficient stock for {line.product.name}. Available: {available}, Required: {line.quantity}')
-            
-            # Move stock
-            line.product.update_stock_location(transfer.source_location_id, -line.quantity)
-            line.product.update_stock_location(transfer.destination_location_id, line.quantity)
-            
-            # Log in ledger (source - out)
-            ledger_out = StockLedger(
-                date=transfer.date,
-                product_id=line.product_id,
-                location_id=transfer.source_location_id,
-                operation_type='transfer_out',
-                reference=transfer.transfer_number,
-                quantity_in=0.0,
-                quantity_out=line.quantity,
-                balance=line.product.get_stock_by_location(transfer.source_location_id),
-                user_id=current_user.id
-            )
-            db.session.add(ledger_out)
-            
-            # Log in ledger (destination - in)
-            ledger_in = StockLedger(
-                date=transfer.date,
-                product_id=line.product_id,
-                location_id=transfer.destination_location_id,
-                operation_type='transfer_in',
-                reference=transfer.transfer_number,
-                quantity_in=line.quantity,
-                quantity_out=0.0,
-                balance=line.product.get_stock_by_location(transfer.destination_location_id),
-                user_id=current_user.id
-            )
-            db.session.add(ledger_in)
+            moves.append((line.product_id, transfer.source_location_id, -line.quantity, 'transfer_out'))
+            moves.append((line.product_id, transfer.destination_location_id, line.quantity, 'transfer_in'))
+        post_stock_moves(moves, transfer.transfer_number, transfer.date, current_user.id)
         
         transfer.state = 'done'
         db.session.commit()
@@ -689,6 +699,28 @@ def transfer_change_state(id, state):
     flash(f'Transfer state changed to {state}', 'success')
     return redirect(url_for('transfer_detail', id=id))
 
+# ========== Bulk Import ==========
+
+@app.route('/api/import/<kind>', methods=['POST'])
+@login_required
+@warehouse_staff_or_manager
+def api_import_documents(kind):
+    """Import draft receipts/deliveries/transfers from an uploaded CSV or JSON file (?format=csv|json)"""
+    if kind not in IMPORT_KINDS:
+        return jsonify({'error': f'Unknown import type: {kind}'}), 404
+    
+    try:
+        rows = parse_request_rows(request)
+        result = import_documents(kind, rows, user_id=current_user.id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if result['documents']:
+        create_notification(current_user.id, 'Import Completed',
+                            f"{len(result['documents'])} {kind} imported ({result['lines']} lines, "
+                            f"{result['error_count']} rows skipped)", 'operation_completed')
+    return jsonify(result)
+
 # ========== Adjustments ==========
 
 @app.route('/adjustments')
@@ -746,30 +778,18 @@ def adjustment_detail(id):
 @inventory_manager_required
 def adjustment_validate(id):
     """Validate adjustment"""
-    adjustment = Adjustment.query.get_or_404(id)
+    # Locked until commit: a concurrent validation waits, then sees the new state
+    adjustment = Adjustment.query.filter_by(id=id).with_for_update().first_or_404()
     
     if adjustment.state != 'draft':
         flash('Adjustment already validated', 'error')
         return redirect(url_for('adjustment_detail', id=id))
     
     try:
-        # Update stock
-        adjustment.product.update_stock_location(adjustment.location_id, adjustment.difference)
-        
-        # Log in ledger
-        ledger = StockLedger(
-            date=adjustment.date,
-            product_id=adjustment.product_id,
-            location_id=adjustment.location_id,
-            operation_type='adjustment',
-            reference=adjustment.adjustment_number,
-            quantity_in=adjustment.difference if adjustment.difference > 0 else 0.0,
-            quantity_out=abs(adjustment.difference) if adjustment.difference < 0 else 0.0,
-            balance=adjustment.product.get_stock_by_location(adjustment.location_id),
-            notes=adjustment.reason,
-            user_id=current_user.id
-        )
-        db.session.add(ledger)
+        # Update stock and log in ledger
+        moves = [(adjustment.product_id, adjustment.location_id, adjustment.difference, 'adjustment')]
+        post_stock_moves(moves, adjustment.adjustment_number, adjustment.date, current_user.id,
+                         notes=adjustment.reason)
         
         adjustment.state = 'done'
         db.session.commit()
@@ -785,27 +805,64 @@ def adjustment_validate(id):
 @app.route('/ledger')
 @login_required
 def ledger():
-    """Stock ledger"""
+    """Stock ledger (keyset paginated, newest first)"""
     product_id = request.args.get('product_id', type=int)
     location_id = request.args.get('location_id', type=int)
     operation_type = request.args.get('operation_type', '')
+    cursor = request.args.get('cursor')
     
-    query = StockLedger.query
-    
-    if product_id:
-        query = query.filter_by(product_id=product_id)
-    if location_id:
-        query = query.filter_by(location_id=location_id)
-    if operation_type:
-        query = query.filter_by(operation_type=operation_type)
+    try:
+        entries, next_cursor = ledger_page(cursor, 100, product_id, location_id, operation_type)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('ledger', product_id=product_id, location_id=location_id, operation_type=operation_type))
     
-    entries = query.order_by(StockLedger.date.desc()).limit(100).all()
     products = Product.query.filter_by(active=True).all()
     locations = Location.query.filter_by(active=True).all()
     
     return render_template('ledger/list.html', entries=entries, products=products, 
                          locations=locations, product_id=product_id, location_id=location_id, 
-                         operation_type=operation_type)
+                         operation_type=operation_type, cursor=cursor, next_cursor=next_cursor)
+
+@app.route('/api/ledger')
+@login_required
+def api_ledger():
+    """Get a page of ledger entries (cursor-based; pass back next_cursor for the next page)"""
+    try:
+        entries, next_cursor = ledger_page(
+            request.args.get('cursor'),
+            request.args.get('limit', 100, type=int),
+            request.args.get('product_id', type=int),
+            request.args.get('location_id', type=int),
+            request.args.get('operation_type', ''),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'entries': [ledger_entry_to_dict(e) for e in entries], 'next_cursor': next_cursor})
+
+@app.route('/ledger/export')
+@login_required
+@inventory_manager_required
+def ledger_export():
+    """Stream the stock ledger for a date range (?start=YYYY-MM-DD&end=YYYY-MM-DD&format=csv|ndjson)"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+    
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d') if request.args.get('start') else None
+        # End date is inclusive for the user, exclusive in the query
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d') + timedelta(days=1) if request.args.get('end') else None
+    except ValueError:
+        return jsonify({'error': 'Dates must be in YYYY-MM-DD format'}), 400
+    
+    encoder, mimetype = EXPORT_FORMATS[fmt]
+    return Response(
+        stream_with_context(encoder(iter_ledger_export(start, end))),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=stock_ledger.{fmt}'}
+    )
 
 # ========== User Profile ==========
 
@@ -1244,6 +1301,8 @@ def delete_notification(id):
 @login_required
 def mark_all_notifications_read():
     """Mark all notifications as read"""
+    # Zero (and lock) the unread counter first; see clear_unread_count
+    clear_unread_count(current_user.id)
     Notification.query.filter(
         Notification.user_id == current_user.id,
         Notification.is_read == False,
@@ -1260,23 +1319,45 @@ def api_unread_notifications_count():
     count = get_user_unread_notifications_count(current_user.id)
     return jsonify({'count': count})
 
+def recent_notifications_payload(user_id, limit=5):
+    """Unread count and most recent notifications, as sent to the navbar"""
+    notifications_list = get_user_notifications(user_id, limit=limit, unread_only=False)
+    return {
+        'count': get_user_unread_notifications_count(user_id),
+        'notifications': [{
+            'id': n.id,
+            'title': n.title,
+            'message': n.message,
+            'type': n.notification_type,
+            'is_read': n.is_read,
+            'created_at': n.created_at.strftime('%Y-%m-%d %H:%M'),
+            'url': url_for('notification_detail', id=n.id)
+        } for n in notifications_list],
+    }
+
 @app.route('/api/notifications/recent')
 @login_required
 def api_recent_notifications():
     """Get recent notifications (for dropdown)"""
-    notifications_list = get_user_notifications(current_user.id, limit=5, unread_only=False)
-    
-    data = [{
-        'id': n.id,
-        'title': n.title,
-        'message': n.message,
-        'type': n.notification_type,
-        'is_read': n.is_read,
-        'created_at': n.created_at.strftime('%Y-%m-%d %H:%M'),
-        'url': url_for('notification_detail', id=n.id)
-    } for n in notifications_list]
-    
-    return jsonify({'notifications': data})
+    data = recent_notifications_payload(current_user.id)
+    return jsonify({'notifications': data['notifications']})
+
+@app.route('/api/notifications/stream')
+@login_required
+def api_notifications_stream():
+    """Server-Sent Events: unread count and recent notifications, pushed when they change"""
+    user_id = current_user.id
+    if not acquire_stream_slot():
+        # The browser falls back to polling the JSON endpoints
+        return jsonify({'error': 'Too many open notification streams'}), 503
+    response = Response(
+        stream_with_context(notification_events(user_id, lambda: recent_notifications_payload(user_id))),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Called by the server when the stream ends, including on disconnect
+    response.call_on_close(release_stream_slot)
+    return response
 
 @app.route('/notifications-preferences', methods=['GET', 'POST'])
 @login_required
@@ -1302,6 +1383,42 @@ def notification_preferences():
     
     return render_template('notifications/preferences.html', preferences=prefs)
 
+# ========== Metrics ==========
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics, aggregated over all workers (Authorization: Bearer METRICS_TOKEN if set)"""
+    token = app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    result = render_metrics()
+    if result is None:
+        return Response('prometheus_client is not installed\n', status=503, mimetype='text/plain')
+    body, content_type = result
+    return Response(body, content_type=content_type)
+
+# ========== SQL Profiling ==========
+
+@app.route('/api/admin/sql-profile', methods=['GET', 'DELETE'])
+@login_required
+@inventory_manager_required
+def api_sql_profile():
+    """Recent per-request SQL profiles and a per-endpoint summary (SQL_PROFILING must be on)"""
+    if not sql_profiler.is_enabled():
+        return jsonify({'error': 'SQL profiling is disabled (set SQL_PROFILING=true)'}), 404
+    if request.method == 'DELETE':
+        sql_profiler.clear_profiles()
+        return jsonify({'success': True})
+    
+    return jsonify({
+        'summary': sql_profiler.endpoint_summary(),
+        'requests': sql_profiler.recent_profiles(
+            limit=min(request.args.get('limit', 50, type=int), 500),
+            n_plus_one_only=request.args.get('n_plus_one') == '1',
+            min_statements=request.args.get('min_statements', 0, type=int),
+        ),
+    })
+
 # ========== API Routes ==========
 
 @app.route('/api/locations/<int:warehouse_id>')
@@ -1311,6 +1428,26 @@ def api_locations(warehouse_id):
     locations = Location.query.filter_by(warehouse_id=warehouse_id, active=True).all()
     return jsonify([{'id': loc.id, 'name': loc.name} for loc in locations])
 
+@app.route('/api/stock-as-of')
+@login_required
+def api_stock_as_of():
+    """Get stock per product/location as of a past date (?date=YYYY-MM-DD or YYYY-MM-DDTHH:MM)"""
+    value = request.args.get('date', '')
+    try:
+        at = datetime.fromisoformat(value)
+    except ValueError:
+        return jsonify({'error': 'date must be YYYY-MM-DD or YYYY-MM-DDTHH:MM'}), 400
+    if len(value) == 10:
+        # A plain date means "at the end of that day"
+        at += timedelta(days=1)
+    
+    stock = stock_as_of(at, request.args.get('product_id', type=int), request.args.get('location_id', type=int))
+    return jsonify({
+        'as_of': at.isoformat(),
+        'stock': [{'product_id': pid, 'location_id': lid, 'quantity': qty}
+                  for (pid, lid), qty in sorted(stock.items())]
+    })
+
 @app.route('/api/product-stock/<int:product_id>/<int:location_id>')
 @login_required
 def api_product_stock(product_id, location_id):
@@ -0,0 +1,115 @@
+"""
+StockMaster Product Search and Listing
+"""
+
+from sqlalchemy import case, func, or_
+
+from models import Product
+from utils import fetch_page
+
+MAX_TYPEAHEAD_LIMIT = 50
+MAX_PAGE_SIZE = 200
+# pg_trgm can only use its index for patterns with at least one full trigram
+MIN_TRIGRAM_LENGTH = 3
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def product_search_filter(term):
+    """
+    WHERE clause matching `term` against product name and SKU
+
+    Terms of 3+ characters match anywhere in the name or SKU (ILIKE backed by
+    the pg_trgm GIN indexes); shorter terms, which trigram indexes cannot
+    help, match a SKU or name prefix, backed by the lower(sku) and
+    lower(name) indexes.
+    """
+    term = term.strip()
+    escaped = _escape_like(term.lower())
+    sku_prefix = func.lower(Product.sku).like(f'{escaped}%', escape='\\')
+    if len(term) < MIN_TRIGRAM_LENGTH:
+        return or_(sku_prefix, func.lower(Product.name).like(f'{escaped}%', escape='\\'))
+    return or_(sku_prefix,
+               Product.sku.ilike(f'%{escaped}%', escape='\\'),
+               Product.name.ilike(f'%{escaped}%', escape='\\'))
+
+
+def product_search_order(term):
+    """ORDER BY clauses ranking exact SKU, then SKU prefix, then name prefix, then name similarity"""
+    term = term.strip()
+    escaped = _escape_like(term.lower())
+    rank = case(
+        (func.lower(Product.sku) == term.lower(), 0),
+        (func.lower(Product.sku).like(f'{escaped}%', escape='\\'), 1),
+        (func.lower(Product.name).like(f'{escaped}%', escape='\\'), 2),
+        else_=3,
+    )
+    return [rank, func.similarity(Product.name, term).desc(), Product.name, Product.id]
+
+
+def search_products(term, limit=10, active_only=True):
+    """
+    Ranked product matches for a typeahead
+
+    Args:
+        term: Search text (name or SKU fragment)
+        limit: Maximum results (capped at MAX_TYPEAHEAD_LIMIT)
+        active_only: Skip archived products
+
+    Returns:
+        List of Product
+    """
+    if not term or not term.strip():
+        return []
+    limit = max(1, min(limit or 10, MAX_TYPEAHEAD_LIMIT))
+    query = Product.query.filter(product_search_filter(term))
+    if active_only:
+        query = query.filter(Product.active == True)
+    return query.order_by(*product_search_order(term)).limit(limit).all()
+
+
+# ?sort= values for the product list; each is backed by an index on its column
+PRODUCT_SORTS = {
+    'name': [Product.name, Product.id],
+    '-name': [Product.name.desc(), Product.id.desc()],
+    'stock': [Product.on_hand_total, Product.id],
+    '-stock': [Product.on_hand_total.desc(), Product.id.desc()],
+    'price': [Product.sale_price, Product.id],
+    '-price': [Product.sale_price.desc(), Product.id.desc()],
+}
+
+
+def product_list_query(search='', category_id=None, low_stock=False, sort=''):
+    """
+    Filtered, sorted query over active products
+
+    Without an explicit sort, search results come in relevance order and
+    everything else by name. Stock figures are read from the denormalized
+    products.on_hand_total/stock_status columns, so rendering a page never
+    touches product_locations.
+    """
+    query = Product.query.filter_by(active=True)
+    if search:
+        query = query.filter(product_search_filter(search))
+    if category_id:
+        query = query.filter_by(category_id=category_id)
+    if low_stock:
+        query = query.filter(Product.low_stock)
+
+    if sort in PRODUCT_SORTS:
+        return query.order_by(*PRODUCT_SORTS[sort])
+    if search:
+        return query.order_by(*product_search_order(search))
+    return query.order_by(*PRODUCT_SORTS['name'])
+
+
+def product_page(query, page=1, per_page=50):
+    """
+    One page of `query` without a COUNT(*) over the catalog
+
+    Returns:
+        (products, has_next)
+    """
+    return fetch_page(query, page, per_page, MAX_PAGE_SIZE)
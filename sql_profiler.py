@@ -0,0 +1,169 @@
+"""
+StockMaster SQL Profiler (per-request statement counts and N+1 detection)
+"""
+
+import re
+import threading
+import time
+from collections import Counter, deque
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Whitespace, literals and expanded IN lists are folded so that the same
+# query with different parameters has one fingerprint
+_IN_LIST = re.compile(r'\(\s*%\(\w+\)s(?:\s*,\s*%\(\w+\)s)+\s*\)')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACE = re.compile(r'\s+')
+
+# Longest fingerprint kept in a report
+MAX_FINGERPRINT_LENGTH = 500
+# Repeated statements listed per request
+MAX_REPEATED = 5
+
+_lock = threading.Lock()
+_profiles = deque(maxlen=200)
+_installed = False
+
+
+def fingerprint(statement):
+    """Normalised form of `statement` used to spot the same query being repeated"""
+    statement = _IN_LIST.sub('(...)', statement)
+    statement = _STRING.sub("'?'", statement)
+    statement = _NUMBER.sub('?', statement)
+    return _SPACE.sub(' ', statement).strip()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_profile' in g:
+        conn.info['sql_profiler_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not (has_request_context() and 'sql_profile' in g):
+        return
+    start = conn.info.pop('sql_profiler_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    profile = g.sql_profile
+    profile['statements'] += 1
+    profile['db_time'] += elapsed
+    key = fingerprint(statement)
+    profile['fingerprints'][key] += 1
+    profile['fingerprint_time'][key] += elapsed
+
+
+def _start_request():
+    if request.endpoint != 'static':
+        g.sql_profile = {'start': time.perf_counter(), 'statements': 0, 'db_time': 0.0,
+                         'fingerprints': Counter(), 'fingerprint_time': Counter()}
+
+
+def _finish_request(response, app):
+    profile = g.pop('sql_profile', None)
+    if profile is None:
+        return response
+
+    threshold = app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 5)
+    repeated = [
+        {'fingerprint': key[:MAX_FINGERPRINT_LENGTH], 'count': count,
+         'db_ms': round(profile['fingerprint_time'][key] * 1000, 2)}
+        for key, count in profile['fingerprints'].most_common(MAX_REPEATED) if count > 1
+    ]
+    # The same SELECT issued many times in one request is almost always a
+    # lazy load or a per-row query inside a loop
+    suspects = [r for r in repeated if r['count'] >= threshold and r['fingerprint'].upper().startswith('SELECT')]
+    record = {
+        'at': time.time(),
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'statements': profile['statements'],
+        'db_ms': round(profile['db_time'] * 1000, 2),
+        'total_ms': round((time.perf_counter() - profile['start']) * 1000, 2),
+        'repeated': repeated,
+        'n_plus_one': bool(suspects),
+    }
+    with _lock:
+        _profiles.append(record)
+
+    if app.debug:
+        response.headers['X-SQL-Count'] = str(record['statements'])
+        response.headers['X-SQL-Time-Ms'] = str(record['db_ms'])
+        if suspects:
+            response.headers['X-SQL-N-Plus-One'] = f"{suspects[0]['count']}x {suspects[0]['fingerprint'][:200]}"
+    return response
+
+
+def init_sql_profiler(app):
+    """
+    Start profiling every request's SQL (enabled by SQL_PROFILING)
+
+    Hooks SQLAlchemy cursor events to count statements and time spent in
+    the database per request, folds statements into fingerprints, and flags
+    a request as a likely N+1 when one SELECT fingerprint runs at least
+    SQL_N_PLUS_ONE_THRESHOLD times. The last SQL_PROFILE_BUFFER_SIZE
+    requests are kept in memory (see recent_profiles()); in debug mode the
+    figures are also sent as X-SQL-* response headers.
+    """
+    global _profiles, _installed
+    if _installed:
+        return
+    _installed = True
+    _profiles = deque(maxlen=app.config.get('SQL_PROFILE_BUFFER_SIZE', 200))
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(lambda response: _finish_request(response, app))
+
+
+def is_enabled():
+    return _installed
+
+
+def recent_profiles(limit=50, n_plus_one_only=False, min_statements=0):
+    """
+    Most recent request profiles, newest first
+
+    Args:
+        limit: Maximum number of profiles
+        n_plus_one_only: Only requests flagged as likely N+1
+        min_statements: Only requests that ran at least this many statements
+    """
+    with _lock:
+        profiles = list(_profiles)
+    profiles.reverse()
+    profiles = [p for p in profiles
+                if p['statements'] >= min_statements and (p['n_plus_one'] or not n_plus_one_only)]
+    return profiles[:limit]
+
+
+def endpoint_summary():
+    """Per-endpoint request count, average/max statements, average DB time and N+1 flags over the buffer"""
+    with _lock:
+        profiles = list(_profiles)
+    summary = {}
+    for p in profiles:
+        s = summary.setdefault(p['endpoint'] or p['path'], {'requests': 0, 'statements': 0, 'max_statements': 0,
+                                                          'db_ms': 0.0, 'n_plus_one': 0})
+        s['requests'] += 1
+        s['statements'] += p['statements']
+        s['max_statements'] = max(s['max_statements'], p['statements'])
+        s['db_ms'] += p['db_ms']
+        s['n_plus_one'] += p['n_plus_one']
+    return sorted(
+        ({'endpoint': endpoint, 'requests': s['requests'],
+          'avg_statements': round(s['statements'] / s['requests'], 1), 'max_statements': s['max_statements'],
+          'avg_db_ms': round(s['db_ms'] / s['requests'], 2), 'n_plus_one': s['n_plus_one']}
+         for endpoint, s in summary.items()),
+        key=lambda row: row['avg_statements'], reverse=True,
+    )
+
+
+def clear_profiles():
+    with _lock:
+        _profiles.clear()
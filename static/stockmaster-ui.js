@@ -360,3 +360,96 @@ function initProfileIcon() {
     });
   });
 }
+
+// ===== Notification Stream =====
+// One tab per browser holds the Server-Sent Events connection (elected with
+// the Web Locks API) and relays every update to the other tabs through a
+// BroadcastChannel. Browsers without these APIs fall back to one stream per
+// tab, or to polling without EventSource. When the server refuses the stream
+// (503: the worker's stream slots are taken), the leader polls and retries
+// the stream every options.streamRetryInterval ms.
+//
+// options.url       - stream endpoint
+// options.onUpdate  - called with {count, notifications}
+// options.poll      - fallback called every options.pollInterval ms; returns a
+//                     promise of {count, notifications}
+function initNotificationStream(options) {
+  const lockName = 'stockmaster-notification-stream';
+  const channel = 'BroadcastChannel' in window ? new BroadcastChannel('stockmaster-notifications') : null;
+  let lastUpdate = null;
+
+  function deliver(data) {
+    lastUpdate = data;
+    options.onUpdate(data);
+  }
+
+  // options.poll() resolves to the same data the stream sends
+  function pollOnce(relay) {
+    return options.poll().then(function(data) {
+      deliver(data);
+      if (relay && channel) channel.postMessage({type: 'update', data: data});
+    });
+  }
+
+  function startPolling(relay) {
+    pollOnce(relay);
+    return setInterval(function() { pollOnce(relay); }, options.pollInterval || 30000);
+  }
+
+  function openStream(relay) {
+    return new Promise(function() {
+      let pollTimer = null;
+      function connect() {
+        const source = new EventSource(options.url);
+        source.addEventListener('notifications', function(e) {
+          const data = JSON.parse(e.data);
+          if (pollTimer) {
+            clearInterval(pollTimer);
+            pollTimer = null;
+          }
+          deliver(data);
+          if (relay && channel) channel.postMessage({type: 'update', data: data});
+        });
+        source.addEventListener('error', function() {
+          // The server refused the stream (e.g. 503 when its stream slots
+          // are taken): poll, and try streaming again later
+          if (source.readyState === EventSource.CLOSED) {
+            if (!pollTimer) pollTimer = startPolling(relay);
+            setTimeout(connect, options.streamRetryInterval || 300000);
+          }
+        });
+      }
+      connect();
+      // Held until the tab closes, which releases the lock to another tab
+    });
+  }
+
+  if (!('EventSource' in window)) {
+    startPolling(false);
+    return;
+  }
+
+  if (!channel || !(navigator.locks && navigator.locks.request)) {
+    openStream(false);
+    return;
+  }
+
+  channel.addEventListener('message', function(e) {
+    if (e.data.type === 'update') {
+      deliver(e.data.data);
+    } else if (e.data.type === 'hello' && lastUpdate) {
+      // A tab just opened; send it the current state
+      channel.postMessage({type: 'update', data: lastUpdate});
+    }
+  });
+
+  navigator.locks.request(lockName, function() {
+    return openStream(true);
+  });
+
+  // Ask the leader tab for the current state; load it ourselves if nobody answers
+  channel.postMessage({type: 'hello'});
+  setTimeout(function() {
+    if (!lastUpdate) pollOnce(false);
+  }, 1500);
+}
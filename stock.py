@@ -0,0 +1,295 @@
+"""
+StockMaster Stock Posting Engine
+"""
+
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import (Float, Integer, and_, case, column, delete, func, insert, literal, select,
+                        tuple_, union_all, update, values)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app import db
+from kpi import invalidate_kpis
+from metrics import count_on_commit
+from stock_alerts import evaluate_low_stock_alerts
+from models import (Product, ProductLocation, StockLedger, StockSnapshot,
+                    STOCK_STATUS_OK, STOCK_STATUS_LOW, STOCK_STATUS_OUT)
+
+
+def _aggregate_deltas(moves):
+    """Sum signed quantities per (product_id, location_id)"""
+    deltas = {}
+    for product_id, location_id, quantity, _operation_type in moves:
+        key = (product_id, location_id)
+        deltas[key] = deltas.get(key, 0.0) + quantity
+    return deltas
+
+
+def lock_stock_rows(keys):
+    """
+    Lock product_locations rows with SELECT ... FOR UPDATE
+
+    Rows are locked in (product_id, location_id) order so that two documents
+    touching the same rows always acquire them in the same order and cannot
+    deadlock. Rows that do not exist yet are simply absent from the result.
+
+    Args:
+        keys: Iterable of (product_id, location_id)
+
+    Returns:
+        Dict mapping (product_id, location_id) to the locked quantity
+    """
+    keys = sorted(set(keys))
+    if not keys:
+        return {}
+
+    stmt = select(ProductLocation.product_id, ProductLocation.location_id, ProductLocation.quantity).where(
+        tuple_(ProductLocation.product_id, ProductLocation.location_id).in_(keys)
+    ).order_by(ProductLocation.product_id, ProductLocation.location_id).with_for_update()
+
+    return {(r.product_id, r.location_id): r.quantity for r in db.session.execute(stmt)}
+
+
+def _insufficient_stock(product_id, available, required):
+    """Roll back and build the error raised when a line is short"""
+    db.session.rollback()
+    product = db.session.get(Product, product_id)
+    name = product.name if product else product_id
+    return ValueError(f'Insufficient stock for {name}. Available: {available}, Required: {required}')
+
+
+def stock_status_case(total, min_stock):
+    """SQL version of models.stock_status_for"""
+    return case(
+        (total <= 0, STOCK_STATUS_OUT),
+        (and_(min_stock > 0, total <= min_stock), STOCK_STATUS_LOW),
+        else_=STOCK_STATUS_OK,
+    )
+
+
+def _update_on_hand_totals(deltas):
+    """
+    Add the per-product sum of `deltas` to products.on_hand_total and refresh stock_status
+
+    Returns:
+        List of (product_id, on_hand_total, min_stock) for the changed products
+    """
+    product_deltas = {}
+    for (product_id, _location_id), quantity in deltas.items():
+        product_deltas[product_id] = product_deltas.get(product_id, 0.0) + quantity
+    product_deltas = {pid: qty for pid, qty in product_deltas.items() if qty}
+    if not product_deltas:
+        return []
+
+    # Lock the product rows in id order first; UPDATE ... FROM has no ORDER BY
+    ids = sorted(product_deltas)
+    db.session.execute(select(Product.id).where(Product.id.in_(ids)).order_by(Product.id).with_for_update())
+
+    products = Product.__table__
+    v = values(column('product_id', Integer), column('delta', Float), name='v').data(
+        [(pid, product_deltas[pid]) for pid in ids]
+    )
+    new_total = products.c.on_hand_total + v.c.delta
+    return db.session.execute(
+        update(products)
+        .where(products.c.id == v.c.product_id)
+        .values(on_hand_total=new_total, stock_status=stock_status_case(new_total, products.c.min_stock))
+        .returning(products.c.id, products.c.on_hand_total, products.c.min_stock)
+    ).all()
+
+
+def apply_stock_deltas(deltas):
+    """
+    Apply signed stock deltas to product_locations in one statement
+
+    Uses INSERT ... ON CONFLICT on `unique_product_location` so that missing
+    rows are created and existing rows are incremented, and returns the new
+    balance of every touched row. products.on_hand_total is adjusted in the
+    same transaction, and the changed products are checked for low-stock
+    alerts (stock_alerts.py). Nothing is committed here. If any row would
+    go negative the transaction is rolled back and ValueError is raised.
+
+    When STOCK_ROW_LOCKING is enabled the affected rows are locked first and
+    availability is checked against the locked quantities, before any write.
+
+    Args:
+        deltas: Dict mapping (product_id, location_id) to a signed quantity
+
+    Returns:
+        Dict mapping (product_id, location_id) to the new quantity
+    """
+    if not deltas:
+        return {}
+
+    if current_app.config.get('STOCK_ROW_LOCKING', True):
+        locked = lock_stock_rows(deltas)
+        for key, quantity in sorted(deltas.items()):
+            available = locked.get(key, 0.0)
+            if quantity < 0 and available + quantity < 0:
+                raise _insufficient_stock(key[0], available, abs(quantity))
+
+    now = datetime.utcnow()
+    rows = [{
+        'product_id': product_id,
+        'location_id': location_id,
+        'quantity': quantity,
+        'updated_at': now,
+    } for (product_id, location_id), quantity in sorted(deltas.items())]
+
+    stmt = pg_insert(ProductLocation).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        constraint='unique_product_location',
+        set_={
+            'quantity': ProductLocation.quantity + stmt.excluded.quantity,
+            'updated_at': stmt.excluded.updated_at,
+        }
+    ).returning(ProductLocation.product_id, ProductLocation.location_id, ProductLocation.quantity)
+
+    balances = {(r.product_id, r.location_id): r.quantity for r in db.session.execute(stmt)}
+
+    for key, balance in sorted(balances.items()):
+        if balance < 0:
+            required = abs(deltas[key])
+            raise _insufficient_stock(key[0], balance + required, required)
+
+    levels = _update_on_hand_totals(deltas)
+    evaluate_low_stock_alerts(levels)
+    invalidate_kpis()
+    return balances
+
+
+def post_stock_moves(moves, reference, date, user_id, partner_id=None, notes=None):
+    """
+    Post all stock moves of one document and write its ledger rows
+
+    Stock is updated with a single upsert and the ledger rows are inserted
+    with a single multi-row INSERT, so the cost of validating a document does
+    not grow with one round trip per line. The caller commits once afterwards
+    (typically together with the document state change).
+
+    Args:
+        moves: List of (product_id, location_id, signed_quantity, operation_type)
+        reference: Document number written to every ledger row
+        date: Ledger date (usually the document date)
+        user_id: User posting the document
+        partner_id: Optional supplier/customer ID
+        notes: Optional ledger notes
+
+    Returns:
+        Dict mapping (product_id, location_id) to the new quantity
+    """
+    balances = apply_stock_deltas(_aggregate_deltas(moves))
+
+    # Walk the moves backwards from the final balance so each ledger row
+    # carries the running balance right after its own move.
+    running = dict(balances)
+    ledger_rows = []
+    for product_id, location_id, quantity, operation_type in reversed(moves):
+        key = (product_id, location_id)
+        ledger_rows.append({
+            'date': date,
+            'product_id': product_id,
+            'location_id': location_id,
+            'operation_type': operation_type,
+            'reference': reference,
+            'quantity_in': quantity if quantity > 0 else 0.0,
+            'quantity_out': -quantity if quantity < 0 else 0.0,
+            'balance': running[key],
+            'partner_id': partner_id,
+            'notes': notes,
+            'user_id': user_id,
+        })
+        running[key] -= quantity
+    ledger_rows.reverse()
+
+    if ledger_rows:
+        db.session.execute(insert(StockLedger), ledger_rows)
+        count_on_commit(db.session, 'stock_postings', operation_type=moves[0][3])
+        for row in ledger_rows:
+            count_on_commit(db.session, 'ledger_rows', operation_type=row['operation_type'])
+
+    return balances
+
+
+# ========== Stock Snapshots ==========
+
+def _latest_snapshot_date(at, strict=False):
+    """Date of the newest snapshot taken at or before `at` (strictly before if `strict`)"""
+    condition = StockSnapshot.snapshot_date < at if strict else StockSnapshot.snapshot_date <= at
+    return db.session.execute(select(func.max(StockSnapshot.snapshot_date)).where(condition)).scalar()
+
+
+def _stock_as_of_select(at, base=None, product_id=None, location_id=None):
+    """
+    SELECT product_id, location_id, quantity as of `at`
+
+    Starts from the snapshot taken at `base` (if any) and adds the ledger
+    movements dated in [base, at), so the work is bounded by the activity
+    since that snapshot rather than by the whole ledger history.
+    """
+    ledger = select(
+        StockLedger.product_id, StockLedger.location_id,
+        (StockLedger.quantity_in - StockLedger.quantity_out).label('quantity')
+    ).where(StockLedger.date < at)
+    if product_id:
+        ledger = ledger.where(StockLedger.product_id == product_id)
+    if location_id:
+        ledger = ledger.where(StockLedger.location_id == location_id)
+
+    parts = [ledger]
+    if base is not None:
+        parts[0] = ledger.where(StockLedger.date >= base)
+        snapshot = select(
+            StockSnapshot.product_id, StockSnapshot.location_id, StockSnapshot.quantity
+        ).where(StockSnapshot.snapshot_date == base)
+        if product_id:
+            snapshot = snapshot.where(StockSnapshot.product_id == product_id)
+        if location_id:
+            snapshot = snapshot.where(StockSnapshot.location_id == location_id)
+        parts.append(snapshot)
+
+    movements = union_all(*parts).subquery()
+    return select(
+        movements.c.product_id, movements.c.location_id, func.sum(movements.c.quantity).label('quantity')
+    ).group_by(movements.c.product_id, movements.c.location_id)
+
+
+def stock_as_of(at, product_id=None, location_id=None):
+    """
+    Stock per product and location as of `at` (ledger rows dated before it)
+
+    Returns:
+        Dict mapping (product_id, location_id) to quantity (zero rows omitted)
+    """
+    base = _latest_snapshot_date(at)
+    stmt = _stock_as_of_select(at, base, product_id, location_id)
+    return {(r.product_id, r.location_id): r.quantity for r in db.session.execute(stmt) if r.quantity}
+
+
+def take_stock_snapshot(at, rebuild=False):
+    """
+    Store a snapshot of all stock as of `at` and commit
+
+    Built from the previous snapshot plus the ledger rows since then. Ledger
+    rows posted later with a document date before `at` are not reflected;
+    pass `rebuild` to recompute an existing snapshot.
+
+    Returns:
+        Number of product/location rows stored, or None if a snapshot for
+        `at` already exists and `rebuild` is False
+    """
+    exists = db.session.execute(
+        select(StockSnapshot.id).where(StockSnapshot.snapshot_date == at).limit(1)
+    ).first()
+    if exists and not rebuild:
+        return None
+    if exists:
+        db.session.execute(delete(StockSnapshot).where(StockSnapshot.snapshot_date == at))
+
+    as_of = _stock_as_of_select(at, _latest_snapshot_date(at, strict=True)).subquery()
+    rows = select(literal(at), as_of.c.product_id, as_of.c.location_id, as_of.c.quantity).where(as_of.c.quantity != 0)
+    result = db.session.execute(
+        insert(StockSnapshot).from_select(['snapshot_date', 'product_id', 'location_id', 'quantity'], rows)
+    )
+    db.session.commit()
+    return result.rowcount
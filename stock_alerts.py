@@ -0,0 +1,75 @@
+"""
+StockMaster Low-Stock Alert Evaluation
+"""
+
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app import db
+from models import LowStockAlertState
+from utils import notify_low_stock_products
+
+
+def evaluate_low_stock_alerts(levels):
+    """
+    Alert on products whose stock just crossed a user's low-stock threshold
+
+    Called by the stock posting engine with the new totals of the products a
+    posting changed, inside the posting's transaction (the product rows are
+    already locked, so concurrent postings of a product are evaluated one at
+    a time), and by the catalog upsert and product edit, which change
+    min_stock under the same row lock. Does nothing when LOW_STOCK_ALERTS is
+    off. A user is alerted once when the product's stock / min_stock
+    ratio falls below their low_stock_threshold. Further movements while it
+    stays low alert nobody, unless the ratio drops past another user's
+    threshold. The product re-arms when its stock rises above min_stock.
+
+    State is one low_stock_alert_states row per product that is currently
+    low and has been alerted on, holding the lowest ratio since it last
+    recovered. Nothing is committed here.
+
+    Args:
+        levels: Iterable of (product_id, on_hand_total, min_stock) after the posting
+
+    Returns:
+        Number of notifications created
+    """
+    if not current_app.config.get('LOW_STOCK_ALERTS', True):
+        return 0
+    levels = {product_id: (total, min_stock) for product_id, total, min_stock in levels}
+    if not levels:
+        return 0
+
+    states = dict(db.session.execute(
+        select(LowStockAlertState.product_id, LowStockAlertState.low_water_ratio)
+        .where(LowStockAlertState.product_id.in_(list(levels)))
+    ).all())
+
+    now = datetime.utcnow()
+    recovered = []
+    lowered = []
+    crossed = {}  # product_id -> previous low-water ratio (None: alerts armed)
+    for product_id, (total, min_stock) in sorted(levels.items()):
+        previous = states.get(product_id)
+        if not min_stock or min_stock <= 0 or total > min_stock:
+            if previous is not None:
+                recovered.append(product_id)
+            continue
+        ratio = max(total, 0.0) / min_stock
+        if previous is None or ratio < previous:
+            lowered.append({'product_id': product_id, 'low_water_ratio': ratio, 'updated_at': now})
+            crossed[product_id] = previous
+
+    if recovered:
+        db.session.execute(delete(LowStockAlertState).where(LowStockAlertState.product_id.in_(recovered)))
+    if lowered:
+        stmt = pg_insert(LowStockAlertState).values(lowered)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['product_id'],
+            set_={'low_water_ratio': stmt.excluded.low_water_ratio, 'updated_at': stmt.excluded.updated_at},
+        ))
+    if not crossed:
+        return 0
+    return notify_low_stock_products(list(crossed), previous_ratios=crossed, commit=False)
@@ -34,6 +34,19 @@ def warehouse_staff_or_manager(f):
     return decorated_function
 
 
+def fetch_page(query, page=1, per_page=50, max_per_page=200):
+    """
+    One page of `query` using LIMIT per_page + 1 instead of a COUNT(*)
+    
+    Returns:
+        (items, has_next)
+    """
+    page = max(1, page or 1)
+    per_page = max(1, min(per_page or 50, max_per_page))
+    rows = query.offset((page - 1) * per_page).limit(per_page + 1).all()
+    return rows[:per_page], len(rows) > per_page
+
+
 # ========== Notification Functions ==========
 
 def create_notification(user_id, title, message, notification_type='system', related_model=None, related_id=None, expires_in_days=30):
@@ -51,6 +64,8 @@ def create_notification(user_id, title, message, notification_type='system', rel
     """
     from app import db
     from models import Notification, NotificationPreference
+    from metrics import count_on_commit
+    import notification_counts  # registers the unread counter flush listener
     
     # Check user preferences
     prefs = NotificationPreference.query.filter_by(user_id=user_id).first()
@@ -80,22 +95,17 @@ def create_notification(user_id, title, message, notification_type='system', rel
     )
     
     db.session.add(notification)
+    count_on_commit(db.session, 'notifications', notification_type=notification_type)
     db.session.commit()
     
     return notification
 
 
 def get_user_unread_notifications_count(user_id):
-    """Get count of unread notifications for a user"""
-    from models import Notification
-    
-    count = Notification.query.filter(
-        Notification.user_id == user_id,
-        Notification.is_read == False,
-        (Notification.expires_at == None) | (Notification.expires_at > datetime.utcnow())
-    ).count()
+    """Get count of unread notifications for a user (maintained counter, see notification_counts.py)"""
+    from notification_counts import get_unread_count
     
-    return count
+    return get_unread_count(user_id)
 
 
 def get_user_notifications(user_id, limit=10, unread_only=False):
@@ -122,6 +132,58 @@ def get_user_notifications(user_id, limit=10, unread_only=False):
     return notifications
 
 
+def purge_expired_notifications(batch_size=1000, pause=0.0, max_batches=None):
+    """
+    Delete expired notifications in small batches
+    
+    Each batch deletes at most `batch_size` rows (FOR UPDATE SKIP LOCKED, so
+    rows another transaction holds are left for the next run) and commits,
+    keeping locks short and giving autovacuum a chance between batches. The
+    affected users' unread counters are recounted in the same transaction.
+    
+    Args:
+        batch_size: Rows deleted per transaction
+        pause: Seconds to sleep between batches
+        max_batches: Stop after this many batches (default: until none are left)
+    
+    Returns:
+        Number of notifications deleted
+    """
+    import time
+    from app import db
+    from models import Notification
+    from notification_counts import recompute_unread_counts
+    from sqlalchemy import delete, select
+    
+    cutoff = datetime.utcnow()
+    deleted = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        expired = (
+            select(Notification.id)
+            .where(Notification.expires_at != None, Notification.expires_at <= cutoff)
+            .order_by(Notification.expires_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        user_ids = db.session.execute(
+            delete(Notification).where(Notification.id.in_(expired.scalar_subquery()))
+            .returning(Notification.user_id)
+        ).scalars().all()
+        if not user_ids:
+            db.session.commit()
+            break
+        recompute_unread_counts(set(user_ids))  # commits the batch
+        deleted += len(user_ids)
+        batches += 1
+        if len(user_ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    
+    return deleted
+
+
 def notify_low_stock_alert(product):
     """
     Create a low stock alert notification for all users
@@ -129,23 +191,82 @@ def notify_low_stock_alert(product):
     Args:
         product: Product object
     """
-    from models import User, NotificationPreference
-    
-    # Get all users who should receive low stock alerts
-    users_query = User.query.all()
-    
-    for user in users_query:
-        prefs = NotificationPreference.query.filter_by(user_id=user.id).first()
-        
-        if prefs and prefs.enable_low_stock_alerts:
-            create_notification(
-                user_id=user.id,
-                title=f"Low Stock Alert: {product.name}",
-                message=f"Product '{product.name}' (SKU: {product.sku}) is running low on stock. Current stock: {product.total_stock}, Minimum: {product.min_stock}",
-                notification_type='low_stock',
-                related_model='product',
-                related_id=product.id
-            )
+    return notify_low_stock_products([product.id])
+
+
+def notify_low_stock_products(product_ids, expires_in_days=30, previous_ratios=None, commit=True):
+    """
+    Fan out low stock alerts for several products at once
+    
+    Recipients are found with one join of products against users'
+    notification_preferences: a user is notified about a product when they
+    have low stock alerts enabled and its stock is below min_stock times
+    their low_stock_threshold. All notifications are written with one
+    multi-row insert and one commit.
+    
+    Args:
+        product_ids: IDs of the products to check
+        expires_in_days: Days until the notifications expire
+        previous_ratios: Optional dict mapping product_id to the lowest
+            stock / min_stock ratio already alerted on (None: not yet);
+            users whose threshold is above it are skipped
+        commit: Commit the notifications (False leaves that to the caller)
+    
+    Returns:
+        Number of notifications created
+    """
+    from app import db
+    from models import Product, Notification, NotificationPreference
+    from sqlalchemy import Float, Integer, column, func, insert, select, values
+    
+    product_ids = list(set(product_ids))
+    if not product_ids:
+        return 0
+    
+    threshold = func.coalesce(NotificationPreference.low_stock_threshold, 0.3)
+    stmt = (
+        select(NotificationPreference.user_id, Product.id, Product.name, Product.sku,
+               Product.on_hand_total, Product.min_stock)
+        .join(Product, Product.id.in_(product_ids))
+        .where(NotificationPreference.enable_low_stock_alerts == True,
+               Product.min_stock > 0,
+               Product.on_hand_total < Product.min_stock * threshold)
+    )
+    if previous_ratios is not None:
+        previous = values(column('product_id', Integer), column('ratio', Float), name='previous').data(
+            [(product_id, ratio if ratio is not None else float('inf'))
+             for product_id, ratio in sorted(previous_ratios.items())]
+        )
+        stmt = stmt.join(previous, previous.c.product_id == Product.id).where(threshold <= previous.c.ratio)
+    recipients = db.session.execute(stmt).all()
+    if not recipients:
+        return 0
+    
+    from notification_counts import adjust_unread_counts
+    from metrics import count_on_commit
+    
+    now = datetime.utcnow()
+    expires_at = now + timedelta(days=expires_in_days) if expires_in_days else None
+    db.session.execute(insert(Notification), [{
+        'user_id': r.user_id,
+        'title': f"Low Stock Alert: {r.name}",
+        'message': f"Product '{r.name}' (SKU: {r.sku}) is running low on stock. Current stock: {r.on_hand_total}, Minimum: {r.min_stock}",
+        'notification_type': 'low_stock',
+        'is_read': False,
+        'related_model': 'product',
+        'related_id': r.id,
+        'created_at': now,
+        'expires_at': expires_at,
+    } for r in recipients])
+    deltas = {}
+    for r in recipients:
+        deltas[r.user_id] = deltas.get(r.user_id, 0) + 1
+    adjust_unread_counts(deltas)
+    count_on_commit(db.session, 'notifications', len(recipients), notification_type='low_stock')
+    if commit:
+        db.session.commit()
+    
+    return len(recipients)
 
 
 def notify_operation_completed(user_id, operation_type, reference, details=None):